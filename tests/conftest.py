@@ -0,0 +1,41 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import shutil
+import subprocess
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Probe, auto-tune and thumbnail caches of a test stay in its own folder
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('XDG_CACHE_HOME', str(path))
+    return path
+
+
+@pytest.fixture
+def make_sequence(tmp_path):
+    # A callable writing a PNG sequence numbered from 1 and returning its pattern
+    if shutil.which('ffmpeg') is None:
+        pytest.skip("needs ffmpeg")
+
+    def make(frames, size='96x64', name='shot'):
+        folder = tmp_path / f"{name}_frames"
+        folder.mkdir()
+        pattern = str(folder / f"{name}_%04d.png")
+        subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i',
+                        f"testsrc2=size={size}:rate=25", '-frames:v', str(frames), pattern],
+                       check=True)
+        return pattern
+
+    return make
+
+
+def count_frames(video_file):
+    result = subprocess.run(['ffmpeg', '-v', 'error', '-i', str(video_file), '-map', '0:v',
+                             '-c', 'copy', '-f', 'framecrc', '-'],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return sum(1 for line in result.stdout.splitlines() if not line.startswith('#'))
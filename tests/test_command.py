@@ -0,0 +1,156 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+import pytest
+
+from triada.command import (build_command, build_multi_command, build_remux_command,
+                            build_segment_command, make_spec, point_seconds, source_range)
+
+# Farm workers build their commands from the same spec as the desktop that
+# queued the job, so these must only change on purpose
+VIDEO_INFO = {'frame_count': 250, 'duration': 10.0, 'audio_stream_count': 1, 'is_rgb': False,
+              'video_codec': 'h264', 'pixel_format': 'yuv420p', 'profile': 'High',
+              'width': 1920, 'height': 1080, 'frame_rate': 25.0, 'start_number': None,
+              'start_time': 0.0, 'gaps': []}
+RGB_INFO = dict(VIDEO_INFO, is_rgb=True, video_codec='png', pixel_format='rgb24',
+                profile=None, audio_stream_count=0)
+SEQUENCE_INFO = {'frame_count': 100, 'duration': None, 'audio_stream_count': 0, 'is_rgb': True,
+                 'video_codec': None, 'pixel_format': None, 'profile': None, 'width': None,
+                 'height': None, 'frame_rate': None, 'start_number': 1001, 'start_time': 0.0,
+                 'gaps': []}
+
+X265_OUTPUT = ['-color_primaries', 'bt709', '-color_trc', 'bt709', '-colorspace', 'bt709',
+               '-crf', '16', '-g', '250', '-movflags', 'faststart', '-pix_fmt', 'yuv420p10',
+               '-preset', 'slow', '-vcodec', 'libx265', '-vtag', 'hvc1']
+AAC = ['-map', '0:a:0', '-ab', '320k', '-acodec', 'aac']
+
+
+def test_plain_video():
+    cmd = build_command(make_spec({'input': 'clip.mov'}), VIDEO_INFO, 'out.mp4', cores=4)
+    assert cmd == (['ffmpeg', '-threads', '4', '-i', 'clip.mov', '-map', '0:v'] + AAC +
+                   X265_OUTPUT + ['-x265-params', 'pools=4', '-y', 'out.mp4',
+                                  '-filter_complex_threads', '4'])
+
+
+def test_frame_rate_up_scales_before_duplicating_frames():
+    spec = make_spec({'input': 'clip.mov', 'codec': 'x264', 'convert_frame_rate': 50,
+                      'resize_width': 1280, 'resize_height': -1})
+    assert build_command(spec, VIDEO_INFO, 'out.mp4', cores=4) == [
+        'ffmpeg', '-threads', '4', '-i', 'clip.mov', '-filter_complex',
+        '[0:v]scale=1280:-1:sws_flags=lanczos:threads=4[s0];[s0]fps=fps=50:round=near[s1]',
+        '-map', '[s1]'] + AAC + [
+        '-color_primaries', 'bt709', '-color_trc', 'bt709', '-colorspace', 'bt709',
+        '-crf', '16', '-g', '250', '-movflags', 'faststart', '-pix_fmt', 'yuv420p',
+        '-preset', 'slow', '-threads', '4', '-vcodec', 'libx264', '-y', 'out.mp4',
+        '-filter_complex_threads', '4']
+
+
+def test_frame_rate_down_drops_frames_before_scaling():
+    spec = make_spec({'input': 'clip.mov', 'convert_frame_rate': 12, 'resize_width': -1,
+                      'resize_height': 540, 'resize_filter': 'bicubic'})
+    assert build_command(spec, VIDEO_INFO, 'out.mp4', cores=2) == [
+        'ffmpeg', '-threads', '2', '-i', 'clip.mov', '-filter_complex',
+        '[0:v]fps=fps=12:round=near[s0];[s0]scale=-1:540:sws_flags=bicubic:threads=2[s1]',
+        '-map', '[s1]'] + AAC + X265_OUTPUT + [
+        '-x265-params', 'pools=2', '-y', 'out.mp4', '-filter_complex_threads', '2']
+
+
+def test_rgb_source_is_converted_to_bt709():
+    spec = make_spec({'input': 'clip.mov', 'codec': 'ProRes', 'prores_profile': 'hq'})
+    assert build_command(spec, RGB_INFO, 'out.mov', cores=4) == [
+        'ffmpeg', '-threads', '4', '-i', 'clip.mov', '-filter_complex',
+        '[0:v]scale=in_color_matrix=bt601:out_color_matrix=bt709:threads=4[s0]',
+        '-map', '[s0]', '-color_primaries', 'bt709', '-color_trc', 'bt709',
+        '-colorspace', 'bt709', '-pix_fmt', 'yuv422p10', '-profile:v', '3', '-q:v', '16',
+        '-threads', '4', '-vcodec', 'prores_ks', '-vendor', 'ap10', '-y', 'out.mov',
+        '-filter_complex_threads', '4']
+
+
+def test_sequence_range_with_external_audio():
+    # Frames 1010 up to 1050 of a sequence starting at 1001, and the matching audio
+    spec = make_spec({'input': 'shot_%04d.png', 'frame_rate': 24, 'in_point': '1010',
+                      'out_point': '1050', 'audio': 'mix.wav'})
+    assert build_command(spec, SEQUENCE_INFO, 'out.mp4', cores=4) == [
+        'ffmpeg', '-f', 'image2', '-framerate', '24', '-start_number', '1010',
+        '-t', '1.666666', '-threads', '4', '-i', 'shot_%04d.png',
+        '-ss', '0.375000', '-t', '1.666667', '-i', 'mix.wav', '-filter_complex',
+        '[0:v]scale=in_color_matrix=bt601:out_color_matrix=bt709:threads=4[s0];'
+        '[1:a]atrim=duration=1.6666666666666665[s1]',
+        '-map', '[s0]', '-map', '[s1]', '-ab', '320k', '-acodec', 'aac'] + X265_OUTPUT + [
+        '-x265-params', 'pools=4', '-y', 'out.mp4', '-filter_complex_threads', '4']
+
+
+def test_renditions_share_one_decode():
+    spec = make_spec({'input': 'clip.mov', 'convert_frame_rate': 24,
+                      'renditions': [{'codec': 'x264', 'resize_height': 540, 'crf': 23,
+                                      'preset': 'fast'}]})
+    cmd = build_multi_command(spec, VIDEO_INFO, ['out.mp4', 'out_540.mp4'], cores=4)
+    assert cmd == [
+        'ffmpeg', '-threads', '4', '-i', 'clip.mov', '-filter_complex',
+        '[0:v]fps=fps=24:round=near[s0];[s0]split=2[s1][s2];'
+        '[s2]scale=-1:540:sws_flags=lanczos:threads=4[s3]',
+        '-map', '[s1]'] + AAC + X265_OUTPUT + ['-x265-params', 'pools=4', '-y', 'out.mp4',
+        '-map', '[s3]'] + AAC + [
+        '-color_primaries', 'bt709', '-color_trc', 'bt709', '-colorspace', 'bt709',
+        '-crf', '23', '-g', '250', '-movflags', 'faststart', '-pix_fmt', 'yuv420p',
+        '-preset', 'fast', '-threads', '4', '-vcodec', 'libx264', '-y', 'out_540.mp4',
+        '-filter_complex_threads', '4']
+
+
+def test_segment_is_video_only():
+    cmd = build_segment_command(make_spec({'input': 'clip.mov'}), VIDEO_INFO, 'seg.mp4',
+                                {'ss': '4.000000', 't': '2.000000'}, cores=4)
+    assert cmd == (['ffmpeg', '-ss', '4.000000', '-t', '2.000000', '-threads', '4',
+                    '-i', 'clip.mov', '-map', '0:v'] + X265_OUTPUT +
+                   ['-x265-params', 'pools=4', '-y', 'seg.mp4', '-filter_complex_threads', '4'])
+
+
+def test_remux_copies_the_video_stream():
+    spec = make_spec({'input': 'clip.mov', 'codec': 'x264', 'remux': True})
+    assert build_remux_command(spec, VIDEO_INFO, 'out.mp4') == [
+        'ffmpeg', '-i', 'clip.mov', '-map', '0:v:0'] + AAC + [
+        '-movflags', 'faststart', '-vcodec', 'copy', '-y', 'out.mp4']
+
+
+@pytest.mark.parametrize('value, frame_rate, first_frame, seconds', [
+    ('48', 24, 0, 2.0),
+    ('1010', 24, 1001, 0.375),
+    ('00:00:01:12', 24, 0, 1.5),
+    ('00:00:01:15', 29.97, 0, 1.5),  # timecode frames count at the rounded rate
+    ('01:02.5', None, 0, 62.5),
+    ('1:00:00', None, 0, 3600.0),
+    ('12.5s', None, 0, 12.5),
+    ('7', None, 0, None),
+])
+def test_point_seconds(value, frame_rate, first_frame, seconds):
+    if seconds is None:
+        with pytest.raises(ValueError, match='frame rate'):
+            point_seconds(value, frame_rate, first_frame)
+    else:
+        assert point_seconds(value, frame_rate, first_frame) == pytest.approx(seconds)
+
+
+def test_source_range_keeps_every_frame_the_range_touches():
+    spec = make_spec({'input': 'clip.mov', 'in_point': '2.01s', 'out_point': '4.02s'})
+    start, length = source_range(spec, VIDEO_INFO)
+    assert (start, start + length) == (pytest.approx(2.0), pytest.approx(4.04))
+
+
+def test_source_range_of_a_sequence_counts_from_its_first_frame():
+    spec = make_spec({'input': 'shot_%04d.png', 'frame_rate': 25, 'in_point': '1026'})
+    assert source_range(spec, SEQUENCE_INFO) == (pytest.approx(1.0), pytest.approx(3.0))
+
+
+def test_source_range_stops_at_the_end_of_the_source():
+    spec = make_spec({'input': 'clip.mov', 'out_point': '20s'})
+    assert source_range(spec, VIDEO_INFO) == (0.0, 10.0)
+
+
+@pytest.mark.parametrize('in_point, out_point, message', [
+    ('12s', None, 'past the end'),
+    ('5s', '4s', 'not after'),
+])
+def test_source_range_rejects_empty_ranges(in_point, out_point, message):
+    spec = make_spec({'input': 'clip.mov', 'in_point': in_point, 'out_point': out_point})
+    with pytest.raises(ValueError, match=message):
+        source_range(spec, VIDEO_INFO)
@@ -0,0 +1,170 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=redefined-outer-name
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from tests.conftest import count_frames
+from triada.command import make_spec
+from triada.farm import FarmScheduler, FarmWorker, WorkerLost, WorkerPool
+from triada.jobs import jobs_for_spec
+from triada.probe import probe_file_info
+from triada.scheduler import DONE
+from triada.worker import WorkerAgent, serve
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   'triada_ffmpeg.py')
+QUEUE_TIMEOUT = 120
+
+
+@pytest.fixture
+def agents():
+    # Starts worker agents on localhost, each answering on a port of its own
+    running = []
+
+    def start(token=None):
+        agent = WorkerAgent(token=token, log=lambda line: None)
+        server = serve(agent, '127.0.0.1', 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        running.append((agent, server))
+        return f"127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for agent, server in running:
+        agent.scheduler.stop()
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def worker_process(tmp_path):
+    # A worker agent in a process of its own, so it can be killed like a lost machine
+    processes = []
+
+    def start():
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [sys.executable, '-u', CLI, 'worker', '--bind', '127.0.0.1', '--port', '0',
+             '--quiet'], stdout=subprocess.PIPE, universal_newlines=True,
+            start_new_session=True)
+        processes.append(process)
+        # "Worker listening on 127.0.0.1:PORT with N cores, ..."
+        address = process.stdout.readline().split()[3]
+        return process, address
+
+    yield start
+    for process in processes:
+        kill_worker(process)
+
+
+def kill_worker(process):
+    # The agent and the ffmpeg it runs, as when the machine goes away
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+    process.stdout.close()
+
+
+def closed_port():
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        return listener.getsockname()[1]
+
+
+def encode_jobs(pattern, folder, count, **settings):
+    spec = make_spec({'input': pattern, 'frame_rate': 25, 'codec': 'x264',
+                      'preset': 'veryfast', 'audio_codec': None, **settings})
+    file_info = probe_file_info(pattern)
+    return [jobs_for_spec(spec, file_info, str(folder / f"out{index}.mp4"))[0]
+            for index in range(count)]
+
+
+def farm_scheduler(addresses, token=None):
+    lines = []
+    finished = threading.Event()
+    pool = WorkerPool([FarmWorker(address, token) for address in addresses], interval=0.2)
+    scheduler = FarmScheduler(pool, on_queue_finished=finished.set, log=lines.append)
+    return scheduler, finished, lines
+
+
+def run_queue(scheduler, finished, jobs):
+    for job in jobs:
+        scheduler.add(job)
+    scheduler.start()
+    assert finished.wait(QUEUE_TIMEOUT), "the queue did not finish"
+    scheduler.pool.stop()
+
+
+def test_jobs_are_placed_on_every_worker(agents, make_sequence, tmp_path):
+    addresses = [agents(), agents()]
+    jobs = encode_jobs(make_sequence(50), tmp_path, 4)
+    scheduler, finished, lines = farm_scheduler(addresses)
+    run_queue(scheduler, finished, jobs)
+
+    assert [job.state for job in jobs] == [DONE] * 4
+    for address in addresses:
+        assert any(line.startswith('Sending ') and line.endswith(f" to {address}")
+                   for line in lines)
+    for job in jobs:
+        assert count_frames(job.output_file) == 50
+
+
+def test_job_of_a_lost_worker_is_sent_again(agents, worker_process, make_sequence, tmp_path):
+    process, lost_address = worker_process()
+    address = agents()
+    # Slow enough for the worker to be killed mid-encode on any machine
+    job, = encode_jobs(make_sequence(300, '320x240'), tmp_path, 1, preset='slower', threads=1)
+    scheduler, finished, lines = farm_scheduler([lost_address, address])
+    progress = threading.Event()
+
+    def on_job_update(job):
+        if job.tracker.frame:
+            progress.set()
+
+    scheduler.on_job_update = on_job_update
+    scheduler.add(job)
+    scheduler.start()
+    assert progress.wait(QUEUE_TIMEOUT)
+    assert job.worker.address == lost_address
+    kill_worker(process)
+    assert finished.wait(QUEUE_TIMEOUT), "the queue did not finish"
+    scheduler.pool.stop()
+
+    assert job.state == DONE
+    assert job.attempts == 1
+    assert any(line.startswith(f"Lost {lost_address} running ") and 'sending it again' in line
+               for line in lines)
+    assert any(line.endswith(f" to {address}") for line in lines)
+    assert count_frames(job.output_file) == 300
+
+
+def test_worker_refuses_a_wrong_token(agents):
+    address = agents(token='secret')
+    assert FarmWorker(address, 'secret').refresh()
+    assert not FarmWorker(address, 'wrong').refresh()
+    assert not FarmWorker(address).refresh()
+    task = {'spec': make_spec({'input': 'clip.mov'}), 'file_info': {}, 'output_file': 'out.mp4'}
+    with pytest.raises(WorkerLost, match='refused the token'):
+        FarmWorker(address, 'wrong').submit(task)
+
+
+def test_jobs_run_here_without_a_reachable_worker(agents, make_sequence, tmp_path):
+    # One worker refuses this machine's token, the other is not running
+    addresses = [agents(token='secret'), f"127.0.0.1:{closed_port()}"]
+    jobs = encode_jobs(make_sequence(50), tmp_path, 2)
+    scheduler, finished, lines = farm_scheduler(addresses, token='wrong')
+    run_queue(scheduler, finished, jobs)
+
+    assert [job.state for job in jobs] == [DONE] * 2
+    assert [job.worker for job in jobs] == [None, None]
+    assert not any(line.startswith('Sending ') for line in lines)
+    for job in jobs:
+        assert count_frames(job.output_file) == 50
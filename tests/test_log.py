@@ -0,0 +1,43 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+from triada.log import JobLog, LogBuffer
+
+
+def test_log_buffer_joins_partial_writes():
+    buffer = LogBuffer()
+    buffer.write('first line\nsec')
+    buffer.write('ond line\n')
+    buffer.append('third line')
+    assert buffer.drain() == ['first line', 'second line', 'third line']
+    assert buffer.drain() == []
+    assert buffer.lines() == ['first line', 'second line', 'third line']
+
+
+def test_log_buffer_marks_lines_dropped_between_drains():
+    buffer = LogBuffer(capacity=3)
+    for number in range(5):
+        buffer.append(str(number))
+    assert buffer.drain() == ['[... 2 lines dropped ...]', '2', '3', '4']
+    assert buffer.lines() == ['2', '3', '4']
+
+
+def test_job_log_spills_to_its_file(tmp_path):
+    job_log = JobLog(str(tmp_path / 'logs' / 'job.log'), tail=2)
+    for line in ('one', 'two', 'three'):
+        job_log.write(line)
+    job_log.close()
+    assert list(job_log.tail) == ['two', 'three']
+    assert (tmp_path / 'logs' / 'job.log').read_text(encoding='utf-8') == 'one\ntwo\nthree\n'
+
+
+def test_job_log_keeps_the_tail_when_the_file_fails(tmp_path):
+    blocker = tmp_path / 'not_a_folder'
+    blocker.write_text('', encoding='utf-8')
+    job_log = JobLog(str(blocker / 'job.log'))
+    job_log.write('one')
+    job_log.write('two')
+    job_log.close()
+    assert isinstance(job_log.error, OSError)
+    assert job_log.tail[0] == 'one' and job_log.tail[-1] == 'two'
+    assert 'disabled' in job_log.tail[1]
@@ -0,0 +1,56 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+from triada.progress import ProgressParser, ProgressTracker
+
+BLOCK = """frame=120
+fps=48.00
+stream_0_0_q=28.0
+bitrate= 812.4kbits/s
+total_size=508256
+out_time_us=5000000
+out_time_ms=5000000
+out_time=00:00:05.000000
+dup_frames=0
+drop_frames=0
+speed=1.92x
+progress=continue
+"""
+
+
+def test_parser_returns_a_snapshot_per_block():
+    parser = ProgressParser()
+    snapshots = [parser.feed(line) for line in BLOCK.splitlines(keepends=True)]
+    assert snapshots[:-1] == [None] * (len(snapshots) - 1)
+    assert snapshots[-1] == {'frame': 120, 'fps': 48.0, 'speed': 1.92, 'out_time': 5.0,
+                             'bitrate': 812.4, 'total_size': 508256, 'end': False}
+
+
+def test_parser_reads_unknown_values_as_none():
+    parser = ProgressParser()
+    for line in ('frame=0', 'fps=0.00', 'bitrate=N/A', 'total_size=N/A',
+                 'out_time_us=-9223372036854775807', 'speed=N/A'):
+        assert parser.feed(line) is None
+    assert parser.feed('progress=end') == {'frame': 0, 'fps': 0.0, 'speed': None,
+                                           'out_time': None, 'bitrate': None,
+                                           'total_size': None, 'end': True}
+
+
+def test_parser_ignores_log_lines():
+    parser = ProgressParser()
+    assert parser.feed('[libx264 @ 0x55] frame I:1 Avg QP:20.00\n') is None
+    assert parser.feed('progress=continue')['frame'] is None
+
+
+def test_tracker_coalesces_updates():
+    now = [0.0]
+    tracker = ProgressTracker(duration=10.0, interval=0.25, clock=lambda: now[0])
+    assert tracker.update({'out_time': 1.0, 'speed': 2.0})
+    now[0] = 0.1
+    assert not tracker.update({'out_time': 1.2})
+    now[0] = 0.4
+    assert tracker.update({'out_time': 2.5})
+    assert tracker.fraction == 0.25
+    assert tracker.eta == 3.75
+    assert tracker.update({'out_time': 2.6, 'end': True})
+    assert tracker.fraction == 1.0
@@ -0,0 +1,29 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+import pytest
+
+from triada.segments import plan_frame_ranges, plan_segments
+
+
+@pytest.mark.parametrize('start_number, frame_count, count, step, ranges', [
+    # Ranges are whole keyframe intervals, so fewer ranges than asked for may come out
+    (1001, 100, 3, 25, [(1001, 50), (1051, 50)]),
+    (1, 10, 4, 1, [(1, 3), (4, 3), (7, 3), (10, 1)]),
+    (0, 260, 2, 50, [(0, 150), (150, 110)]),
+    (5, 3, 4, 25, [(5, 3)]),
+])
+def test_plan_frame_ranges(start_number, frame_count, count, step, ranges):
+    assert plan_frame_ranges(start_number, frame_count, count, step) == ranges
+
+
+def test_plan_frame_ranges_cover_every_frame_once():
+    ranges = plan_frame_ranges(1001, 1300, 6, 48)
+    frames = [frame for start, length in ranges for frame in range(start, start + length)]
+    assert frames == list(range(1001, 2301))
+    assert all(length % 48 == 0 for _, length in ranges[:-1])
+
+
+def test_plan_segments_split_on_the_nearest_keyframe():
+    assert plan_segments(60.0, 3, [0.0, 19.2, 21.0, 41.6]) == [
+        (0.0, 19.2), (19.2, pytest.approx(22.4)), (41.6, pytest.approx(18.4))]
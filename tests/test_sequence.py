@@ -0,0 +1,68 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import time
+
+from triada.sequence import SequenceIndexer
+
+
+def touch(folder, *names):
+    for name in names:
+        (folder / name).write_bytes(b'')
+
+
+def set_mtime(folder, seconds_ago):
+    # Listings are re-read when the directory's mtime changes, which coarse
+    # filesystem clocks may not show within a test, and while it is too recent
+    # to be trusted
+    mtime = time.time_ns() - seconds_ago * 10 ** 9
+    os.utime(folder, ns=(mtime, mtime))
+
+
+def test_index_finds_frames_and_gaps(tmp_path):
+    touch(tmp_path, *(f"shot_{frame:04d}.exr" for frame in (1001, 1002, 1003, 1006, 1007)),
+          'shot_0999.jpg', 'other_1001.exr', 'notes.txt')
+    index = SequenceIndexer().index(str(tmp_path / 'shot_%04d.exr'))
+    assert index.frames == [1001, 1002, 1003, 1006, 1007]
+    assert (index.first, index.last, index.count) == (1001, 1007, 5)
+    assert index.gaps == [(1004, 1005)]
+    assert index.contiguous_count() == 3
+    assert index.contiguous_count(1006) == 2
+
+
+def test_index_matches_the_pattern_width(tmp_path):
+    # %04d reads exactly four digits, or more without a leading zero
+    touch(tmp_path, 'f_0001.png', 'f_0002.png', 'f_001.png', 'f_00003.png', 'f_10000.png')
+    indexer = SequenceIndexer()
+    assert indexer.index(str(tmp_path / 'f_%04d.png')).frames == [1, 2, 10000]
+    assert indexer.index(str(tmp_path / 'f_%03d.png')).frames == [1, 10000]
+    assert indexer.index(str(tmp_path / 'f_%d.png')).frames == [10000]
+
+
+def test_index_follows_files_added_and_removed(tmp_path):
+    touch(tmp_path, *(f"a_{frame:04d}.png" for frame in range(1, 11)), 'b_001.png')
+    indexer = SequenceIndexer()
+    assert indexer.index(str(tmp_path / 'a_%04d.png')).count == 10
+    assert indexer.index(str(tmp_path / 'b_%03d.png')).frames == [1]
+
+    (tmp_path / 'a_0005.png').unlink()
+    touch(tmp_path, 'a_0011.png', 'b_002.png')
+    set_mtime(tmp_path, 10)
+    index = indexer.index(str(tmp_path / 'a_%04d.png'))
+    assert index.frames == [1, 2, 3, 4, 6, 7, 8, 9, 10, 11]
+    assert index.gaps == [(5, 5)]
+    assert indexer.index(str(tmp_path / 'b_%03d.png')).frames == [1, 2]
+
+
+def test_index_is_cached_until_the_directory_changes(tmp_path):
+    touch(tmp_path, 'a_0001.png')
+    set_mtime(tmp_path, 20)
+    indexer = SequenceIndexer()
+    assert indexer.index(str(tmp_path / 'a_%04d.png')).frames == [1]
+    mtime = os.stat(tmp_path).st_mtime_ns
+    touch(tmp_path, 'a_0002.png')
+    os.utime(tmp_path, ns=(mtime, mtime))
+    assert indexer.index(str(tmp_path / 'a_%04d.png')).frames == [1]
+    indexer.invalidate(str(tmp_path))
+    assert indexer.index(str(tmp_path / 'a_%04d.png')).frames == [1, 2]
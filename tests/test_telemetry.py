@@ -0,0 +1,34 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+from triada.telemetry import read_textfile
+
+TEXTFILE = r'''# HELP triada_jobs_total Finished ffmpeg runs by outcome
+# TYPE triada_jobs_total counter
+triada_jobs_total{codec="libx265",preset="slow",state="done"} 3
+triada_jobs_total{codec="libx265",preset="slow",state="failed"} 1
+# HELP triada_encode_wall_seconds_total Wall time of ffmpeg runs
+# TYPE triada_encode_wall_seconds_total counter
+triada_encode_wall_seconds_total{codec="prores_ks",preset="say \"hi\"\nback\\slash"} 12.5
+triada_up 1
+not a sample
+'''
+
+
+def test_read_textfile(tmp_path):
+    path = tmp_path / 'triada.prom'
+    path.write_text(TEXTFILE, encoding='utf-8')
+    assert read_textfile(str(path)) == {
+        'triada_jobs_total': {
+            (('codec', 'libx265'), ('preset', 'slow'), ('state', 'done')): 3,
+            (('codec', 'libx265'), ('preset', 'slow'), ('state', 'failed')): 1,
+        },
+        'triada_encode_wall_seconds_total': {
+            (('codec', 'prores_ks'), ('preset', 'say "hi"\nback\\slash')): 12.5,
+        },
+        'triada_up': {(): 1},
+    }
+
+
+def test_read_textfile_without_a_file(tmp_path):
+    assert read_textfile(str(tmp_path / 'missing.prom')) == {}
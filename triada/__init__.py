@@ -0,0 +1,3 @@
+# pylint: disable=missing-module-docstring
+
+VERSION = "0.4.2"
@@ -0,0 +1,247 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from triada.command import (CODECS, build_segment_command, filter_video, make_spec, open_input,
+                            pixel_format, source_range)
+from triada.lazy import lazy_import
+from triada.probe import default_cache_dir, source_identity
+from triada.scheduler import available_cores
+
+ffmpeg = lazy_import('ffmpeg')
+subprocess = lazy_import('subprocess')
+
+AUTO_TUNE_PRESETS = ('veryfast', 'fast', 'medium', 'slow', 'veryslow')
+AUTO_TUNE_CRF_STEPS = (-4, -2, 0, 2, 4)  # around the job's own CRF
+EXCERPT_COUNT = 3
+EXCERPT_LENGTH = 2.0  # seconds
+
+SSIM_PATTERN = re.compile(r'SSIM .*All:([\d.]+)')
+PSNR_PATTERN = re.compile(r'PSNR .*average:([\d.]+|inf)')
+
+
+def excerpt_input_args(spec, file_info, count=EXCERPT_COUNT, length=EXCERPT_LENGTH):
+    # Input arguments for short excerpts spread evenly over the source, so the
+    # measurements see its quiet and its busy parts
+    offset, duration = source_range(spec, file_info)
+    duration = duration or 0
+    if duration <= 0:
+        return []
+    length = min(length, duration / count)
+    starts = [offset + (index + 0.5) * duration / count - length / 2 for index in range(count)]
+    if '%' in spec['input']:
+        start_number = file_info.get('start_number') or 0
+        return [{'start_number': start_number + int(start * spec['frame_rate']),
+                 't': f"{length:.6f}"} for start in starts]
+    return [{'ss': f"{start:.6f}", 't': f"{length:.6f}"} for start in starts]
+
+
+def measurement_key(spec, file_info):
+    # Measurements hold for one source range at one output resolution and format
+    return json.dumps([source_identity(spec, file_info), spec['in_point'], spec['out_point'],
+                       spec['codec'], pixel_format(spec),
+                       spec['resize_width'], spec['resize_height'], spec['resize_filter'], spec['scaler'],
+                       spec['frame_rate'], spec['convert_frame_rate'], spec['tune_grain'],
+                       spec['keyframe_interval'], EXCERPT_COUNT, EXCERPT_LENGTH])
+
+
+class TuneCache:
+    # Measured speed and quality per candidate setting, kept in one JSON file
+    def __init__(self, path=None):
+        self.path = path if path is not None else os.path.join(default_cache_dir(),
+                                                               'autotune.json')
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as cache_file:
+                    self._entries = json.load(cache_file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, key):
+        with self._lock:
+            return dict(self._load().get(key, {}))
+
+    def put(self, key, candidate, measurement):
+        with self._lock:
+            self._load().setdefault(key, {})[candidate] = measurement
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as cache_file:
+                    json.dump(self._entries, cache_file)
+                os.replace(temp_path, self.path)
+            except OSError:
+                pass  # Only costs a new measurement next time
+
+
+_default_cache = None  # pylint: disable=invalid-name
+
+
+def default_tune_cache():
+    global _default_cache  # pylint: disable=global-statement,invalid-name
+    if _default_cache is None:
+        _default_cache = TuneCache()
+    return _default_cache
+
+
+def run_ffmpeg(cmd):
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {' '.join(cmd)}\n{result.stderr[-2000:]}")
+    return result.stderr
+
+
+def make_reference(spec, file_info, input_args, reference_file):
+    # The excerpt after the job's filters, stored losslessly in the output
+    # pixel format, which is what the encodes are compared against
+    source = open_input(spec, file_info, input_args)
+    video = filter_video(spec, file_info, source.video)
+    output = ffmpeg.output(video, reference_file, vcodec='ffv1', pix_fmt=pixel_format(spec),
+                           y=None)
+    run_ffmpeg(ffmpeg.compile(output))
+
+
+def measure_quality(encoded_file, reference_file):
+    # SSIM and PSNR of an encode against its reference with ffmpeg's metric filters.
+    # Frames are paired by index: the containers' time bases round differently.
+    stderr = run_ffmpeg(['ffmpeg', '-hide_banner', '-i', encoded_file, '-i', reference_file,
+                         '-filter_complex',
+                         '[0:v]settb=1,setpts=N,split[e0][e1];[1:v]settb=1,setpts=N,split[r0][r1];'
+                         '[e0][r0]ssim;[e1][r1]psnr',
+                         '-f', 'null', '-'])
+    ssim = SSIM_PATTERN.search(stderr)
+    psnr = PSNR_PATTERN.search(stderr)
+    if ssim is None or psnr is None:
+        raise RuntimeError(f"No SSIM/PSNR in the output of comparing '{encoded_file}'")
+    return float(ssim.group(1)), float(psnr.group(1))
+
+
+def measure_candidate(spec, file_info, excerpts, work_dir, cores=None):
+    # Encodes every excerpt with the candidate's settings the way the job would,
+    # on the cores the job gets next to the others in the queue
+    elapsed = 0.0
+    size = 0
+    ssim_total = psnr_total = 0.0
+    ext = '.mov' if CODECS[spec['codec']] == "prores_ks" else '.mp4'
+    for index, (input_args, reference_file) in enumerate(excerpts):
+        encoded_file = os.path.join(work_dir, f"excerpt{index}{ext}")
+        cmd = build_segment_command(spec, file_info, encoded_file, input_args,
+                                    cores=cores or available_cores())
+        start = time.monotonic()
+        run_ffmpeg(cmd)
+        elapsed += time.monotonic() - start
+        size += os.path.getsize(encoded_file)
+        ssim, psnr = measure_quality(encoded_file, reference_file)
+        ssim_total += ssim
+        psnr_total += psnr
+        os.remove(encoded_file)
+    duration = sum(float(input_args['t']) for input_args, _ in excerpts)
+    return {
+        'speed': round(duration / elapsed, 3),
+        'ssim': round(ssim_total / len(excerpts), 5),
+        'psnr': round(psnr_total / len(excerpts), 2),
+        'kbps': round(size * 8 / duration / 1000, 1),
+    }
+
+
+def candidate_specs(spec):
+    for preset in AUTO_TUNE_PRESETS:
+        for step in AUTO_TUNE_CRF_STEPS:
+            crf = spec['crf'] + step
+            if 1 <= crf <= 51:
+                yield make_spec(spec, preset=preset, crf=crf)
+
+
+def missing_candidates(spec, measurements):
+    return [candidate for candidate in candidate_specs(spec)
+            if f"{candidate['preset']}:{candidate['crf']}" not in measurements]
+
+
+def measure_all(spec, file_info, cache=None, log=print, cores=None):
+    # Measurements for every candidate, sampling only the ones not cached yet
+    cache = cache if cache is not None else default_tune_cache()
+    key = measurement_key(spec, file_info)
+    measurements = cache.get(key)
+    missing = missing_candidates(spec, measurements)
+    if not missing:
+        return measurements
+
+    log(f"Auto-tune: sampling {len(missing)} settings on '{spec['input']}'")
+    work_dir = tempfile.mkdtemp(prefix='triada_autotune_')
+    try:
+        excerpts = []
+        for index, input_args in enumerate(excerpt_input_args(spec, file_info)):
+            reference_file = os.path.join(work_dir, f"reference{index}.mkv")
+            make_reference(spec, file_info, input_args, reference_file)
+            excerpts.append((input_args, reference_file))
+        if not excerpts:
+            return measurements
+        for candidate in missing:
+            name = f"{candidate['preset']}:{candidate['crf']}"
+            measurements[name] = measure_candidate(candidate, file_info, excerpts, work_dir,
+                                                   cores)
+            cache.put(key, name, measurements[name])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return measurements
+
+
+def choose(measurements, mode, min_ssim, min_speed):
+    # quality: the fastest setting that meets the SSIM floor
+    # speed: the best quality that still encodes at least min_speed x realtime
+    if not measurements:
+        return None
+    if mode == 'quality':
+        passing = [name for name, m in measurements.items() if m['ssim'] >= min_ssim]
+        if passing:
+            return max(passing, key=lambda name: measurements[name]['speed'])
+        return max(measurements, key=lambda name: measurements[name]['ssim'])
+    passing = [name for name, m in measurements.items() if m['speed'] >= min_speed]
+    if passing:
+        return max(passing, key=lambda name: (measurements[name]['ssim'],
+                                              measurements[name]['speed']))
+    return max(measurements, key=lambda name: measurements[name]['speed'])
+
+
+def needs_sampling(spec, file_info, cache=None):
+    # Whether tuning spec has to encode excerpts first, rather than pick from
+    # measurements cached by earlier runs
+    if not spec['auto_tune'] or CODECS[spec['codec']] == "prores_ks":
+        return False
+    cache = cache if cache is not None else default_tune_cache()
+    return bool(missing_candidates(spec, cache.get(measurement_key(spec, file_info))))
+
+
+def tune_spec(spec, file_info, cache=None, log=print, cores=None):
+    # The spec with the preset and CRF auto-tune picked, or unchanged if it can't.
+    # cores: what each sample encode gets, the share the job will run with.
+    if not spec['auto_tune'] or CODECS[spec['codec']] == "prores_ks":
+        return spec
+    try:
+        measurements = measure_all(spec, file_info, cache, log, cores)
+    except (OSError, RuntimeError) as error:
+        log(f"Auto-tune failed, keeping {spec['preset']} CRF {spec['crf']}: {error}")
+        return spec
+
+    name = choose(measurements, spec['auto_tune'], spec['min_ssim'], spec['min_speed'])
+    if name is None:
+        return spec
+    preset, crf = name.split(':')
+    chosen = measurements[name]
+    log(f"Auto-tune: {preset} CRF {crf} for '{spec['input']}' "
+        f"(SSIM {chosen['ssim']:.4f}, PSNR {chosen['psnr']:.1f} dB, {chosen['speed']:.2f}x realtime)")
+    return make_spec(spec, preset=preset, crf=int(crf))
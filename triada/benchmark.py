@@ -0,0 +1,274 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from triada.command import (CODECS, PIXEL_FORMATS, PRESETS, PRORES_PROFILES, encoder, make_spec,
+                            output_path)
+from triada.jobs import jobs_for_spec
+from triada.lazy import lazy_import
+from triada.scheduler import (DONE, JobScheduler, available_cores, max_concurrent_jobs,
+                              wait_with_usage)
+
+statistics = lazy_import('statistics')
+
+SOURCE_RATE = 25
+# (lavfi source, frame size, pixel format) of the synthetic clips the matrix runs on
+SOURCES = (
+    ('testsrc2', '1280x720', 'yuv420p'),
+    ('testsrc2', '1920x1080', 'yuv420p10le'),
+    ('mandelbrot', '1920x1080', 'yuv420p'),
+)
+# Results that differ from the baseline by more than this fraction are reported
+TOLERANCE = 0.1
+# Seconds from launch until the window is first painted, median over the runs
+STARTUP_BUDGET = 1.0
+# Run in a fresh interpreter per launch; prints the phases as JSON on first paint
+STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+import sys
+import json
+import triada.gui
+imported = time.perf_counter()
+from PyQt5.QtCore import QEvent, QObject
+from PyQt5.QtWidgets import QApplication
+
+
+class FirstPaint(QObject):
+    def eventFilter(self, watched, event):  # pylint: disable=invalid-name
+        if event.type() == QEvent.Paint:
+            print(json.dumps({'import': imported - start, 'window': built - imported,
+                              'paint': time.perf_counter() - built}), flush=True)
+            app.quit()
+        return False
+
+
+app = QApplication(sys.argv)
+window = triada.gui.FFmpegGUI()
+built = time.perf_counter()
+first_paint = FirstPaint()
+window.installEventFilter(first_paint)
+window.show()
+app.exec_()
+'''
+
+
+def source_name(pattern, size, pix_fmt):
+    return f"{pattern}_{size}_{pix_fmt}"
+
+
+def make_source(path, pattern='testsrc2', size='1920x1080', duration=10, pix_fmt='yuv420p',
+                ffmpeg_bin='ffmpeg'):
+    # Deterministic synthetic clip, stored losslessly so decoding it is cheap
+    # next to the encodes being measured
+    if not os.path.exists(path):
+        subprocess.run([ffmpeg_bin, '-v', 'error', '-f', 'lavfi',
+                        '-i', f"{pattern}=size={size}:rate={SOURCE_RATE}",
+                        '-t', str(duration), '-pix_fmt', pix_fmt, '-c:v', 'ffv1', '-y', path], check=True)
+    return {
+        'frame_count': duration * SOURCE_RATE,
+        'duration': float(duration),
+        'audio_stream_count': 0,
+        'is_rgb': False,
+        'video_codec': 'ffv1',
+        'start_number': None,
+        'gaps': [],
+    }
+
+
+def run_timed(jobs, max_jobs=0):
+    # Wall time to run the jobs through the scheduler, with ffmpeg's output dropped
+    finished = threading.Event()
+    scheduler = JobScheduler(max_jobs=max_jobs, on_queue_finished=finished.set,
+                             log=lambda line: None)
+    for job in jobs:
+        scheduler.add(job)
+    start = time.monotonic()
+    scheduler.start()
+    finished.wait()
+    elapsed = time.monotonic() - start
+    failed = [job.name for job in jobs if job.state != DONE]
+    if failed:
+        raise RuntimeError(f"Benchmark encodes failed: {', '.join(failed)}")
+    return elapsed
+
+
+def run_measured(cmd):
+    # Wall time, CPU time of ffmpeg and its peak resident memory in KiB
+    start = time.monotonic()
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,  # pylint: disable=consider-using-with
+                               stderr=subprocess.PIPE)
+    stderr = process.stderr.read()
+    _, cpu_seconds, peak_rss = wait_with_usage(process)
+    elapsed = time.monotonic() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark encode failed: {' '.join(cmd)}\n"
+                           f"{stderr.decode(errors='replace')[-2000:]}")
+    return elapsed, cpu_seconds, peak_rss
+
+
+def matrix_specs(codecs=None, presets=None, pixel_formats=None, prores_profiles=None):
+    # Every codec/preset/pixel format combination the GUI offers, or a subset
+    for codec in codecs or CODECS:
+        codec = make_spec(codec=codec)['codec']
+        if CODECS[codec] == "prores_ks":
+            for profile in prores_profiles or PRORES_PROFILES:
+                yield make_spec(codec=codec, prores_profile=profile)
+            continue
+        for preset in presets or PRESETS:
+            for pix_fmt in pixel_formats or PIXEL_FORMATS:
+                yield make_spec(codec=codec, preset=preset, pixel_format=pix_fmt)
+
+
+def result_key(result):
+    return (result['source'], result['codec'], result['preset'], result['pixel_format'],
+            result['prores_profile'])
+
+
+def bench_matrix(work_dir, specs, sources=SOURCES, duration=5, log=print):
+    # Runs the exact commands the app builds for each spec on each synthetic source
+    specs = list(specs)
+    results = []
+    for pattern, size, pix_fmt in sources:
+        name = source_name(pattern, size, pix_fmt)
+        source = os.path.join(work_dir, f"{name}_{duration}s.mkv")
+        file_info = make_source(source, pattern, size, duration, pix_fmt)
+        for spec in specs:
+            spec = make_spec(spec, input=source, output_folder=work_dir)
+            job = jobs_for_spec(spec, file_info, output_path(spec, name))[0]
+            cmd = job.rebuild(available_cores()) if job.rebuild is not None else job.cmd
+            elapsed, cpu_seconds, peak_rss = run_measured(cmd)
+            is_prores = CODECS[spec['codec']] == "prores_ks"
+            result = {
+                'source': name,
+                'codec': spec['codec'],
+                'preset': None if is_prores else spec['preset'],
+                'pixel_format': None if is_prores else spec['pixel_format'],
+                'prores_profile': spec['prores_profile'] if is_prores else None,
+                'frames': file_info['frame_count'],
+                'seconds': round(elapsed, 3),
+                'fps': round(file_info['frame_count'] / elapsed, 2),
+                'cpu_seconds': round(cpu_seconds, 3) if cpu_seconds is not None else None,
+                'peak_rss_kb': peak_rss,
+                'size': os.path.getsize(job.output_file),
+                'command': ' '.join(cmd[1:]).replace(work_dir, '.'),
+            }
+            os.remove(job.output_file)
+            log(format_result(result))
+            results.append(result)
+    return results
+
+
+def format_result(result):
+    setting = result['prores_profile'] or f"{result['preset']} {result['pixel_format']}"
+    cpu = f"{result['cpu_seconds']:.1f}" if result['cpu_seconds'] is not None else '-'
+    return (f"{result['source']:<30} {result['codec']:<7} {setting:<20} "
+            f"{result['fps']:8.1f} fps  cpu {cpu:>6} s  rss {result['peak_rss_kb'] or 0:>8} KiB  "
+            f"{result['size']:>10} B")
+
+
+def ffmpeg_version(ffmpeg_bin='ffmpeg'):
+    try:
+        output = subprocess.run([ffmpeg_bin, '-version'], stdout=subprocess.PIPE,
+                                universal_newlines=True, check=False).stdout
+    except OSError:
+        return None
+    return output.splitlines()[0] if output else None
+
+
+def save_results(path, results):
+    report = {'ffmpeg': ffmpeg_version(), 'cores': available_cores(), 'results': results}
+    with open(path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as report_file:
+        return json.load(report_file)['results']
+
+
+def compare_results(results, baseline, tolerance=TOLERANCE):
+    # Differences against a baseline run worth a look: slower encodes, more CPU
+    # or memory, bigger files, and commands the builder now writes differently
+    baseline = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None:
+            continue
+        name = ' '.join(str(part) for part in result_key(result) if part is not None)
+        if result['fps'] < previous['fps'] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['fps']:.1f} -> {result['fps']:.1f} fps")
+        for key in ('cpu_seconds', 'peak_rss_kb', 'size'):
+            if result.get(key) and previous.get(key) and \
+                    result[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {previous[key]} -> {result[key]}")
+        if previous.get('command') and result['command'] != previous['command']:
+            regressions.append(f"{name}: command changed\n  was: {previous['command']}\n"
+                               f"  now: {result['command']}")
+    return regressions
+
+
+def bench_threads(work_dir, codec='x264', preset='medium', job_count=0, size='1920x1080',
+                  duration=10, pattern='testsrc2', pix_fmt='yuv420p'):
+    # Runs the same batch of concurrent encodes with ffmpeg's default threading
+    # and with automatic threads, and reports the aggregate throughput of each
+    source = os.path.join(work_dir, f"{source_name(pattern, size, pix_fmt)}_{duration}s.mkv")
+    file_info = make_source(source, pattern, size, duration, pix_fmt)
+    if not job_count:
+        # Enough jobs to fill every slot the scheduler runs at once
+        spec = make_spec(codec=codec, preset=preset)
+        job_count = max(2, max_concurrent_jobs(encoder(spec), spec['preset']))
+
+    results = []
+    for threads in ('default', 'auto'):
+        jobs = []
+        for index in range(job_count):
+            spec = make_spec(input=source, codec=codec, preset=preset, threads=threads,
+                             output_folder=work_dir)
+            base_name = f"threads_{threads}_{index}"
+            jobs.extend(jobs_for_spec(spec, file_info, output_path(spec, base_name)))
+        elapsed = run_timed(jobs, max_jobs=job_count)
+        frames = file_info['frame_count'] * job_count
+        results.append({'threads': threads, 'jobs': job_count, 'cores': available_cores(),
+                        'seconds': round(elapsed, 3), 'fps': round(frames / elapsed, 2)})
+        for job in jobs:
+            os.remove(job.output_file)
+    return results
+
+
+def bench_startup(runs=5, python=sys.executable):
+    # Cold start of the GUI: triada.gui import, window construction and first
+    # paint as measured inside the process, plus the launch to first paint wall
+    # time seen from outside, which includes interpreter startup
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [root, os.environ.get('PYTHONPATH')])))
+    samples = []
+    for _ in range(runs):
+        start = time.monotonic()
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [python, '-c', STARTUP_SCRIPT], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, env=env, universal_newlines=True)
+        line = process.stdout.readline()
+        launch = time.monotonic() - start
+        _, stderr = process.communicate()
+        if not line:
+            raise RuntimeError(f"The GUI exited without painting (exit code "
+                               f"{process.returncode})\n{stderr[-2000:]}")
+        sample = json.loads(line)
+        sample['first_paint'] = launch
+        samples.append(sample)
+    return {phase: round(statistics.median(sample[phase] for sample in samples), 4)
+            for phase in ('import', 'window', 'paint', 'first_paint')}
+
+
+def default_work_dir():
+    return os.path.join(tempfile.gettempdir(), 'triada_ffmpeg', 'benchmark')
@@ -0,0 +1,663 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=import-outside-toplevel
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from triada import VERSION
+from triada.autotune import needs_sampling
+# Only what the parser shows as defaults is imported here; each subcommand
+# imports the rest when it runs, so an encode doesn't pay for the farm server,
+# the benchmarks or TOML
+from triada.benchmark import SOURCES, STARTUP_BUDGET, TOLERANCE, default_work_dir
+from triada.command import (AUDIO_CODECS, CODECS, DEFAULT_SPEC, IO_CLASSES, PIXEL_FORMATS,
+                            PRESETS, PRIORITIES, PRORES_PROFILES, RENDITION_KEYS, RESIZE_FILTERS,
+                            make_spec, output_path, parse_input, remux_check)
+from triada.farm import DEFAULT_PORT, FARM_ENV, HEARTBEAT_INTERVAL, TOKEN_ENV, worker_pool
+from triada.filters import SCALERS, plan_filters
+from triada.jobs import jobs_for_spec
+from triada.log import JobLog, job_log_path
+from triada.probe import ProbeService, get_file_info
+from triada.sequence import gap_warning
+from triada.progress import format_status
+from triada.scheduler import FAILED, RUNNING, JobScheduler
+from triada.telemetry import METRICS_TEXTFILE_ENV, TELEMETRY_ENV, default_telemetry
+from triada.thumbnails import THUMBNAIL_COUNT, THUMBNAIL_WIDTH
+from triada.watch import POLL_INTERVAL, SETTLE_TIME
+
+# Short names for rendition keys, as the flags call them
+RENDITION_ALIASES = {'width': 'resize_width', 'height': 'resize_height',
+                     'pix_fmt': 'pixel_format'}
+
+
+def positive_float(text):
+    try:
+        value = float(text)
+    except ValueError:
+        value = 0
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"invalid value {text!r}, expected a number above 0")
+    return value
+
+
+def parse_rendition(text):
+    # 'codec=x264,height=540,crf=23' -> {'codec': 'x264', 'resize_height': 540, 'crf': 23}
+    rendition = {}
+    for item in text.split(','):
+        key, separator, value = item.partition('=')
+        key = key.strip().replace('-', '_')
+        key = RENDITION_ALIASES.get(key, key)
+        if not separator or key not in RENDITION_KEYS:
+            raise argparse.ArgumentTypeError(
+                f"invalid rendition item {item!r}, expected KEY=VALUE with KEY one of "
+                f"{', '.join(sorted(set(RENDITION_KEYS) | set(RENDITION_ALIASES)))}")
+        value = value.strip()
+        default = DEFAULT_SPEC[key]
+        if isinstance(default, bool):
+            value = value.lower() in ('1', 'true', 'yes', 'on')
+        elif isinstance(default, int):
+            try:
+                value = int(value)
+            except ValueError as error:
+                raise argparse.ArgumentTypeError(f"{key} needs a number, not {value!r}") from error
+        elif key == 'audio_codec' and value.lower() == 'none':
+            value = None
+        rendition[key] = value
+    return rendition
+
+
+SPEC_OPTIONS = (
+    # (flag, spec key, argparse keyword arguments)
+    ('--audio', 'audio', {'metavar': 'FILE', 'help': "external audio source"}),
+    ('--output', 'output', {'metavar': 'NAME', 'help': "output file name"}),
+    ('--output-folder', 'output_folder', {'metavar': 'DIR'}),
+    ('--frame-rate', 'frame_rate', {'type': positive_float, 'help': "image sequence frame rate"}),
+    ('--width', 'resize_width', {'type': int}),
+    ('--height', 'resize_height', {'type': int}),
+    ('--resize-filter', 'resize_filter', {'choices': RESIZE_FILTERS}),
+    ('--scaler', 'scaler', {'choices': SCALERS,
+                            'help': "library for resizing and colour conversion"}),
+    ('--convert-frame-rate', 'convert_frame_rate', {'type': float}),
+    ('--in', 'in_point', {'metavar': 'POINT',
+                          'help': "first frame to encode: a frame number, seconds ('12.5s'), "
+                                  "a time ('01:02.5') or a timecode ('00:01:02:12')"}),
+    ('--out', 'out_point', {'metavar': 'POINT',
+                            'help': "frame after the last one to encode, as for --in"}),
+    ('--codec', 'codec', {'type': str.lower, 'choices': [c.lower() for c in CODECS]}),
+    ('--pix-fmt', 'pixel_format', {'choices': PIXEL_FORMATS}),
+    ('--prores-profile', 'prores_profile', {'choices': PRORES_PROFILES}),
+    ('--crf', 'crf', {'type': int}),
+    ('--preset', 'preset', {'choices': PRESETS}),
+    ('--keyframe-interval', 'keyframe_interval', {'type': int}),
+    ('--tune-grain', 'tune_grain', {'action': 'store_true'}),
+    ('--audio-codec', 'audio_codec', {'choices': [str(c).lower() for c in AUDIO_CODECS]}),
+    ('--audio-bitrate', 'audio_bitrate', {'type': int, 'metavar': 'KBPS'}),
+    ('--audio-copy', 'audio_copy', {'action': 'store_true'}),
+    ('--remux', 'remux', {'action': 'store_true',
+                          'help': "copy the source video instead of re-encoding it when it "
+                                  "already matches the target, to swap audio or rewrap"}),
+    ('--no-remux', 'remux', {'action': 'store_false', 'help': "re-encode (the default)"}),
+    ('--chunked', 'chunked', {'action': 'store_true',
+                              'help': "encode in parallel segments and join them"}),
+    ('--segments', 'segment_count', {'type': int, 'metavar': 'N',
+                                     'help': "number of segments for --chunked"}),
+    ('--resumable', 'resumable', {'action': 'store_true',
+                                  'help': "encode in checkpointed segments; running the same "
+                                          "job again resumes after a stop or crash"}),
+    ('--rendition', 'renditions', {'type': parse_rendition, 'action': 'append',
+                                   'metavar': 'KEY=VALUE,...',
+                                   'help': "also write this variant of the output from the same "
+                                           "decode, e.g. codec=x264,height=540,crf=23; may be "
+                                           "repeated"}),
+    ('--threads', 'threads', {'metavar': 'N|auto|default',
+                              'help': "encoder and decoder threads per job (default: auto, "
+                                      "sharing the cores among running jobs)"}),
+    ('--auto-tune', 'auto_tune', {'choices': ('quality', 'speed'),
+                                  'help': "pick preset and CRF from sampled excerpts: the "
+                                          "fastest reaching --min-ssim, or the best quality "
+                                          "encoding at --min-speed"}),
+    ('--min-ssim', 'min_ssim', {'type': float, 'help': "quality floor for --auto-tune quality"}),
+    ('--min-speed', 'min_speed', {'type': float, 'metavar': 'X',
+                                  'help': "realtime factor for --auto-tune speed"}),
+    ('--filter-threads', 'filter_threads', {'type': int, 'metavar': 'N',
+                                            'help': "filter graph and scaler threads "
+                                                    "(default: as --threads)"}),
+    ('--prefetch', 'prefetch', {'type': int, 'metavar': 'FRAMES',
+                                'help': "read this many image sequence frames ahead of the "
+                                        "encoder, for sequences on network storage"}),
+    ('--prefetch-memory', 'prefetch_memory', {'type': int, 'metavar': 'MIB',
+                                              'help': "most data --prefetch holds ahead of "
+                                                      "the encoder (default: 512)"}),
+    ('--stage', 'stage', {'action': 'store_true',
+                          'help': "encode to local scratch space and copy the finished output "
+                                  "to network storage in one go"}),
+    ('--scratch', 'scratch_dir', {'metavar': 'DIR',
+                                  'help': "scratch space for --stage (default: scratch/ next "
+                                          "to the probe cache)"}),
+    ('--scratch-budget', 'scratch_budget', {'type': float, 'metavar': 'GIB',
+                                            'help': "most staged output at once; jobs beyond it "
+                                                    "write to their destination (default: 50)"}),
+    ('--priority', 'priority', {'choices': PRIORITIES,
+                                'help': "low and background lower the encoder's CPU and I/O "
+                                        "priority; background only uses otherwise idle CPU time "
+                                        "(default: normal)"}),
+    ('--nice', 'nice', {'type': int, 'metavar': 'N',
+                        'help': "nice level of the encoder, -20 to 19 (default: from --priority)"}),
+    ('--io-class', 'io_class', {'choices': IO_CLASSES[1:],
+                                'help': "Linux I/O scheduling class of the encoder (default: "
+                                        "from --priority)"}),
+    ('--cpus', 'cpus', {'metavar': 'LIST|auto',
+                        'help': "pin the encoder to these CPUs, e.g. 0-7,16-23, or auto to give "
+                                "each running job CPUs of its own"}),
+    ('--numa-node', 'numa_node', {'type': int, 'metavar': 'N',
+                                  'help': "keep the encoder on the CPUs of this NUMA node"}),
+)
+
+
+def add_spec_options(subparser):
+    spec_group = subparser.add_argument_group(
+        'job settings', "override the settings of every job")
+    for flag, key, kwargs in SPEC_OPTIONS:
+        spec_group.add_argument(flag, dest=key, default=argparse.SUPPRESS, **kwargs)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='triada_ffmpeg',
+        description="Headless encoder using the same command builder as the GUI.")
+    parser.add_argument('--version', action='version', version=f"%(prog)s {VERSION}")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    encode_parser = subparsers.add_parser('encode', help="encode files given on the command line")
+    encode_parser.add_argument('inputs', nargs='+', metavar='INPUT')
+
+    batch_parser = subparsers.add_parser('batch', help="encode jobs from JSON/TOML job specs")
+    batch_parser.add_argument('specs', nargs='+', metavar='SPEC')
+
+    watch_parser = subparsers.add_parser(
+        'watch', help="encode new files and image sequences dropped into folders")
+    watch_parser.add_argument('folders', nargs='+', metavar='DIR[=TEMPLATE]',
+                              help="folder to watch, optionally with a JSON/TOML job spec "
+                                   "used for every input found in it")
+    watch_parser.add_argument('--settle', type=float, default=SETTLE_TIME, metavar='SECONDS',
+                              help="how long an input has to stay unchanged before it is "
+                                   f"queued (default: {SETTLE_TIME:g})")
+    watch_parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL,
+                              metavar='SECONDS')
+    watch_parser.add_argument('--polling', action='store_true',
+                              help="poll the folders even where inotify is available")
+    watch_parser.add_argument('--no-recursive', action='store_true',
+                              help="ignore subfolders")
+
+    for subparser in (encode_parser, batch_parser):
+        subparser.add_argument('--skip-existing', action='store_true',
+                               help="skip jobs whose output file already exists")
+        subparser.add_argument('--restart', action='store_true',
+                               help="discard the finished segments of interrupted resumable "
+                                    "encodes instead of resuming them")
+        subparser.add_argument('--dry-run', action='store_true',
+                               help="print the ffmpeg commands without running them")
+
+    for subparser in (encode_parser, batch_parser, watch_parser):
+        add_spec_options(subparser)
+        subparser.add_argument('-j', '--jobs', type=int, default=0,
+                               help="maximum parallel encodes (default: auto)")
+        subparser.add_argument('--show-filters', action='store_true',
+                               help="print the planned video filter chain of each job")
+        subparser.add_argument('-q', '--quiet', action='store_true',
+                               help="do not echo ffmpeg output")
+        subparser.add_argument('--no-probe-cache', action='store_true',
+                               help="always run ffprobe instead of using cached results")
+        subparser.add_argument('--log-dir', metavar='DIR',
+                               help="write a log file per job to this folder")
+        subparser.add_argument('--telemetry', metavar='JSONL',
+                               help="append a record of timings, CPU time and peak memory per "
+                                    f"job to this file (default: ${TELEMETRY_ENV})")
+        subparser.add_argument('--metrics-textfile', metavar='PROM',
+                               help="keep totals per codec and preset in this Prometheus "
+                                    f"textfile (default: ${METRICS_TEXTFILE_ENV})")
+        subparser.add_argument('--farm', action='append', metavar='HOST:PORT',
+                               help="run encodes and segments on this worker agent, may be "
+                                    f"repeated (default: ${FARM_ENV}, comma separated)")
+        subparser.add_argument('--farm-token', metavar='TOKEN',
+                               help=f"token the workers expect (default: ${TOKEN_ENV})")
+
+    worker_parser = subparsers.add_parser(
+        'worker', help="run jobs sent by other machines' --farm, with this machine's cores")
+    worker_parser.add_argument('--bind', default='127.0.0.1', metavar='ADDRESS',
+                               help="address to listen on; 0.0.0.0 for every interface "
+                                    "(default: 127.0.0.1)")
+    worker_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                               help=f"(default: {DEFAULT_PORT})")
+    worker_parser.add_argument('--token', metavar='TOKEN',
+                               help="only accept requests carrying this token "
+                                    f"(default: ${TOKEN_ENV})")
+    worker_parser.add_argument('-j', '--jobs', type=int, default=0,
+                               help="maximum parallel encodes (default: auto)")
+    worker_parser.add_argument('-q', '--quiet', action='store_true',
+                               help="do not print jobs as they come and go")
+    worker_parser.add_argument('--log-dir', metavar='DIR',
+                               help="write a log file per job to this folder")
+    worker_parser.add_argument('--telemetry', metavar='JSONL',
+                               help=f"append a record per job to this file (default: "
+                                    f"${TELEMETRY_ENV})")
+    worker_parser.add_argument('--metrics-textfile', metavar='PROM',
+                               help=f"(default: ${METRICS_TEXTFILE_ENV})")
+
+    thumbnails_parser = subparsers.add_parser(
+        'thumbnails', help="make keyframe thumbnails of an input, or a contact sheet")
+    thumbnails_parser.add_argument('input', metavar='INPUT')
+    thumbnails_parser.add_argument('-n', '--count', type=int, default=THUMBNAIL_COUNT)
+    thumbnails_parser.add_argument('--width', type=int, default=THUMBNAIL_WIDTH)
+    thumbnails_parser.add_argument('-o', '--output', metavar='JPEG',
+                                   help="tile the thumbnails into this contact sheet instead "
+                                        "of printing their cached paths")
+    thumbnails_parser.add_argument('--columns', type=int, default=4)
+
+    bench_parser = subparsers.add_parser('bench', help="measure encode throughput")
+    bench_parser.add_argument('suite', choices=('matrix', 'threads', 'startup'),
+                              help="matrix: every codec/preset/pixel format on synthetic "
+                                   "sources; threads: concurrent encodes with ffmpeg's default "
+                                   "threading against automatic threads; startup: time from "
+                                   "launching the GUI to its first paint")
+    bench_parser.add_argument('--codec', type=str.lower, action='append',
+                              choices=[c.lower() for c in CODECS],
+                              help="codecs to run, may be repeated (default: all; x264 for threads)")
+    bench_parser.add_argument('--preset', action='append', choices=PRESETS,
+                              help="presets to run, may be repeated (default: all; medium for "
+                                   "threads)")
+    bench_parser.add_argument('--pix-fmt', action='append', choices=PIXEL_FORMATS)
+    bench_parser.add_argument('--prores-profile', action='append', choices=PRORES_PROFILES)
+    bench_parser.add_argument('--source', action='append', metavar='LAVFI:SIZE:PIX_FMT',
+                              help="synthetic source, e.g. mandelbrot:3840x2160:yuv420p "
+                                   f"(default: {', '.join(':'.join(s) for s in SOURCES)})")
+    bench_parser.add_argument('--duration', type=int, default=5, help="source length in seconds")
+    bench_parser.add_argument('-j', '--jobs', type=int, default=0,
+                              help="concurrent encodes for threads (default: as many as the "
+                                   "scheduler runs)")
+    bench_parser.add_argument('--work-dir', metavar='DIR', default=default_work_dir())
+    bench_parser.add_argument('-o', '--output', metavar='JSON', help="save the results")
+    bench_parser.add_argument('--baseline', metavar='JSON',
+                              help="compare with saved results, exit 1 on regressions")
+    bench_parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                              help="relative difference to the baseline that counts as a "
+                                   f"regression (default: {TOLERANCE})")
+    bench_parser.add_argument('--runs', type=int, default=5,
+                              help="launches to take the median of for startup (default: 5)")
+    bench_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET,
+                              help="seconds to first paint above which startup exits 1 "
+                                   f"(default: {STARTUP_BUDGET})")
+    return parser
+
+
+def load_spec_file(path):
+    if path.lower().endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError(f"{path}: reading TOML needs Python 3.11+ "
+                                 "or the tomli package") from None
+        with open(path, 'rb') as spec_file:
+            data = tomllib.load(spec_file)
+    else:
+        with open(path, 'r', encoding='utf-8') as spec_file:
+            data = json.load(spec_file)
+
+    # A spec file holds a single job, a list of jobs, or {defaults, jobs}
+    if isinstance(data, list):
+        return [dict(job) for job in data]
+    if 'jobs' in data:
+        defaults = data.get('defaults', {})
+        return [{**defaults, **job} for job in data['jobs']]
+    return [data]
+
+
+def spec_overrides(args):
+    overrides = {key: getattr(args, key) for _, key, _ in SPEC_OPTIONS if hasattr(args, key)}
+    if overrides.get('audio_codec') == 'none':
+        overrides['audio_codec'] = None
+    return overrides
+
+
+def plan_jobs(raw_specs, overrides, skip_existing=False, probe_cache=True, show_filters=False,
+              restart=False, capacity=None, tune=True):
+    # capacity: optional callable(spec) -> cores to split chunked encodes over;
+    # tune: False to never sample sources for auto-tune, e.g. for a dry run
+    planned = []
+    for raw_spec in raw_specs:
+        spec = make_spec(raw_spec, **overrides)
+        if not spec['input']:
+            raise ValueError("Job spec without an input")
+
+        video_file, base_name, _ = parse_input(spec['input'])
+        spec['input'] = video_file
+        output_file = output_path(spec, base_name)
+        # Auto-tuned names are only known once the settings are picked
+        if skip_existing and not spec['auto_tune'] and os.path.exists(output_file):
+            print(f"Skipping existing {output_file}")
+            continue
+        planned.append((spec, output_file))
+
+    # Probe all inputs concurrently rather than one ffprobe after another
+    probe_service = ProbeService(cache=probe_cache)
+    try:
+        file_infos = probe_service.probe_all([spec['input'] for spec, _ in planned])
+    finally:
+        probe_service.shutdown()
+
+    jobs = []
+    for (spec, output_file), file_info in zip(planned, file_infos):
+        video_file = spec['input']
+        if gap_warning(video_file, file_info):
+            print(gap_warning(video_file, file_info))
+        can_copy, reason = remux_check(spec, file_info)
+        if can_copy:
+            print(f"{video_file}: {reason}")
+        elif show_filters:
+            print(f"{video_file}: video filters")
+            for line in plan_filters(spec, file_info).describe():
+                print(f"  {line}")
+        # Planning keeps only the segments that match the job as it is now;
+        # nothing is discarded or written until its jobs start
+        spec_jobs = jobs_for_spec(spec, file_info, output_file,
+                                  capacity(spec) if capacity is not None else None, restart, tune)
+        if spec['auto_tune'] and not can_copy and needs_sampling(spec, file_info):
+            print(f"{video_file}: auto-tune samples the source once the queue gets to it"
+                  if tune else f"{video_file}: not sampled for auto-tune in a dry run, "
+                  "showing the settings as given")
+        if skip_existing and spec['auto_tune'] and os.path.exists(spec_jobs[-1].output_file):
+            print(f"Skipping existing {spec_jobs[-1].output_file}")
+            continue
+        jobs.extend(spec_jobs)
+    return jobs
+
+
+def connect_farm(pool):
+    if pool is not None:
+        pool.refresh()
+        for worker in pool.workers:
+            if worker.status is None:
+                print(f"Worker {worker.address} is not reachable")
+            else:
+                print(f"Worker {worker.address}: {worker.status['host']}, "
+                      f"{worker.status['cores']} cores")
+        if not pool.reachable():
+            print("No worker is reachable, encoding here until one is")
+    return pool
+
+
+def make_scheduler(pool=None, **kwargs):
+    if pool is None:
+        return JobScheduler(**kwargs)
+    from triada.farm import FarmScheduler
+    return FarmScheduler(pool, **kwargs)
+
+
+def open_logs(jobs, log_dir=None):
+    if log_dir:
+        for job in jobs:
+            job.log = JobLog(job_log_path(log_dir, job))
+
+
+def run_jobs(jobs, max_jobs=0, quiet=False, telemetry=None, pool=None, log_dir=None):
+    finished = threading.Event()
+
+    def on_job_update(job):
+        # ffmpeg's own stats are in the log unless it is silenced
+        if quiet and job.state == RUNNING:
+            print(f"{job.name}: {format_status(job.tracker)}")
+
+    def on_job_finished(job):
+        print(f"{job.action} {job.state}: {job.output_file}")
+
+    scheduler = make_scheduler(pool, max_jobs=max_jobs,
+                               on_job_update=on_job_update,
+                               on_job_finished=on_job_finished,
+                               on_queue_finished=finished.set,
+                               on_jobs_added=lambda jobs: open_logs(jobs, log_dir),
+                               log=(lambda line: None) if quiet else print,
+                               telemetry=telemetry)
+    open_logs(jobs, log_dir)
+    for job in jobs:
+        scheduler.add(job)
+    scheduler.start()
+    try:
+        finished.wait()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        finished.wait()
+        return 130
+
+    # Including the jobs auto-tune queued
+    return 1 if any(job.state == FAILED for job in scheduler.jobs) else 0
+
+
+def watch_folder(argument, recursive=True):
+    from triada.watch import WatchFolder
+    path, _, template_file = argument.partition('=')
+    if not os.path.isdir(path):
+        raise ValueError(f"'{path}' is not a folder")
+    template = {}
+    if template_file:
+        templates = load_spec_file(template_file)
+        if len(templates) != 1:
+            raise ValueError(f"{template_file}: a watch template holds a single job spec")
+        template = templates[0]
+    return WatchFolder(path, template, recursive)
+
+
+def run_watch(args):
+    from triada.watch import FolderWatcher
+    overrides = spec_overrides(args)
+    try:
+        pool = worker_pool(args.farm, args.farm_token)
+        folders = [watch_folder(argument, not args.no_recursive) for argument in args.folders]
+        # Encodes must not land where they would be picked up as new inputs
+        output_folders = set()
+        for folder in folders:
+            output_folder = os.path.abspath(make_spec(folder.template, **overrides)['output_folder']
+                                            or os.getcwd())
+            for watched in folders:
+                if os.path.commonpath([watched.path, output_folder]) == output_folder:
+                    raise ValueError(f"The output folder '{output_folder}' would be watched "
+                                     f"too, use a subfolder or another folder")
+            output_folders.add(output_folder)
+    except (OSError, ValueError) as error:
+        print(f"triada_ffmpeg: {error}", file=sys.stderr)
+        return 2
+
+    def is_output(source):
+        source = os.path.abspath(source)
+        return any(os.path.commonpath([folder, source]) == folder for folder in output_folders)
+
+    def on_job_finished(job):
+        print(f"{job.action} {job.state}: {job.output_file}")
+
+    def on_terminate(*_):
+        raise KeyboardInterrupt
+
+    scheduler = make_scheduler(connect_farm(pool), max_jobs=args.jobs,
+                               on_job_finished=on_job_finished,
+                               on_jobs_added=lambda jobs: open_logs(jobs, args.log_dir),
+                               log=(lambda line: None) if args.quiet else print,
+                               telemetry=default_telemetry(args.telemetry, args.metrics_textfile))
+    watcher = FolderWatcher(folders, args.settle, args.poll_interval,
+                            use_inotify=not args.polling, ignore=is_output)
+    print(f"Watching {', '.join(folder.path for folder in folders)} ({watcher.mode}), "
+          f"Ctrl+C to stop")
+    signal.signal(signal.SIGTERM, on_terminate)
+    try:
+        while True:
+            for source, folder in watcher.poll():
+                try:
+                    # Inputs that already have an output, e.g. after a restart, are skipped
+                    jobs = plan_jobs([{**folder.template, 'input': source}], overrides,
+                                     skip_existing=True, probe_cache=not args.no_probe_cache,
+                                     show_filters=args.show_filters,
+                                     capacity=scheduler.capacity)
+                except (OSError, ValueError) as error:
+                    print(f"triada_ffmpeg: {source}: {error}", file=sys.stderr)
+                    continue
+                open_logs(jobs, args.log_dir)
+                for job in jobs:
+                    scheduler.add(job)
+                if jobs:
+                    print(f"Queued {source}")
+                    scheduler.clear_finished()  # the daemon may run for weeks
+                    scheduler.start()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        while any(job.state == RUNNING for job in scheduler.jobs):
+            time.sleep(0.1)
+    finally:
+        watcher.close()
+    return 0
+
+
+def run_thumbnails(args):
+    from triada.thumbnails import contact_sheet, thumbnail_strip
+    video_file, _, _ = parse_input(args.input)
+    try:
+        thumbnails = thumbnail_strip(video_file, get_file_info(video_file), args.count,
+                                     args.width)
+        if not thumbnails:
+            raise ValueError(f"No thumbnails could be made of '{video_file}'")
+        if args.output:
+            print(contact_sheet(thumbnails, args.output, args.columns))
+        else:
+            for thumbnail in thumbnails:
+                print(thumbnail)
+    except (OSError, ValueError, subprocess.CalledProcessError) as error:
+        print(f"triada_ffmpeg: {error}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def run_bench(args):
+    from triada.benchmark import (bench_matrix, bench_startup, bench_threads, compare_results,
+                                  load_results, matrix_specs, save_results)
+    os.makedirs(args.work_dir, exist_ok=True)
+    try:
+        sources = [tuple(source.split(':')) for source in args.source or []] or SOURCES
+        if any(len(source) != 3 for source in sources):
+            raise ValueError("--source takes LAVFI:SIZE:PIX_FMT")
+        if args.baseline and args.suite != 'matrix':
+            raise ValueError("--baseline only applies to the matrix suite")
+
+        if args.suite == 'startup':
+            if args.runs < 1:
+                raise ValueError("--runs must be at least 1")
+            results = bench_startup(args.runs)
+            print(f"import {results['import']:.3f} s, window {results['window']:.3f} s, "
+                  f"paint {results['paint']:.3f} s; first paint {results['first_paint']:.3f} s "
+                  f"after launch (budget {args.budget:.3f} s)")
+        elif args.suite == 'threads':
+            pattern, size, pix_fmt = sources[0]
+            results = bench_threads(args.work_dir, (args.codec or ['x264'])[0],
+                                    (args.preset or ['medium'])[0], args.jobs, size,
+                                    args.duration, pattern, pix_fmt)
+            for result in results:
+                print(f"threads={result['threads']:<8} {result['jobs']} jobs on "
+                      f"{result['cores']} cores: {result['seconds']:.1f} s, "
+                      f"{result['fps']:.1f} fps aggregate")
+        else:
+            specs = matrix_specs(args.codec, args.preset, args.pix_fmt, args.prores_profile)
+            results = bench_matrix(args.work_dir, specs, sources, args.duration)
+
+        if args.output:
+            save_results(args.output, results)
+        regressions = []
+        if args.baseline:
+            regressions = compare_results(results, load_results(args.baseline), args.tolerance)
+        if args.suite == 'startup' and results['first_paint'] > args.budget:
+            regressions.append(f"first paint after {results['first_paint']:.3f} s, "
+                               f"over the {args.budget:.3f} s budget")
+    except (OSError, ValueError, RuntimeError, subprocess.CalledProcessError) as error:
+        print(f"triada_ffmpeg: {error}", file=sys.stderr)
+        return 2
+
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+def run_worker(args):
+    from triada.worker import WorkerAgent, serve
+    token = args.token or os.environ.get(TOKEN_ENV)
+    if args.bind not in ('127.0.0.1', '::1', 'localhost') and not token:
+        print(f"triada_ffmpeg: warning: anyone reaching {args.bind}:{args.port} can encode "
+              "files this user can read and write; set --token", file=sys.stderr)
+    agent = WorkerAgent(args.jobs, token, args.log_dir,
+                        default_telemetry(args.telemetry, args.metrics_textfile),
+                        log=(lambda line: None) if args.quiet else print)
+    try:
+        server = serve(agent, args.bind, args.port)
+    except OSError as error:
+        print(f"triada_ffmpeg: {args.bind}:{args.port}: {error}", file=sys.stderr)
+        return 2
+    print(f"Worker listening on {args.bind}:{server.server_address[1]} with "
+          f"{agent.scheduler.total_cores} cores, Ctrl+C to stop")
+
+    def on_terminate(*_):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, on_terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        # The running ffmpegs quit before the worker does, so none keeps writing
+        # an output a dispatcher has since sent to another worker
+        agent.scheduler.stop()
+        while any(job.state == RUNNING for job in agent.scheduler.pending()):
+            time.sleep(0.1)
+        time.sleep(HEARTBEAT_INTERVAL)  # Lets the dispatchers read how the jobs ended
+    finally:
+        server.server_close()
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'bench':
+        return run_bench(args)
+    if args.command == 'worker':
+        return run_worker(args)
+    if args.command == 'watch':
+        return run_watch(args)
+    if args.command == 'thumbnails':
+        return run_thumbnails(args)
+
+    try:
+        if args.command == 'encode':
+            raw_specs = [{'input': video_file} for video_file in args.inputs]
+        else:
+            raw_specs = [job for path in args.specs for job in load_spec_file(path)]
+        pool = connect_farm(worker_pool(args.farm, args.farm_token))
+        jobs = plan_jobs(raw_specs, spec_overrides(args), args.skip_existing,
+                         probe_cache=not args.no_probe_cache, show_filters=args.show_filters,
+                         restart=args.restart, capacity=pool.capacity if pool else None,
+                         tune=not args.dry_run)
+    except (OSError, ValueError) as error:
+        print(f"triada_ffmpeg: {error}", file=sys.stderr)
+        return 2
+
+    if args.dry_run:
+        for job in jobs:
+            print(" ".join(job.cmd))
+        return 0
+
+    if not jobs:
+        return 0
+
+    return run_jobs(jobs, args.jobs, args.quiet,
+                    default_telemetry(args.telemetry, args.metrics_textfile), pool, args.log_dir)
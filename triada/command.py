@@ -0,0 +1,695 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import math
+import os
+import re
+
+from triada.filters import SCALERS, FilterPlan, plan_filters
+from triada.lazy import lazy_import
+
+ffmpeg = lazy_import('ffmpeg')
+
+CODECS = {
+    "x264": "libx264",
+    "x265": "libx265",
+    "ProRes": "prores_ks"
+}
+PIXEL_FORMATS = ('yuv420p', 'yuv420p10', 'yuv422p10')
+PRORES_PROFILES = ('proxy', 'lt', 'standart', 'hq', '4444', '4444hq')
+PRESETS = ('veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+RESIZE_FILTERS = ('bicubic', 'lanczos', 'spline')
+AUDIO_CODECS = (None, 'aac', 'pcm_s16le', 'pcm_s24le')
+AUTO_TUNE_MODES = (None, 'quality', 'speed')
+PRIORITIES = ('normal', 'low', 'background')
+IO_CLASSES = (None, 'realtime', 'best-effort', 'idle')
+# ffprobe's names for what each encoder produces
+PROBED_CODECS = {'libx264': 'h264', 'libx265': 'hevc', 'prores_ks': 'prores'}
+PROBED_PRORES_PROFILES = ('Proxy', 'LT', 'Standard', 'HQ', '4444', '4444 XQ')
+
+# Everything needed to build an encode, independent of any widgets
+DEFAULT_SPEC = {
+    'input': None,
+    'audio': None,
+    'output': None,
+    'output_folder': None,
+    'frame_rate': 30,
+    'resize_width': 0,
+    'resize_height': 0,
+    'resize_filter': 'lanczos',
+    'scaler': 'swscale',  # or 'zscale' where ffmpeg has it
+    'convert_frame_rate': 0,
+    'codec': 'x265',
+    'pixel_format': None,  # None picks the codec default
+    'prores_profile': 'standart',
+    'crf': 16,
+    'preset': 'slow',
+    'keyframe_interval': 250,
+    'tune_grain': False,
+    'audio_codec': 'aac',
+    'audio_bitrate': 320,
+    'audio_copy': False,
+    # Copy the video stream when the source already matches the target, for
+    # swapping audio or rewrapping; off, as the copy ignores CRF, preset,
+    # keyframe interval and colour tags
+    'remux': False,
+    'chunked': False,  # encode in parallel segments and join them
+    'segment_count': 0,  # 0 picks a count from the available cores
+    'resumable': False,  # encode in checkpointed segments that survive a stop or crash
+    'threads': 0,  # 0 shares the cores among running jobs, None keeps ffmpeg's defaults
+    'filter_threads': 0,  # 0 follows threads
+    # Image sequence frames to read ahead of the encoder, for network storage; 0 is off
+    'prefetch': 0,
+    'prefetch_memory': 512,  # MiB the read-ahead may hold
+    # Encode to local scratch space and copy the finished output over, when it
+    # goes to network storage
+    'stage': False,
+    'scratch_dir': None,  # None is scratch/ next to the probe cache
+    'scratch_budget': 50,  # GiB of staged files at once
+    # How the encoder is scheduled: 'low' and 'background' lower its CPU and I/O
+    # priority, nice and io_class override the priority's levels
+    'priority': 'normal',
+    'nice': None,
+    'io_class': None,
+    # CPUs to pin the encoder to: None, 'auto' for CPUs of its own picked by the
+    # scheduler, or a list such as '0-7,16-23'; numa_node keeps them on one node
+    'cpus': None,
+    'numa_node': None,
+    # Part of the source to encode: a frame number, seconds ('12.5s'), a time
+    # ('01:02.5') or a timecode ('00:01:02:12'); the out point is not included
+    'in_point': None,
+    'out_point': None,
+    # Further outputs from the same decode, each a dict of RENDITION_KEYS
+    # overriding this job's settings, e.g. {'codec': 'x264', 'resize_height': 540}
+    'renditions': [],
+    # Pick preset and CRF by sampling the input: 'quality' is the fastest setting
+    # reaching min_ssim, 'speed' the best quality encoding at min_speed x realtime
+    'auto_tune': None,
+    'min_ssim': 0.98,
+    'min_speed': 1.0,
+}
+
+SEQUENCE_PATTERN = re.compile(r'^(.*?)(?:(\d+)|%(\d+)d)\.(png|jpg|jpeg|tiff)$', re.IGNORECASE)
+FRAME_POINT = re.compile(r'^\d+$')
+SECONDS_POINT = re.compile(r'^(\d+(?:\.\d*)?)s?$')
+TIMECODE_POINT = re.compile(r'^(\d+):(\d\d):(\d\d)[:;](\d\d)$')
+CLOCK_POINT = re.compile(r'^(?:(\d+):)?(\d+):(\d\d(?:\.\d*)?)$')
+RANGE_POINT_PATTERNS = (FRAME_POINT, SECONDS_POINT, TIMECODE_POINT, CLOCK_POINT)
+# What a rendition may change; the input, range, frame rate and audio source are shared
+RENDITION_KEYS = ('codec', 'pixel_format', 'prores_profile', 'crf', 'preset',
+                  'keyframe_interval', 'tune_grain', 'resize_width', 'resize_height',
+                  'resize_filter', 'scaler', 'audio_codec', 'audio_bitrate', 'output')
+
+
+def _choice(name, value, choices):
+    for choice in choices:
+        if choice == value or (isinstance(value, str) and isinstance(choice, str)
+                               and choice.lower() == value.lower()):
+            return choice
+    raise ValueError(f"Invalid {name} {value!r}, expected one of "
+                     f"{', '.join(str(choice) for choice in choices)}")
+
+
+def _range_point(name, value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        value = f"{value}s"
+    value = str(value).strip()
+    if not any(pattern.match(value) for pattern in RANGE_POINT_PATTERNS):
+        raise ValueError(f"Invalid {name} {value!r}, expected a frame number, seconds "
+                         "('12.5s'), a time ('01:02.5') or a timecode ('00:01:02:12')")
+    return value
+
+
+def _renditions(value, spec):
+    renditions = [dict(rendition) for rendition in value or []]
+    for rendition in renditions:
+        unknown = set(rendition) - set(RENDITION_KEYS)
+        if unknown:
+            raise ValueError(f"Renditions cannot change {', '.join(sorted(unknown))}")
+        make_spec(spec, **_rendition_overrides(rendition))  # checks the values
+    return renditions
+
+
+def _rendition_overrides(rendition):
+    overrides = {'renditions': [], 'output': None}
+    if 'codec' in rendition:
+        # A different codec brings its own default pixel format
+        overrides['pixel_format'] = None
+    overrides.update(rendition)
+    return overrides
+
+
+def _thread_count(name, value):
+    if value is None or value == 'default':
+        return None
+    if value == 'auto':
+        return 0
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = -1
+    if count < 0:
+        raise ValueError(f"Invalid {name} {value!r}, expected a thread count, 'auto' or 'default'")
+    return count
+
+
+def _frame_rate(value):
+    # Frames per second above 0; whole rates stay ints, so they print as '25'
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        rate = 0
+    if not rate > 0 or rate == float('inf'):
+        raise ValueError(f"Invalid frame rate {value!r}, expected frames per second above 0")
+    return int(rate) if rate.is_integer() else rate
+
+
+def _cpu_list(value):
+    if value in (None, '', 'auto'):
+        return value or None
+    if not isinstance(value, str):
+        value = ','.join(str(cpu) for cpu in value)
+    value = value.replace(' ', '')
+    if not re.fullmatch(r'\d+(-\d+)?(,\d+(-\d+)?)*', value):
+        raise ValueError(f"Invalid CPU list {value!r}, expected 'auto' or e.g. '0-7,16-23'")
+    return value
+
+
+def make_spec(spec=None, **overrides):
+    merged = dict(DEFAULT_SPEC)
+    merged.update(spec or {})
+    merged.update(overrides)
+
+    unknown = set(merged) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError(f"Unknown job spec keys: {', '.join(sorted(unknown))}")
+
+    merged['codec'] = _choice('codec', merged['codec'], CODECS)
+    if merged['pixel_format'] is None:
+        merged['pixel_format'] = 'yuv420p' if merged['codec'] == 'x264' else 'yuv420p10'
+    merged['pixel_format'] = _choice('pixel format', merged['pixel_format'], PIXEL_FORMATS)
+    merged['prores_profile'] = _choice('ProRes profile', merged['prores_profile'],
+                                       PRORES_PROFILES)
+    merged['preset'] = _choice('preset', merged['preset'], PRESETS)
+    merged['resize_filter'] = _choice('resize filter', merged['resize_filter'], RESIZE_FILTERS)
+    merged['scaler'] = _choice('scaler', merged['scaler'], SCALERS)
+    if merged['audio_codec'] in ('', 'none', 'None'):
+        merged['audio_codec'] = None
+    merged['audio_codec'] = _choice('audio codec', merged['audio_codec'], AUDIO_CODECS)
+    if merged['auto_tune'] in ('', 'off', 'none', 'None'):
+        merged['auto_tune'] = None
+    merged['auto_tune'] = _choice('auto-tune mode', merged['auto_tune'], AUTO_TUNE_MODES)
+    merged['frame_rate'] = _frame_rate(merged['frame_rate'])
+    merged['threads'] = _thread_count('threads', merged['threads'])
+    merged['filter_threads'] = _thread_count('filter threads', merged['filter_threads']) or 0
+    if merged['prefetch'] < 0 or merged['prefetch_memory'] <= 0:
+        raise ValueError("Read-ahead needs a frame count of 0 or more and a memory cap above 0")
+    if merged['scratch_budget'] <= 0:
+        raise ValueError(f"Invalid scratch budget {merged['scratch_budget']!r}, expected GiB above 0")
+    merged['priority'] = _choice('priority', merged['priority'], PRIORITIES)
+    merged['io_class'] = _choice('I/O class', merged['io_class'], IO_CLASSES)
+    if merged['nice'] is not None and not -20 <= int(merged['nice']) <= 19:
+        raise ValueError(f"Invalid nice level {merged['nice']!r}, expected -20 to 19")
+    if merged['numa_node'] is not None and int(merged['numa_node']) < 0:
+        raise ValueError(f"Invalid NUMA node {merged['numa_node']!r}")
+    merged['cpus'] = _cpu_list(merged['cpus'])
+    merged['in_point'] = _range_point('in point', merged['in_point'])
+    merged['out_point'] = _range_point('out point', merged['out_point'])
+    merged['renditions'] = _renditions(merged['renditions'], merged)
+    return merged
+
+
+def rendition_specs(spec):
+    # The job's own settings, then each rendition on top of them
+    return [spec] + [make_spec(spec, **_rendition_overrides(rendition))
+                     for rendition in spec['renditions']]
+
+
+def rendition_outputs(output_file, spec):
+    # Output files in rendition_specs order. Generated names follow each
+    # rendition's settings the way the job's own name does, or are derived from
+    # the job's chosen name; names chosen for a rendition go beside the job's output.
+    directory, name = os.path.split(output_file)
+    outputs = [output_file]
+    for rendition, rendition_spec in zip(spec['renditions'], rendition_specs(spec)[1:]):
+        if rendition.get('output'):
+            path = os.path.join(directory, rendition['output'])
+        else:
+            path = retarget_output(output_file, spec, rendition_spec)
+            if path == output_file:
+                path = os.path.join(directory, output_file_name(rendition_spec,
+                                                                os.path.splitext(name)[0]))
+        if path in outputs:
+            raise ValueError(f"Two renditions would write '{path}', give one an output name")
+        outputs.append(path)
+    return outputs
+
+
+def parse_input(video_file):
+    # Returns the input as ffmpeg should read it, the base name for the output
+    # file and whether it is an image sequence (e.g., *00000.png or *%0*d.png)
+    match = SEQUENCE_PATTERN.match(os.path.basename(video_file))
+    if match:
+        # Get the prefix, the number of digits in the frame number, and the file extension
+        prefix, frame_number, percentage, file_ext = match.groups()
+        num_digits = len(frame_number) if frame_number else int(percentage)
+        video_file = os.path.join(os.path.dirname(video_file),
+                                  f"{prefix}%0{num_digits}d.{file_ext}")
+        return video_file, prefix.rstrip('_'), True
+
+    return video_file, os.path.splitext(os.path.basename(video_file))[0], False
+
+
+def encoder(spec):
+    return CODECS[spec['codec']]
+
+
+def pixel_format(spec):
+    if encoder(spec) == "prores_ks":
+        return 'yuv444p10' if prores_profile_index(spec) >= 4 else 'yuv422p10'
+    return spec['pixel_format']
+
+
+def prores_profile_index(spec):
+    return PRORES_PROFILES.index(spec['prores_profile'])
+
+
+def output_file_name(spec, base_name):
+    size_prefix = ''
+    width = spec['resize_width']
+    height = spec['resize_height']
+    if height > 0 and width > 0:
+        size_prefix = f"{width}x{height}"
+    elif width > 0:
+        size_prefix = f"{width}w"
+    elif height > 0:
+        size_prefix = f"{height}p"
+
+    codec_name = spec['codec'].lower()
+    if codec_name == "prores":
+        container = "mov"
+        pix_fmt_name = spec['prores_profile']
+    else:
+        container = "mp4"
+        pix_fmt_name = {'yuv420p': '', 'yuv420p10': '10bit',
+                        'yuv422p10': '10bit422'}[spec['pixel_format']]
+    return (
+        f"{base_name} "
+        f"{size_prefix + '_' if size_prefix else ''}"
+        f"{codec_name}"
+        f"{'_' + pix_fmt_name if pix_fmt_name else ''}"
+        f"_q{spec['crf']}.{container}"
+    )
+
+
+def output_path(spec, base_name):
+    output_folder = spec['output_folder'] or os.getcwd()
+    if spec['output']:
+        return os.path.join(output_folder, spec['output'])
+    return os.path.join(output_folder, output_file_name(spec, base_name))
+
+
+def retarget_output(output_file, spec, new_spec):
+    # Generated file names carry the settings, so they follow a change of settings;
+    # names the user chose are kept
+    directory, name = os.path.split(output_file)
+    suffix = output_file_name(spec, '')
+    if not name.endswith(suffix):
+        return output_file
+    return os.path.join(directory, name[:-len(suffix)] + output_file_name(new_spec, ''))
+
+
+def output_duration(spec, file_info):
+    # Length of the encoded output in seconds, which is what progress is measured in
+    if '%' in spec['input'] and not spec['frame_rate']:
+        return None
+    return source_duration(spec, file_info) or None
+
+
+def thread_counts(spec, cores=None):
+    # (encoder/decoder threads, filter threads) for a job given cores of the
+    # machine, or (None, None) to leave ffmpeg's defaults. Those assume one job
+    # owns every core and oversubscribe the machine when jobs run side by side.
+    threads = spec['threads']
+    if threads is None:
+        return None, None
+    if threads == 0:
+        if not cores:
+            return None, None
+        threads = cores
+    return threads, spec['filter_threads'] or threads
+
+
+def remux_check(spec, file_info):
+    # (True, reason) when the source video can be copied as is, (False, reason)
+    # when it has to be re-encoded
+    if not spec['remux']:
+        return False, "re-encoding: stream copy is turned off"
+    if '%' in spec['input']:
+        return False, "re-encoding: image sequence"
+    if not file_info.get('pixel_format'):
+        return False, "re-encoding: source format unknown"
+
+    codec = encoder(spec)
+    source = f"{file_info['video_codec']} {file_info['pixel_format']}"
+    if file_info['video_codec'] != PROBED_CODECS[codec]:
+        return False, f"re-encoding: source is {file_info['video_codec']}, target {spec['codec']}"
+    # ffprobe names formats with their byte order, e.g. yuv420p10le
+    if re.sub(r'[lb]e$', '', file_info['pixel_format']) != pixel_format(spec):
+        return False, f"re-encoding: source is {source}, target {pixel_format(spec)}"
+    if codec == "prores_ks" and \
+            file_info.get('profile') != PROBED_PRORES_PROFILES[prores_profile_index(spec)]:
+        return False, f"re-encoding: source is ProRes {file_info.get('profile')}"
+    for key, size in (('resize_width', 'width'), ('resize_height', 'height')):
+        if spec[key] > 0 and spec[key] != file_info.get(size):
+            return False, (f"re-encoding: resize from "
+                           f"{file_info.get('width')}x{file_info.get('height')}")
+    if spec['convert_frame_rate'] > 0 and \
+            abs(spec['convert_frame_rate'] - (file_info.get('frame_rate') or 0)) > 0.001:
+        return False, "re-encoding: frame rate conversion"
+    if spec['in_point'] or spec['out_point']:
+        # A copy could only cut on keyframes
+        return False, "re-encoding: in/out range"
+    if spec['renditions']:
+        return False, "re-encoding: renditions share the decode"
+    return True, (f"stream copy: source is already {source} "
+                  f"{file_info.get('width')}x{file_info.get('height')}; "
+                  "CRF, preset and keyframe settings do not apply")
+
+
+def encoder_args(spec, threads=None):
+    crf = spec['crf']
+    codec = encoder(spec)
+    pix_fmt = pixel_format(spec)
+
+    colorspace = "bt709"
+    preset = spec['preset']
+
+    ffmpeg_args = {
+        "vcodec": codec,
+        "pix_fmt": pix_fmt,
+        "colorspace": colorspace,
+        "color_trc": colorspace,
+        "color_primaries": colorspace,
+        "y": None  # force overwrite
+    }
+
+    if codec == "libx264" or codec == "libx265":
+        ffmpeg_args["crf"] = crf
+        ffmpeg_args["preset"] = preset
+        ffmpeg_args["movflags"] = "faststart"
+        ffmpeg_args["g"] = spec['keyframe_interval']
+        if spec['tune_grain']:
+            ffmpeg_args["tune"] = "grain"
+        if codec == "libx265":
+            ffmpeg_args["vtag"] = "hvc1"
+
+    elif codec == "prores_ks":
+        ffmpeg_args["profile:v"] = prores_profile_index(spec)
+        ffmpeg_args["q:v"] = crf
+        ffmpeg_args["vendor"] = "ap10"
+
+    if threads:
+        if codec == "libx265":
+            # libx265 ignores -threads; its frame threads follow the pool size
+            ffmpeg_args["x265-params"] = f"pools={threads}"
+        else:
+            ffmpeg_args["threads"] = threads
+
+    return ffmpeg_args
+
+
+def open_input(spec, file_info, input_args=None):
+    video_file = spec['input']
+    input_video_codec = file_info.get('video_codec', '')
+
+    if '%' in video_file:
+        frame_rate = spec['frame_rate']
+        sequence_args = {}
+        if file_info.get('start_number') is not None:
+            sequence_args['start_number'] = file_info['start_number']
+        sequence_args.update(input_args or {})
+        return ffmpeg.input(video_file, format='image2', framerate=frame_rate, **sequence_args)
+
+    # Use hardware decoding for AV1 files to avoid libaom-av1 compatibility issues
+    if input_video_codec == 'av1':
+        return ffmpeg.input(video_file, hwaccel='cuda', **{'c:v': 'av1_cuvid'},
+                            **(input_args or {}))
+    return ffmpeg.input(video_file, **(input_args or {}))
+
+
+def point_seconds(value, frame_rate, first_frame=0):
+    # An in or out point as seconds from the start of the source
+    if FRAME_POINT.match(value) or TIMECODE_POINT.match(value):
+        if not frame_rate:
+            raise ValueError(f"'{value}' needs the source frame rate, which is unknown")
+        match = TIMECODE_POINT.match(value)
+        if match is None:
+            return (int(value) - first_frame) / frame_rate
+        hours, minutes, seconds, frames = (int(part) for part in match.groups())
+        return hours * 3600 + minutes * 60 + seconds + frames / round(frame_rate)
+    match = CLOCK_POINT.match(value)
+    if match is not None:
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + float(seconds)
+    return float(SECONDS_POINT.match(value).group(1))
+
+
+def source_range(spec, file_info):
+    # (start, length) in seconds of the part of the source that is encoded;
+    # length is None when the source duration is unknown
+    if '%' in spec['input']:
+        frame_rate = spec['frame_rate']
+        first_frame = file_info.get('start_number') or 0
+        total = file_info['frame_count'] / frame_rate
+    else:
+        frame_rate = file_info.get('frame_rate')
+        first_frame = 0
+        total = file_info['duration'] or None
+
+    start = 0.0
+    if spec['in_point']:
+        start = max(0.0, point_seconds(spec['in_point'], frame_rate, first_frame))
+    end = total
+    if spec['out_point']:
+        end = point_seconds(spec['out_point'], frame_rate, first_frame)
+        end = min(end, total) if total else end
+    if frame_rate:
+        # Whole frames: every frame the range touches is kept, as a lone encode
+        # would; fractions of frames would make split encodes disagree with it
+        start = math.floor(start * frame_rate + 1e-6) / frame_rate
+        if end is not None:
+            end = math.ceil(end * frame_rate - 1e-6) / frame_rate
+    if total and start >= total:
+        raise ValueError(f"In point {spec['in_point']} is past the end of '{spec['input']}'")
+    if end is not None and end <= start:
+        raise ValueError(f"Out point {spec['out_point']} is not after in point {spec['in_point']}")
+    return start, (end - start if end is not None else None)
+
+
+def sequence_range(spec, file_info):
+    # (first frame number, frame count) of the part of an image sequence encoded
+    start, length = source_range(spec, file_info)
+    start_number = file_info.get('start_number') or 0
+    first = start_number + round(start * spec['frame_rate'])
+    last = first + round(length * spec['frame_rate'])
+    return first, last - first
+
+
+def range_input_args(spec, file_info):
+    # Input-side options selecting the in/out range. ffmpeg seeks to the keyframe
+    # before the in point and decodes from there, dropping frames up to the exact
+    # point, rather than decoding everything before it.
+    if not spec['in_point'] and not spec['out_point']:
+        return {}
+    if '%' in spec['input']:
+        first, frames = sequence_range(spec, file_info)
+        input_args = {'start_number': first}
+        start_number = file_info.get('start_number') or 0
+        if first + frames < start_number + file_info['frame_count']:
+            # Rounded down so the frame at the out point is never let in
+            input_args['t'] = f"{math.floor(frames / spec['frame_rate'] * 1e6) / 1e6:.6f}"
+        return input_args
+    start, length = source_range(spec, file_info)
+    input_args = {}
+    if start > 0:
+        input_args['ss'] = f"{start:.6f}"
+    if spec['out_point']:
+        input_args['t'] = f"{length:.6f}"
+    return input_args
+
+
+def source_duration(spec, file_info):
+    # Length in seconds of the part of the source that is encoded
+    return source_range(spec, file_info)[1]
+
+
+def filter_video(spec, file_info, video, filter_threads=None):
+    return plan_filters(spec, file_info, filter_threads).apply(video)
+
+
+def audio_source(spec, file_info, source, video_duration):
+    # The audio stream to map, or None.
+    # The source's own audio follows the in/out range through the input options;
+    # external audio runs along the full source, so it is cut to the range here.
+    audio = None
+    if '%' not in spec['input'] and file_info['audio_stream_count'] > 0:
+        # Map only the first audio stream to skip extras like iPhone
+        # spatial-audio tracks (APAC), which FFmpeg cannot decode.
+        audio = source['a:0']
+
+    if spec['audio']:
+        start = source_range(spec, file_info)[0]
+        audio_args = {'ss': f"{start:.6f}"} if start > 0 else {}
+        if spec['out_point'] and video_duration:
+            audio_args['t'] = f"{video_duration:.6f}"
+        audio = ffmpeg.input(spec['audio'], **audio_args).audio
+        if not spec['audio_copy']:
+            audio = audio.filter_('atrim', duration=video_duration)
+    return audio
+
+
+def audio_args(spec):
+    # Audio codec arguments, or None when the output has no audio
+    audio_codec = 'copy' if spec['audio_copy'] else spec['audio_codec']
+    if audio_codec is None:
+        return None
+    args = {"acodec": audio_codec}
+    if audio_codec == 'aac':
+        args["ab"] = f"{spec['audio_bitrate']}k"
+    return args
+
+
+def select_audio(spec, file_info, source, ffmpeg_args, video_duration):
+    # Returns the audio stream to map, or None, and adds the audio codec arguments
+    audio = audio_source(spec, file_info, source, video_duration)
+    codec_args = audio_args(spec)
+    if audio is None or codec_args is None:
+        return None
+    ffmpeg_args.update(codec_args)
+    return audio
+
+
+def build_output(spec, file_info, output_file, input_args=None, with_audio=True, cores=None):
+    # cores is the share of the machine the job gets when threads are automatic
+    threads, filter_threads = thread_counts(spec, cores)
+    ffmpeg_args = encoder_args(spec, threads)
+    if input_args is None:
+        input_args = range_input_args(spec, file_info)
+    if threads:
+        input_args = {'threads': threads, **(input_args or {})}
+    input_stream = open_input(spec, file_info, input_args)
+    video = filter_video(spec, file_info, input_stream.video, filter_threads)
+
+    audio = None
+    if with_audio:
+        audio = select_audio(spec, file_info, input_stream, ffmpeg_args,
+                             source_duration(spec, file_info))
+
+    if audio is not None:
+        output = ffmpeg.output(video, audio, output_file, **ffmpeg_args)
+    else:
+        output = ffmpeg.output(video, output_file, **ffmpeg_args)
+
+    if filter_threads:
+        output = output.global_args('-filter_complex_threads', str(filter_threads))
+    return output
+
+
+def build_command(spec, file_info, output_file, cores=None):
+    return ffmpeg.compile(build_output(spec, file_info, output_file, cores=cores))
+
+
+def build_multi_command(spec, file_info, output_files, cores=None):
+    # One ffmpeg process for all renditions: the source is decoded once and split
+    # into a branch per output, each with its own scaling, pixel format and
+    # encoder. Filter steps all renditions share, like a frame rate change, run
+    # once before the split. output_files are in rendition_specs order.
+    specs = rendition_specs(spec)
+    threads, filter_threads = thread_counts(spec, cores)
+    input_args = range_input_args(spec, file_info)
+    if threads:
+        input_args = {'threads': threads, **input_args}
+    source = open_input(spec, file_info, input_args)
+
+    plans = [plan_filters(rendition, file_info, filter_threads) for rendition in specs]
+    shared = 0
+    while all(len(plan.steps) > shared and str(plan.steps[shared]) == str(plans[0].steps[shared])
+              for plan in plans):
+        shared += 1
+    video = FilterPlan(plans[0].steps[:shared], []).apply(source.video)
+    videos = video.filter_multi_output('split', len(specs))
+
+    audio = audio_source(spec, file_info, source, source_duration(spec, file_info))
+    codec_args = [audio_args(rendition) if audio is not None else None for rendition in specs]
+    audio_count = sum(args is not None for args in codec_args)
+    audios = None
+    if audio_count > 1 and spec['audio'] and not spec['audio_copy']:
+        # A filter output can feed only one output; input streams can be mapped again
+        audios = audio.filter_multi_output('asplit', audio_count)
+
+    outputs = []
+    audio_index = 0
+    for index, (rendition, plan, output_file) in enumerate(zip(specs, plans, output_files)):
+        ffmpeg_args = encoder_args(rendition, threads)
+        streams = [FilterPlan(plan.steps[shared:], []).apply(videos.stream(index))]
+        if codec_args[index] is not None:
+            ffmpeg_args.update(codec_args[index])
+            streams.append(audios.stream(audio_index) if audios is not None else audio)
+            audio_index += 1
+        outputs.append(ffmpeg.output(*streams, output_file, **ffmpeg_args))
+
+    output = ffmpeg.merge_outputs(*outputs)
+    if filter_threads:
+        output = output.global_args('-filter_complex_threads', str(filter_threads))
+    return ffmpeg.compile(output)
+
+
+def build_segment_command(spec, file_info, output_file, input_args, cores=None):
+    # Video only; audio is added once over the whole range when the segments
+    # are joined. input_args select the part of the input to encode.
+    return ffmpeg.compile(build_output(spec, file_info, output_file, input_args,
+                                       with_audio=False, cores=cores))
+
+
+def build_remux_command(spec, file_info, output_file):
+    # Copies the video stream into the new container and muxes the audio, with
+    # the tags encode_video sets
+    ffmpeg_args = {"vcodec": "copy", "y": None}
+    if output_file.lower().endswith('.mp4'):
+        ffmpeg_args["movflags"] = "faststart"
+    if encoder(spec) == "libx265":
+        ffmpeg_args["vtag"] = "hvc1"
+
+    source = ffmpeg.input(spec['input'])
+    audio = select_audio(spec, file_info, source, ffmpeg_args, source_duration(spec, file_info))
+    if audio is not None:
+        output = ffmpeg.output(source['v:0'], audio, output_file, **ffmpeg_args)
+    else:
+        output = ffmpeg.output(source['v:0'], output_file, **ffmpeg_args)
+    return ffmpeg.compile(output)
+
+
+def build_concat_command(spec, file_info, list_file, output_file):
+    # Joins encoded segments losslessly with the concat demuxer and muxes the
+    # audio of the full timeline, keeping the tags encode_video sets
+    ffmpeg_args = {"vcodec": "copy", "y": None}
+    if output_file.lower().endswith('.mp4'):
+        ffmpeg_args["movflags"] = "faststart"
+    if encoder(spec) == "libx265":
+        ffmpeg_args["vtag"] = "hvc1"
+
+    video = ffmpeg.input(list_file, format='concat', safe=0).video
+    source = None
+    if '%' not in spec['input']:
+        source = ffmpeg.input(spec['input'], **range_input_args(spec, file_info))
+    audio = select_audio(spec, file_info, source, ffmpeg_args, source_duration(spec, file_info))
+
+    if audio is not None:
+        output = ffmpeg.output(video, audio, output_file, **ffmpeg_args)
+    else:
+        output = ffmpeg.output(video, output_file, **ffmpeg_args)
+    return ffmpeg.compile(output)
@@ -0,0 +1,347 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import json
+import os
+import threading
+import time
+
+from triada.command import encoder
+from triada.lazy import lazy_import
+from triada.progress import ProgressTracker
+from triada.scheduler import (CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobScheduler,
+                              cores_per_job, max_concurrent_jobs)
+
+http_client = lazy_import('http.client')
+
+DEFAULT_PORT = 8765
+# Worker addresses and the shared token, unless given on the command line
+FARM_ENV = 'TRIADA_FARM'
+TOKEN_ENV = 'TRIADA_FARM_TOKEN'
+TOKEN_HEADER = 'X-Triada-Token'
+# Workers send an event at least this often while a job runs; a worker silent
+# for WORKER_TIMEOUT counts as lost and its job is sent elsewhere
+HEARTBEAT_INTERVAL = 1.0
+WORKER_TIMEOUT = 10.0
+STATUS_INTERVAL = 2.0
+FARM_RETRIES = 2
+
+
+class WorkerLost(Exception):
+    pass
+
+
+class TaskRejected(Exception):
+    pass
+
+
+def parse_address(text):
+    # (host, port) from 'host', 'host:port' or 'http://host:port/'
+    text = text.strip()
+    if '://' in text:
+        text = text.split('://', 1)[1]
+    text = text.rstrip('/')
+    host, separator, port = text.rpartition(':')
+    if not separator or not port.isdigit():
+        host, port = text, DEFAULT_PORT
+    host = host.strip('[]')
+    if not host:
+        raise ValueError(f"Invalid worker address {text!r}, expected HOST:PORT")
+    return host, int(port)
+
+
+def farm_addresses(addresses=None):
+    # Worker addresses from the command line, else from $TRIADA_FARM (comma separated)
+    if not addresses:
+        addresses = os.environ.get(FARM_ENV, '').split(',')
+    return [address.strip() for address in addresses if address.strip()]
+
+
+def remote_task(task):
+    # The task with the paths a worker opens made absolute, as its working
+    # directory is not ours
+    spec = dict(task['spec'], input=os.path.abspath(task['spec']['input']))
+    if spec['audio']:
+        spec['audio'] = os.path.abspath(spec['audio'])
+    return dict(task, spec=spec, output_file=os.path.abspath(task['output_file']))
+
+
+class FarmWorker:
+    # The dispatching side of one worker agent
+    def __init__(self, address, token=None):
+        self.host, self.port = parse_address(address)
+        self.address = f"{self.host}:{self.port}"
+        self.token = token
+        self.status = None  # last reply to /status, None while unreachable
+        self.assigned = {}  # job: cores, for jobs this machine has running there
+
+    def __repr__(self):
+        return f"<farm worker {self.address}>"
+
+    def _request(self, method, path, body=None, timeout=WORKER_TIMEOUT):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        connection = http_client.HTTPConnection(self.host, self.port, timeout=timeout)
+        try:
+            connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                               headers=headers)
+            response = connection.getresponse()
+        except (OSError, http_client.HTTPException) as error:
+            connection.close()
+            raise WorkerLost(f"{self.address}: {error}") from error
+        if response.status >= 400:
+            message = response.read().decode('utf-8', 'replace')
+            connection.close()
+            try:
+                message = json.loads(message)['error']
+            except (ValueError, KeyError, TypeError):
+                pass
+            if response.status in (401, 403):
+                raise WorkerLost(f"{self.address} refused the token: {message}")
+            raise TaskRejected(f"{self.address}: {message}")
+        return connection, response
+
+    def _json(self, method, path, body=None):
+        connection, response = self._request(method, path, body)
+        try:
+            return json.loads(response.read() or b'null')
+        except (OSError, http_client.HTTPException, ValueError) as error:
+            raise WorkerLost(f"{self.address}: {error}") from error
+        finally:
+            connection.close()
+
+    def refresh(self):
+        try:
+            self.status = self._json('GET', '/status')
+        except (WorkerLost, TaskRejected):
+            self.status = None
+        return self.status is not None
+
+    @property
+    def cores(self):
+        return self.status['cores'] if self.status else 0
+
+    def busy_cores(self):
+        # Cores taken on the worker: what it reports, or at least what this
+        # machine sent it since, which the next report will include
+        reported = self.status['busy_cores'] if self.status else 0
+        return max(reported, sum(self.assigned.values()))
+
+    def submit(self, task):
+        return self._json('POST', '/jobs', remote_task(task))['id']
+
+    def events(self, job_id):
+        # The job's events as they happen, from its first
+        connection, response = self._request('GET', f"/jobs/{job_id}/events")
+        try:
+            while True:
+                try:
+                    line = response.readline()
+                except (OSError, http_client.HTTPException) as error:
+                    raise WorkerLost(f"{self.address}: {error}") from error
+                if not line:
+                    raise WorkerLost(f"{self.address} closed the connection")
+                try:
+                    event = json.loads(line)
+                except ValueError as error:
+                    raise WorkerLost(f"{self.address} sent {line[:80]!r}") from error
+                yield event
+                if event['type'] == 'finished':
+                    return
+        finally:
+            connection.close()
+
+    def stop(self, job_id):
+        try:
+            self._json('DELETE', f"/jobs/{job_id}")
+        except (WorkerLost, TaskRejected):
+            pass  # Losing the worker stops the job as well
+
+
+class WorkerPool:
+    # The farm workers jobs are placed on. Their load is polled in the
+    # background, and on_change is called after each poll.
+    def __init__(self, workers, on_change=None, interval=STATUS_INTERVAL):
+        self.workers = list(workers)
+        self.on_change = on_change
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        threads = [threading.Thread(target=worker.refresh, daemon=True) for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self.refresh()
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._poll, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+
+    def _poll(self):
+        # Cores free up as other machines' jobs end too, so waiting jobs are
+        # offered to the workers after every round
+        while not self._stopped.wait(self.interval):
+            self.refresh()
+            if self.on_change is not None and self.reachable():
+                self.on_change()
+
+    def reachable(self):
+        return [worker for worker in self.workers if worker.status is not None]
+
+    def capacity(self, spec):
+        # Cores to split an encode over: the job slots of every reachable worker,
+        # counted in the cores a job of this codec and preset keeps busy
+        workers = self.reachable()
+        if not workers:
+            return None
+        codec = encoder(spec)
+        preset = spec['preset'] if codec != "prores_ks" else None
+        slots = sum(max_concurrent_jobs(codec, preset, worker.cores) for worker in workers)
+        return slots * cores_per_job(codec, preset, 1 << 30)
+
+    def place(self, job):
+        # The reachable worker with the most free cores that has room for the
+        # job, or None when every worker is busy. An idle worker always has room.
+        with self._lock:
+            best, best_free, best_needed = None, None, 0
+            for worker in self.reachable():
+                needed = cores_per_job(job.codec, job.preset, worker.cores)
+                busy = worker.busy_cores()
+                free = worker.cores - busy
+                if busy and free < needed:
+                    continue
+                if best is None or free > best_free:
+                    best, best_free, best_needed = worker, free, needed
+            if best is not None:
+                best.assigned[job] = best_needed
+            return best
+
+    def release(self, worker, job):
+        with self._lock:
+            worker.assigned.pop(job, None)
+
+    def lost(self, worker):
+        worker.status = None
+
+
+def worker_pool(addresses=None, token=None):
+    # None unless workers are given here or in $TRIADA_FARM
+    addresses = farm_addresses(addresses)
+    if not addresses:
+        return None
+    token = token or os.environ.get(TOKEN_ENV)
+    return WorkerPool([FarmWorker(address, token) for address in addresses])
+
+
+class FarmScheduler(JobScheduler):
+    # Runs encode and segment jobs on farm workers, and what only makes sense
+    # here (stream copies, joining segments) on this machine. Each worker builds
+    # its job's command from the same spec, with its own cores. A job whose
+    # worker is lost is sent to another one up to `retries` times; with every
+    # worker unreachable, jobs run here.
+    def __init__(self, pool, retries=FARM_RETRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool
+        self.pool.on_change = self._reschedule
+        self.retries = retries
+
+    def capacity(self, spec=None):
+        if spec is None:
+            return self.total_cores
+        self.pool.start()  # Jobs may be planned before the queue first starts
+        return self.pool.capacity(spec) or self.total_cores
+
+    def start(self):
+        self.pool.start()
+        super().start()
+
+    def _reschedule(self):
+        with self._lock:
+            self._schedule()
+
+    def _start(self, job):
+        if job.task is not None:
+            worker = self.pool.place(job)
+            if worker is not None:
+                job.worker = worker
+                job.state = RUNNING
+                threading.Thread(target=self._run_remote, args=(job,), daemon=True).start()
+                return True
+            if self.pool.reachable():
+                return False  # Waits for a worker to free up
+        job.worker = None
+        return super()._start(job)
+
+    def _run_remote(self, job):
+        worker = job.worker
+        self._notify(self.on_job_update, job)
+        job.tracker = ProgressTracker(job.duration)
+        job.started_at = time.time()
+        job.returncode = job.cpu_seconds = job.peak_rss_kb = None
+        if not self._prepare(job):
+            self.pool.release(worker, job)
+            return
+        self._log(job, f"Sending {job.name} to {worker.address}")
+        finished = None
+        try:
+            remote_id = worker.submit(job.task)
+            stopping = False
+            for event in worker.events(remote_id):
+                if job.stop_flag and not stopping:
+                    worker.stop(remote_id)
+                    stopping = True
+                if event['type'] == 'log':
+                    self._log(job, event['line'])
+                elif event['type'] == 'progress':
+                    if job.tracker.update(event):
+                        self._notify(self.on_job_update, job)
+                elif event['type'] == 'finished':
+                    finished = event
+            if finished['state'] not in (DONE, FAILED) and not job.stop_flag:
+                # Only a worker shutting down stops a job nobody asked it to stop
+                raise WorkerLost(f"{worker.address} stopped {job.name} while shutting down")
+        except TaskRejected as error:
+            self._log(job, f"Failed to run {job.name} on {worker.address}: {error}")
+        except WorkerLost as error:
+            self.pool.release(worker, job)
+            self.pool.lost(worker)
+            job.attempts += 1
+            if job.stop_flag or job.attempts > self.retries:
+                self._log(job, f"Lost {worker.address} running {job.name}: {error}")
+                self._finish(job, QUEUED if job.stop_flag and job.resumable else FAILED)
+                return
+            self._log(job, f"Lost {worker.address} running {job.name}, sending it again: {error}")
+            with self._lock:
+                job.state = QUEUED
+                job.worker = None
+                self._notify(self.on_job_update, job)
+                self._schedule()
+            return
+
+        self.pool.release(worker, job)
+        worker.refresh()  # So the cores it frees count when the next job is placed
+        if finished is not None:
+            job.returncode = finished['returncode']
+            job.cpu_seconds = finished['cpu_seconds']
+            job.peak_rss_kb = finished['peak_rss_kb']
+        if job.stop_flag:
+            state = QUEUED if job.resumable else CANCELLED
+        elif finished is not None and finished['state'] == DONE:
+            state = DONE
+        else:
+            state = FAILED
+        self._finish(job, state)
@@ -0,0 +1,145 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import functools
+
+from triada.lazy import lazy_import
+
+subprocess = lazy_import('subprocess')
+
+SCALERS = ('swscale', 'zscale')
+# zscale names for the resize filters offered in the GUI
+ZSCALE_FILTERS = {'bicubic': 'bicubic', 'lanczos': 'lanczos', 'spline': 'spline36'}
+
+
+class FilterStep:
+    def __init__(self, name, args=(), kwargs=None, note=''):
+        self.name = name
+        self.args = list(args)
+        self.kwargs = kwargs or {}
+        self.note = note
+
+    def __str__(self):
+        options = [str(arg) for arg in self.args]
+        options += [f"{key}={value}" for key, value in self.kwargs.items()]
+        return f"{self.name}={':'.join(options)}" if options else self.name
+
+
+class FilterPlan:
+    # The video filter chain for a job, plus notes on what was reordered or left out
+    def __init__(self, steps, notes):
+        self.steps = steps
+        self.notes = notes
+
+    def apply(self, video):
+        for step in self.steps:
+            video = video.filter(step.name, *step.args, **step.kwargs)
+        return video
+
+    def describe(self):
+        lines = [f"{index}. {step}" + (f"  ({step.note})" if step.note else '')
+                 for index, step in enumerate(self.steps, 1)]
+        if not lines:
+            lines.append("no video filters")
+        return lines + [f"- {note}" for note in self.notes]
+
+
+@functools.lru_cache(maxsize=None)
+def zscale_available(ffmpeg_bin='ffmpeg'):
+    try:
+        output = subprocess.run([ffmpeg_bin, '-hide_banner', '-filters'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True,
+                                check=False).stdout
+    except OSError:
+        return False
+    return any(line.split()[1:2] == ['zscale'] for line in output.splitlines())
+
+
+def source_frame_rate(spec, file_info):
+    if '%' in spec['input']:
+        return spec['frame_rate']
+    return file_info.get('frame_rate')
+
+
+def resize_is_noop(width, height, file_info):
+    # Scaling to the size the source already has; -1 keeps the aspect ratio
+    source_width, source_height = file_info.get('width'), file_info.get('height')
+    if not source_width or not source_height:
+        return False
+    return width in (-1, source_width) and height in (-1, source_height)
+
+
+def scale_step(spec, width, height, convert_matrix, filter_threads, use_zscale):
+    # Resizing and the RGB -> bt709 conversion in one pass; the encoder's pixel
+    # format is negotiated into the same pass
+    resize = width != 0 or height != 0
+    if use_zscale:
+        kwargs = {}
+        if resize:
+            kwargs.update(w=width, h=height, filter=ZSCALE_FILTERS[spec['resize_filter']])
+        if convert_matrix:
+            # Full range RGB to limited range bt709 YUV, as swscale does
+            kwargs.update(matrix='709', range='limited')
+        return FilterStep('zscale', kwargs=kwargs)
+
+    args = [width, height] if resize else []
+    kwargs = {}
+    if resize:
+        kwargs['sws_flags'] = spec['resize_filter']
+    if convert_matrix:
+        kwargs.update(in_color_matrix='bt601', out_color_matrix='bt709')
+    if filter_threads:
+        kwargs['threads'] = filter_threads  # swscale slice threads
+    return FilterStep('scale', args, kwargs)
+
+
+def plan_filters(spec, file_info, filter_threads=None):
+    notes = []
+    convert_matrix = file_info['is_rgb']
+
+    width = spec['resize_width'] if spec['resize_width'] > 0 else -1
+    height = spec['resize_height'] if spec['resize_height'] > 0 else -1
+    if width == -1 and height == -1:
+        width = height = 0
+    elif resize_is_noop(width, height, file_info):
+        notes.append(f"resize skipped, the source is already "
+                     f"{file_info['width']}x{file_info['height']}")
+        width = height = 0
+
+    use_zscale = False
+    if spec['scaler'] == 'zscale':
+        if zscale_available():
+            use_zscale = True
+        else:
+            notes.append("zscale is not available in this ffmpeg, using swscale")
+
+    scale = None
+    if width or height or convert_matrix:
+        scale = scale_step(spec, width, height, convert_matrix, filter_threads, use_zscale)
+        if convert_matrix and (width or height):
+            scale.note = "resize and bt601 -> bt709 in one pass"
+        elif convert_matrix:
+            scale.note = "bt601 -> bt709"
+
+    fps = None
+    source_rate = source_frame_rate(spec, file_info)
+    target_rate = spec['convert_frame_rate']
+    if target_rate > 0:
+        if source_rate and abs(target_rate - source_rate) < 0.001:
+            notes.append(f"fps skipped, the source is already {source_rate:g} fps")
+        else:
+            fps = FilterStep('fps', kwargs={'fps': target_rate, 'round': 'near'})
+
+    # Scaling works on each frame on its own, so it commutes with fps. Frame
+    # rate reduction goes first so dropped frames are never scaled; increases
+    # go last so duplicated frames are scaled only once.
+    if fps is not None and scale is not None and source_rate and target_rate > source_rate:
+        fps.note = f"after scaling, duplicates frames from {source_rate:g} fps"
+        steps = [scale, fps]
+    else:
+        if fps is not None and scale is not None:
+            fps.note = (f"before scaling, drops frames from {source_rate:g} fps" if source_rate
+                        else "before scaling")
+        steps = [step for step in (fps, scale) if step is not None]
+    return FilterPlan(steps, notes)
@@ -0,0 +1,1070 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+# pylint: disable=no-name-in-module
+# pylint: disable=unnecessary-lambda
+# pylint: disable=import-outside-toplevel
+
+import sys
+import os
+
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout
+from PyQt5.QtWidgets import QPushButton, QRadioButton, QSlider, QProgressBar
+from PyQt5.QtWidgets import QFileDialog, QLabel, QComboBox, QLineEdit, QSpinBox, QDoubleSpinBox
+from PyQt5.QtWidgets import QGraphicsOpacityEffect, QPlainTextEdit, QCheckBox, QMessageBox
+from PyQt5.QtWidgets import QButtonGroup, QFrame, QGridLayout, QListWidget, QListWidgetItem
+from PyQt5.QtCore import Qt, pyqtSignal, QStandardPaths, QObject, QTimer
+from PyQt5.QtGui import QPixmap, QValidator
+
+from triada import VERSION
+from triada.command import (AUDIO_CODECS, AUTO_TUNE_MODES, CODECS, DEFAULT_SPEC, PIXEL_FORMATS,
+                            PRIORITIES, PRORES_PROFILES, RANGE_POINT_PATTERNS, RENDITION_KEYS,
+                            make_spec, output_file_name, output_path, parse_input, remux_check,
+                            rendition_outputs)
+from triada.log import LOG_CAPACITY, JobLog, LogBuffer, default_log_dir, job_log_path
+from triada.probe import ProbeService, get_file_info
+from triada.sequence import gap_warning
+from triada.progress import format_status
+from triada.scheduler import JobScheduler, max_concurrent_jobs
+from triada.telemetry import default_telemetry
+from triada.thumbnails import THUMBNAIL_COUNT, THUMBNAIL_WIDTH, thumbnail_strip
+
+
+class SchedulerBridge(QObject):
+    # Carries scheduler callbacks from worker threads to the GUI thread
+    job_updated = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+    jobs_added = pyqtSignal(object)
+    queue_finished = pyqtSignal()
+
+
+class ProbeBridge(QObject):
+    probe_finished = pyqtSignal(object, object, object)
+    thumbnails_finished = pyqtSignal(object, object, object)
+
+
+class DnDLineEdit(QLineEdit):
+    file_dropped = pyqtSignal(str)
+    files_dropped = pyqtSignal(list)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAcceptDrops(True)
+
+    def dragEnterEvent(self, event):  # pylint: disable=invalid-name
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):  # pylint: disable=invalid-name
+        urls = [url.toLocalFile() for url in event.mimeData().urls()]
+        if len(urls) > 1 and self.receivers(self.files_dropped) > 0:
+            self.files_dropped.emit(urls)
+            return
+        self.setText(urls[0])
+        self.file_dropped.emit(urls[0])
+
+
+# How often buffered log lines are flushed to the console view
+CONSOLE_FLUSH_INTERVAL = 100
+
+
+class CustomStream:
+    def __init__(self, log_buffer):
+        self.log_buffer = log_buffer
+
+    def write(self, text):
+        self.log_buffer.write(text)
+
+    def flush(self):
+        pass
+
+class CustomDoubleSpinBox(QDoubleSpinBox):
+    def textFromValue(self, value):  # pylint: disable=invalid-name
+        if value.is_integer():
+            return str(int(value))
+        return super().textFromValue(value)
+
+    def validate(self, text, pos):
+        # Allows the user to enter non-integer values starting with an integer
+        if text.endswith('.') or '.' in text:
+            return (QValidator.Acceptable, text, pos)
+        return super().validate(text, pos)
+
+class RangePointValidator(QValidator):
+    def validate(self, text, pos):
+        # Anything may be typed; only complete frames, times and timecodes are used
+        if not text or any(pattern.match(text) for pattern in RANGE_POINT_PATTERNS):
+            return (QValidator.Acceptable, text, pos)
+        return (QValidator.Intermediate, text, pos)
+
+class FFmpegGUI(QWidget):
+    video_file_info = None
+    output_base_name = None
+    custom_stream = None
+    probe_request = None
+    thumbnail_request = None
+    queue_running = False
+    remux_label = None
+
+    def __init__(self):
+        super().__init__()
+
+        self.original_stdout = sys.stdout
+        self.log_buffer = LogBuffer()
+        self.custom_stream = CustomStream(self.log_buffer)
+        self.log_dir = default_log_dir()
+        self.scheduler_bridge = SchedulerBridge()
+        scheduler_args = dict(
+            on_job_update=self.scheduler_bridge.job_updated.emit,
+            on_job_finished=self.scheduler_bridge.job_finished.emit,
+            on_queue_finished=self.scheduler_bridge.queue_finished.emit,
+            on_jobs_added=self.open_added_jobs,
+            telemetry=default_telemetry(os.path.join(self.log_dir, 'telemetry.jsonl')))
+        if os.environ.get('TRIADA_FARM'):  # Only then is the farm code loaded
+            from triada.farm import FarmScheduler, worker_pool
+            self.scheduler = FarmScheduler(worker_pool(), **scheduler_args)
+        else:
+            self.scheduler = JobScheduler(**scheduler_args)
+        self.probe_bridge = ProbeBridge()
+        self.probe_service = ProbeService()
+        self.pending_adds = []
+        self.renditions = []  # further outputs written from the same decode
+        self.init_ui()
+
+    def init_ui(self):
+        self.setWindowTitle(f"Triada FFmpeg GUI v{VERSION}")
+        # Set initial window size
+        self.resize(300, self.height())
+
+        layout = QVBoxLayout()
+
+        layout.addWidget(QLabel('Video or Image Sequence'))
+        self.video_input = DnDLineEdit()
+        self.video_input.file_dropped.connect(self.select_video)
+        self.video_input.files_dropped.connect(self.add_files_to_queue)
+        self.video_input.editingFinished.connect(
+            lambda: self.select_video(self.video_input.text()))
+        self.video_button = QPushButton('Browse')
+        self.video_button.clicked.connect(self.browse_videos)
+        video_layout = QHBoxLayout()
+        video_layout.addWidget(self.video_input)
+        video_layout.addWidget(self.video_button)
+        layout.addLayout(video_layout)
+
+        # Thumbnails across the input, to check the right file is loaded
+        self.thumbnail_labels = []
+        thumbnail_layout = QHBoxLayout()
+        thumbnail_layout.setSpacing(2)
+        for _ in range(THUMBNAIL_COUNT):
+            label = QLabel()
+            label.setFixedWidth(THUMBNAIL_WIDTH // 2)
+            label.hide()
+            self.thumbnail_labels.append(label)
+            thumbnail_layout.addWidget(label)
+        thumbnail_layout.addStretch(1)
+        layout.addLayout(thumbnail_layout)
+
+        self.frame_rate_label = QLabel('Frame Rate')
+        self.frame_rate_input = QSpinBox()
+        # Set the minimum and maximum frame rate values
+        self.frame_rate_input.setRange(1, 240)
+        # Set the default frame rate value to 30
+        self.frame_rate_input.setValue(30)
+        layout.addWidget(self.frame_rate_label)
+        layout.addWidget(self.frame_rate_input)
+        self.prefetch_label = QLabel('Read-ahead Frames')
+        self.prefetch_input = QSpinBox()
+        self.prefetch_input.setRange(0, 1000)
+        self.prefetch_input.setSpecialValueText("Off")
+        self.prefetch_input.setToolTip(
+            'Read frames ahead of the encoder, for sequences on network storage')
+        layout.addWidget(self.prefetch_label)
+        layout.addWidget(self.prefetch_input)
+        # Set initially hidden until the image sequence is detected
+        self.frame_rate_label.hide()
+        self.frame_rate_input.hide()
+        self.prefetch_label.hide()
+        self.prefetch_input.hide()
+
+        range_layout = QHBoxLayout()
+        self.in_point_input = QLineEdit()
+        self.out_point_input = QLineEdit()
+        for label, range_input in (('In', self.in_point_input), ('Out', self.out_point_input)):
+            range_input.setPlaceholderText('frame, 12.5s or 00:01:02:12')
+            range_input.setValidator(RangePointValidator(range_input))
+            range_input.editingFinished.connect(self.update_output_file_name)
+            range_layout.addWidget(QLabel(label))
+            range_layout.addWidget(range_input)
+        self.in_point_input.setToolTip('First frame to encode; empty starts at the beginning')
+        self.out_point_input.setToolTip('Frame after the last one to encode; empty runs to the end')
+        layout.addLayout(range_layout)
+
+        layout.addWidget(QLabel('Audio Source (optional)'))
+        self.audio_input = DnDLineEdit()
+        self.audio_input.file_dropped.connect(self.select_audio)
+        self.audio_input.editingFinished.connect(
+            lambda: self.select_audio(self.audio_input.text()))
+        self.audio_button = QPushButton('Browse')
+        self.audio_button.clicked.connect(lambda: self.select_audio())
+        audio_layout = QHBoxLayout()
+        audio_layout.addWidget(self.audio_input)
+        audio_layout.addWidget(self.audio_button)
+        layout.addLayout(audio_layout)
+
+        layout.addWidget(QLabel('Resize'))
+        resize_layout = QHBoxLayout()
+        self.resize_width = QSpinBox()
+        self.resize_width.setFixedWidth(64)
+        self.resize_width.setRange(0, 8192)
+        self.resize_width.setSingleStep(8)
+        self.resize_width.setValue(0)
+        resize_layout.addWidget(self.resize_width)
+        resize_layout.addWidget(QLabel('x'))
+        self.resize_height = QSpinBox()
+        self.resize_height.setFixedWidth(64)
+        self.resize_height.setRange(0, 8192)
+        self.resize_height.setSingleStep(8)
+        self.resize_height.setValue(0)
+        resize_layout.addWidget(self.resize_height)
+        resize_layout.addStretch(1)
+        self.resize_width.valueChanged.connect(self.on_resize_changed)
+        self.resize_height.valueChanged.connect(self.on_resize_changed)
+        layout.addLayout(resize_layout)
+
+        self.resize_filter_label = QLabel('Resize Filter')
+        self.resize_filter_combo = QComboBox()
+        self.resize_filter_combo.addItem('bicubic')
+        self.resize_filter_combo.addItem('lanczos')
+        self.resize_filter_combo.addItem('spline')
+        # Set the default value to "lanczos"
+        self.resize_filter_combo.setCurrentText('lanczos')
+        layout.addWidget(self.resize_filter_label)
+        layout.addWidget(self.resize_filter_combo)
+
+        self.convert_frame_rate_label = QLabel('Convert Frame Rate')
+        self.convert_frame_rate_input = CustomDoubleSpinBox()
+        self.convert_frame_rate_input.setFixedWidth(64)
+        self.convert_frame_rate_input.setRange(0, 240)
+        self.convert_frame_rate_input.setDecimals(2)
+        self.convert_frame_rate_input.setSingleStep(1)
+        self.convert_frame_rate_input.setValue(0)
+        self.convert_frame_rate_input.setSpecialValueText("None")
+        self.convert_frame_rate_input.valueChanged.connect(self.update_remux_label)
+        layout.addWidget(self.convert_frame_rate_label)
+        layout.addWidget(self.convert_frame_rate_input)
+
+        layout.addWidget(QLabel('Codec'))
+        self.codec_combo = QComboBox()
+        self.codec_combo.addItems(['x264', 'x265', 'ProRes'])
+        layout.addWidget(self.codec_combo)
+        self.codec_combo.setCurrentIndex(1)  # Set the x265 codec as default
+        self.codec_combo.currentIndexChanged.connect(self.on_codec_changed)
+
+        # x264/x265 pixel format radio buttons
+        self.pixel_format_frame = QFrame()
+        pixel_format_layout = QVBoxLayout(self.pixel_format_frame)
+        pixel_format_layout.setContentsMargins(0, 0, 0, 0)
+        pixel_format_layout.addWidget(QLabel('Pixel Format'))
+
+        self.pixel_format_buttons = self.create_radio_button_group(
+            ['8-bit 4:2:0', '10-bit 4:2:0', '10-bit 4:2:2'],
+            default_index=1,
+            layout=pixel_format_layout,
+            callback=self.update_output_file_name)
+
+        # ProRes profile radio buttons, built when ProRes is first selected
+        self.prores_profile_frame = QFrame()
+        self.prores_profile_buttons = None
+
+        # Add to main layout
+        layout.addWidget(self.pixel_format_frame)
+        layout.addWidget(self.prores_profile_frame)
+
+        self.crf_label = QLabel()
+        layout.addWidget(self.crf_label)
+        self.crf_slider = QSlider(Qt.Horizontal)
+        self.crf_slider.setRange(1, 32)
+        self.crf_slider.setValue(16)
+        self.crf_slider.setTickPosition(QSlider.TicksBelow)
+        self.crf_slider.setTickInterval(1)
+        self.crf_slider.valueChanged.connect(self.update_crf_label)
+        layout.addWidget(self.crf_slider)
+        self.update_crf_label(self.crf_slider.value())
+
+        self.audio_frame = QFrame()
+        audio_layout = QVBoxLayout(self.audio_frame)
+        audio_layout.setContentsMargins(0, 0, 0, 0)
+        self.audio_codec_combo = QComboBox()
+        self.audio_codec_combo.addItem("None")
+        self.audio_codec_combo.addItem("AAC")
+        self.audio_codec_combo.addItem("PCM 16-bit")
+        self.audio_codec_combo.addItem("PCM 24-bit")
+        self.audio_codec_combo.setCurrentIndex(1)
+        audio_layout.addWidget(QLabel('Audio Codec'))
+        audio_layout.addWidget(self.audio_codec_combo)
+
+        self.audio_codec_combo.currentTextChanged.connect(
+            lambda codec: self.audio_bitrate_input.setEnabled(codec == "AAC"))
+
+        audio_layout.addWidget(QLabel('Audio Bitrate (kbps)'))
+        self.audio_bitrate_input = QSpinBox()
+        self.audio_bitrate_input.setFixedWidth(64)
+        self.audio_bitrate_input.setRange(32, 512)
+        self.audio_bitrate_input.setSingleStep(64)
+        self.audio_bitrate_input.setValue(320)
+        audio_layout.addWidget(self.audio_bitrate_input)
+
+        self.audio_direct_stream_copy = QCheckBox('direct stream copy')
+        audio_layout.addWidget(self.audio_direct_stream_copy)
+
+        self.audio_direct_stream_copy.stateChanged.connect(
+            lambda state: (
+                self.audio_codec_combo.setEnabled(state == Qt.Unchecked),
+                self.audio_bitrate_input.setEnabled(state == Qt.Unchecked)
+            )
+        )
+
+        layout.addWidget(self.audio_frame)
+
+        self.preset_frame = QFrame()
+        preset_layout = QVBoxLayout(self.preset_frame)
+        preset_layout.setContentsMargins(0, 0, 0, 0)
+        preset_layout.addWidget(QLabel('Preset'))
+        self.preset_combo = QComboBox()
+        self.preset_combo.addItems(
+            ['veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow'])
+        preset_layout.addWidget(self.preset_combo)
+        # Set the 'slow' preset as default
+        self.preset_combo.setCurrentIndex(4)
+        self.preset_combo.currentIndexChanged.connect(self.on_parallel_jobs_changed)
+
+        self.keyframe_interval_label = QLabel('Keyframe Interval')
+        self.keyframe_interval_spinbox = QSpinBox()
+        self.keyframe_interval_spinbox.setFixedWidth(64)
+        self.keyframe_interval_spinbox.setRange(1, 1000)
+        self.keyframe_interval_spinbox.setValue(250)
+        preset_layout.addWidget(self.keyframe_interval_label)
+        preset_layout.addWidget(self.keyframe_interval_spinbox)
+
+        self.tune_grain = QCheckBox("grain retention")
+        preset_layout.addWidget(self.tune_grain)
+
+        # Auto-tune samples the input and overrides the preset and CRF above
+        preset_layout.addWidget(QLabel('Auto-tune'))
+        self.auto_tune_combo = QComboBox()
+        self.auto_tune_combo.addItems(['Off', 'Quality floor (SSIM)', 'Speed target (x realtime)'])
+        self.auto_tune_combo.currentIndexChanged.connect(self.on_auto_tune_changed)
+        preset_layout.addWidget(self.auto_tune_combo)
+        self.auto_tune_target = QDoubleSpinBox()
+        self.auto_tune_target.setFixedWidth(64)
+        preset_layout.addWidget(self.auto_tune_target)
+        self.on_auto_tune_changed(0)
+
+        layout.addWidget(self.preset_frame)
+
+        layout.addWidget(QLabel('Output Folder'))
+        self.output_folder_input = QLineEdit()
+        self.output_button = QPushButton('Browse')
+        self.output_button.clicked.connect(self.select_output_folder)
+        output_layout = QHBoxLayout()
+        output_layout.addWidget(self.output_folder_input)
+        output_layout.addWidget(self.output_button)
+        layout.addLayout(output_layout)
+        default_output_folder = QStandardPaths.writableLocation(
+            QStandardPaths.DocumentsLocation)
+        self.output_folder_input.setText(default_output_folder)
+
+        layout.addWidget(QLabel('Output File'))
+        self.output_file_input = QLineEdit()
+        layout.addWidget(self.output_file_input)
+
+        renditions_layout = QHBoxLayout()
+        self.renditions_label = QLabel()
+        self.renditions_label.setWordWrap(True)
+        renditions_layout.addWidget(self.renditions_label, 1)
+        self.add_rendition_button = QPushButton('Add Rendition')
+        self.add_rendition_button.setToolTip(
+            'Also write an output with the current codec, size and quality settings, '
+            'from the same decode as the job')
+        self.add_rendition_button.clicked.connect(self.add_rendition)
+        renditions_layout.addWidget(self.add_rendition_button)
+        self.clear_renditions_button = QPushButton('Clear')
+        self.clear_renditions_button.clicked.connect(self.clear_renditions)
+        renditions_layout.addWidget(self.clear_renditions_button)
+        layout.addLayout(renditions_layout)
+        self.update_renditions_label()
+
+        self.remux_checkbox = QCheckBox('Copy video when the source already matches')
+        self.remux_checkbox.setToolTip(
+            "Only swaps audio or rewraps the container; CRF, preset, keyframe interval and "
+            "colour tags are not applied to a copy")
+        self.remux_checkbox.setChecked(DEFAULT_SPEC['remux'])
+        self.remux_checkbox.toggled.connect(self.update_remux_label)
+        layout.addWidget(self.remux_checkbox)
+        self.remux_label = QLabel()
+        self.remux_label.setWordWrap(True)
+        layout.addWidget(self.remux_label)
+
+        layout.addWidget(QLabel('Queue'))
+        self.queue_list = QListWidget()
+        self.queue_list.setMaximumHeight(120)
+        layout.addWidget(self.queue_list)
+
+        queue_buttons_layout = QHBoxLayout()
+        self.add_to_queue_button = QPushButton('Add')
+        self.add_to_queue_button.clicked.connect(self.add_to_queue)
+        self.move_up_button = QPushButton('Up')
+        self.move_up_button.clicked.connect(lambda: self.move_selected_job(-1))
+        self.move_down_button = QPushButton('Down')
+        self.move_down_button.clicked.connect(lambda: self.move_selected_job(1))
+        self.cancel_job_button = QPushButton('Cancel')
+        self.cancel_job_button.clicked.connect(self.cancel_selected_job)
+        self.clear_queue_button = QPushButton('Clear')
+        self.clear_queue_button.clicked.connect(self.clear_finished_jobs)
+        queue_buttons_layout.addWidget(self.add_to_queue_button)
+        queue_buttons_layout.addWidget(self.move_up_button)
+        queue_buttons_layout.addWidget(self.move_down_button)
+        queue_buttons_layout.addWidget(self.cancel_job_button)
+        queue_buttons_layout.addWidget(self.clear_queue_button)
+        layout.addLayout(queue_buttons_layout)
+
+        parallel_jobs_layout = QHBoxLayout()
+        parallel_jobs_layout.addWidget(QLabel('Parallel Jobs'))
+        self.parallel_jobs_input = QSpinBox()
+        self.parallel_jobs_input.setFixedWidth(64)
+        self.parallel_jobs_input.setRange(0, 64)
+        self.parallel_jobs_input.setValue(0)
+        self.parallel_jobs_input.setSpecialValueText("Auto")
+        self.parallel_jobs_input.valueChanged.connect(self.on_parallel_jobs_changed)
+        parallel_jobs_layout.addWidget(self.parallel_jobs_input)
+        parallel_jobs_layout.addWidget(QLabel('Threads'))
+        self.threads_input = QSpinBox()
+        self.threads_input.setFixedWidth(64)
+        self.threads_input.setRange(0, 256)
+        self.threads_input.setValue(0)
+        self.threads_input.setSpecialValueText("Auto")
+        self.threads_input.setToolTip(
+            'Threads per job; Auto shares the cores among the jobs running at once')
+        parallel_jobs_layout.addWidget(self.threads_input)
+        self.chunked_checkbox = QCheckBox('Split into segments')
+        self.chunked_checkbox.setToolTip(
+            'Encode a long video or image sequence as parallel segments and join them losslessly')
+        parallel_jobs_layout.addWidget(self.chunked_checkbox)
+        self.resumable_checkbox = QCheckBox('Resumable')
+        self.resumable_checkbox.setToolTip(
+            'Encode in checkpointed segments, so a stopped or crashed encode can resume')
+        parallel_jobs_layout.addWidget(self.resumable_checkbox)
+        self.stage_checkbox = QCheckBox('Stage locally')
+        self.stage_checkbox.setToolTip(
+            'Encode to local scratch space and copy the finished file to a network share')
+        parallel_jobs_layout.addWidget(self.stage_checkbox)
+        parallel_jobs_layout.addWidget(QLabel('Priority'))
+        self.priority_combo = QComboBox()
+        self.priority_combo.addItems([priority.capitalize() for priority in PRIORITIES])
+        self.priority_combo.setToolTip(
+            'Background encodes only use CPU time and disk access nothing else wants, '
+            'so the workstation stays responsive')
+        parallel_jobs_layout.addWidget(self.priority_combo)
+        self.pin_checkbox = QCheckBox('Pin to cores')
+        self.pin_checkbox.setToolTip(
+            'Give each running job cores of its own, on one NUMA node where they fit')
+        parallel_jobs_layout.addWidget(self.pin_checkbox)
+        parallel_jobs_layout.addStretch(1)
+        self.throughput_label = QLabel()
+        parallel_jobs_layout.addWidget(self.throughput_label)
+        layout.addLayout(parallel_jobs_layout)
+
+        self.encode_button = QPushButton('Start')
+        self.encode_button.setMinimumSize(0, 32)
+        self.encode_button.clicked.connect(self.encode_video)
+
+        self.stop_button = QPushButton('Stop', self)
+        self.stop_button.setMinimumSize(0, 32)
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_encoding)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.encode_button)
+        button_layout.addWidget(self.stop_button)
+        layout.addLayout(button_layout)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximum(1000)
+        layout.addWidget(self.progress_bar)
+        self.progress_bar_opacity = QGraphicsOpacityEffect(self.progress_bar)
+        self.progress_bar.setGraphicsEffect(self.progress_bar_opacity)
+        self.progress_bar_opacity.setOpacity(0.0)
+
+        self.show_console_output_checkbox = QCheckBox("Show console output")
+        layout.addWidget(self.show_console_output_checkbox)
+
+        # The console view is built the first time it is shown
+        self.console_output = None
+        self.console_layout = QVBoxLayout()
+        self.console_layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(self.console_layout)
+        self.show_console_output_checkbox.stateChanged.connect(self.toggle_console_output)
+
+        self.console_flush_timer = QTimer(self)
+        self.console_flush_timer.setInterval(CONSOLE_FLUSH_INTERVAL)
+        self.console_flush_timer.timeout.connect(self.flush_console)
+
+        self.setLayout(layout)
+
+        self.on_resize_changed()
+        self.on_codec_changed(self.codec_combo.currentIndex())
+
+        self.scheduler_bridge.job_updated.connect(self.on_job_updated)
+        self.scheduler_bridge.job_finished.connect(self.on_job_finished)
+        self.scheduler_bridge.jobs_added.connect(self.on_jobs_added)
+        self.scheduler_bridge.queue_finished.connect(self.encoding_finished)
+        self.probe_bridge.probe_finished.connect(self.on_probe_finished)
+        self.probe_bridge.thumbnails_finished.connect(self.on_thumbnails_finished)
+
+    @staticmethod
+    def create_radio_button_group(labels, default_index, layout, callback, row_count=1):
+        button_group = QButtonGroup()
+        radio_buttons = []
+
+        for i, label in enumerate(labels):
+            radio_button = QRadioButton(label)
+            button_group.addButton(radio_button)
+            radio_button.toggled.connect(callback)
+
+            if row_count > 1:
+                # Compute grid position
+                position = (i % row_count + 1, i // row_count)
+                layout.addWidget(radio_button, *position)
+            else:  # Default to vertical layout
+                layout.addWidget(radio_button)
+
+            radio_buttons.append(radio_button)
+
+        radio_buttons[default_index].setChecked(True)
+
+        return radio_buttons
+
+    def build_prores_profiles(self):
+        prores_profile_layout = QGridLayout(self.prores_profile_frame)
+        prores_profile_layout.addWidget(QLabel('Profile'), 0, 0, 1, -1)
+        prores_profile_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.prores_profile_buttons = self.create_radio_button_group(
+            ['proxy', 'lt', 'standart', 'hq', '4444', '4444hq'],
+            default_index=PRORES_PROFILES.index(DEFAULT_SPEC['prores_profile']),
+            layout=prores_profile_layout,
+            callback=self.update_output_file_name,
+            row_count=3)
+
+    def build_console_output(self):
+        self.console_output = QPlainTextEdit()
+        self.console_output.setReadOnly(True)
+        # Keep the view bounded; older lines are still in the per-job log files
+        self.console_output.setMaximumBlockCount(LOG_CAPACITY)
+        self.console_layout.addWidget(self.console_output)
+
+    def toggle_console_output(self, state):
+        if state == Qt.Checked:
+            if self.console_output is None:
+                self.build_console_output()
+            self.console_output.show()
+            sys.stdout = self.custom_stream
+            self.console_flush_timer.start()
+        else:
+            if self.console_output is not None:
+                self.console_output.hide()
+            sys.stdout = self.original_stdout
+            self.console_flush_timer.stop()
+            self.flush_console()
+
+    def flush_console(self):
+        # One insert per timer tick, however many lines were written meanwhile
+        lines = self.log_buffer.drain()
+        if lines and self.console_output is not None:
+            self.console_output.appendPlainText('\n'.join(lines))
+
+    def spec_from_widgets(self):
+        return make_spec(
+            input=self.video_input.text(),
+            audio=self.audio_input.text() or None,
+            output=self.output_file_input.text() or None,
+            output_folder=self.output_folder_input.text(),
+            frame_rate=self.frame_rate_input.value(),
+            resize_width=self.resize_width.value(),
+            resize_height=self.resize_height.value(),
+            resize_filter=self.resize_filter_combo.currentText(),
+            convert_frame_rate=self.convert_frame_rate_input.value(),
+            codec=self.codec_combo.currentText(),
+            pixel_format=PIXEL_FORMATS[self.get_pixel_format_index()],
+            prores_profile=PRORES_PROFILES[self.get_prores_profile_index()],
+            crf=self.crf_slider.value(),
+            preset=self.preset_combo.currentText(),
+            keyframe_interval=self.keyframe_interval_spinbox.value(),
+            tune_grain=self.tune_grain.isChecked(),
+            audio_codec=AUDIO_CODECS[self.audio_codec_combo.currentIndex()],
+            audio_bitrate=self.audio_bitrate_input.value(),
+            audio_copy=self.audio_direct_stream_copy.isChecked(),
+            remux=self.remux_checkbox.isChecked(),
+            in_point=self.in_point_input.text() if self.in_point_input.hasAcceptableInput() else None,
+            out_point=(self.out_point_input.text()
+                       if self.out_point_input.hasAcceptableInput() else None),
+            renditions=self.renditions,
+            chunked=self.chunked_checkbox.isChecked(),
+            resumable=self.resumable_checkbox.isChecked(),
+            threads=self.threads_input.value(),
+            prefetch=self.prefetch_input.value(),
+            stage=self.stage_checkbox.isChecked(),
+            priority=PRIORITIES[self.priority_combo.currentIndex()],
+            cpus='auto' if self.pin_checkbox.isChecked() else None,
+            auto_tune=AUTO_TUNE_MODES[self.auto_tune_combo.currentIndex()],
+            min_ssim=(self.auto_tune_target.value()
+                      if self.auto_tune_combo.currentIndex() == 1 else DEFAULT_SPEC['min_ssim']),
+            min_speed=(self.auto_tune_target.value()
+                       if self.auto_tune_combo.currentIndex() == 2 else DEFAULT_SPEC['min_speed']),
+        )
+
+    def update_output_file_name(self):
+        if self.output_base_name is not None:
+            self.output_file_input.setText(
+                output_file_name(self.spec_from_widgets(), self.output_base_name))
+        self.update_remux_label()
+
+    def add_rendition(self):
+        # The current settings become a rendition, so the job's own can be set next
+        spec = self.spec_from_widgets()
+        self.renditions.append({key: spec[key] for key in RENDITION_KEYS if key != 'output'})
+        self.update_renditions_label()
+        self.update_output_file_name()
+
+    def clear_renditions(self):
+        self.renditions = []
+        self.update_renditions_label()
+        self.update_output_file_name()
+
+    def update_renditions_label(self):
+        names = [output_file_name(make_spec(rendition), '').strip()
+                 for rendition in self.renditions]
+        self.renditions_label.setText('Renditions: ' + (', '.join(names) if names else 'none'))
+        self.clear_renditions_button.setEnabled(bool(names))
+
+    def update_remux_label(self):
+        # Tells whether the current input would be copied or re-encoded, and why
+        if self.remux_label is None:
+            return
+        if self.video_file_info is None or not self.video_input.text():
+            self.remux_label.setText('')
+            return
+        self.remux_label.setText(remux_check(self.spec_from_widgets(), self.video_file_info)[1])
+
+    def on_resize_changed(self):
+        enable_filter = self.resize_width.value() > 0 or self.resize_height.value() > 0
+        self.resize_filter_label.setEnabled(enable_filter)
+        self.resize_filter_combo.setEnabled(enable_filter)
+        self.update_output_file_name()
+
+    def on_codec_changed(self, index):
+        codec = self.codec_combo.itemText(index).lower()
+        if codec == 'x264' or codec == 'x265':
+            self.prores_profile_frame.hide()
+            self.pixel_format_frame.show()
+            if codec == 'x264':
+                self.pixel_format_buttons[0].setChecked(True)
+            else:
+                self.pixel_format_buttons[1].setChecked(True)
+            self.preset_frame.setEnabled(True)
+        elif codec == 'prores':
+            self.pixel_format_frame.hide()
+            if self.prores_profile_buttons is None:
+                self.build_prores_profiles()
+            self.prores_profile_frame.show()
+            self.preset_frame.setEnabled(False)
+        self.update_output_file_name()
+        self.on_parallel_jobs_changed()
+
+    def on_auto_tune_changed(self, index):
+        mode = AUTO_TUNE_MODES[index]
+        self.auto_tune_target.setEnabled(mode is not None)
+        if mode == 'speed':
+            self.auto_tune_target.setDecimals(2)
+            self.auto_tune_target.setRange(0.05, 100.0)
+            self.auto_tune_target.setSingleStep(0.25)
+            self.auto_tune_target.setValue(DEFAULT_SPEC['min_speed'])
+        else:
+            self.auto_tune_target.setDecimals(3)
+            self.auto_tune_target.setRange(0.5, 1.0)
+            self.auto_tune_target.setSingleStep(0.001)
+            self.auto_tune_target.setValue(DEFAULT_SPEC['min_ssim'])
+
+    def update_crf_label(self, value):
+        self.crf_label.setText(f"Quality (CRF): {value}")
+        self.update_output_file_name()
+
+    def browse_videos(self):
+        video_files, _ = QFileDialog.getOpenFileNames()
+
+        if len(video_files) > 1:
+            self.add_files_to_queue(video_files)
+        elif video_files:
+            self.select_video(video_files[0])
+
+    def select_video(self, video_file=None):
+        if video_file is None:
+            video_file, _ = QFileDialog.getOpenFileName()
+
+        if video_file:
+            video_file, self.output_base_name, is_sequence = parse_input(video_file)
+            # Show the frame rate selector only for image sequences
+            self.frame_rate_label.setVisible(is_sequence)
+            self.frame_rate_input.setVisible(is_sequence)
+            self.prefetch_label.setVisible(is_sequence)
+            self.prefetch_input.setVisible(is_sequence)
+
+            self.video_input.setText(video_file)
+            # Probe in the background; Start is enabled again once the result is in
+            self.video_file_info = None
+            self.request_probe(video_file)
+            self.update_output_file_name()
+
+    def select_audio(self, audio_file=None):
+        if audio_file is None:
+            audio_file, _ = QFileDialog.getOpenFileName()
+
+        if audio_file:
+            self.audio_input.setText(audio_file)
+
+    def select_output_folder(self):
+        output_folder = QFileDialog.getExistingDirectory(
+            self, "Select Output Folder")
+
+        if output_folder:
+            self.output_folder_input.setText(output_folder)
+
+    def get_pixel_format_index(self):
+        return next((i for i, button in enumerate(self.pixel_format_buttons)
+                     if button.isChecked()), "0")
+
+    def get_prores_profile_index(self):
+        if self.prores_profile_buttons is None:
+            return PRORES_PROFILES.index(DEFAULT_SPEC['prores_profile'])
+        return next((i for i, button in enumerate(self.prores_profile_buttons)
+                     if button.isChecked()), "0")
+
+    def check_file_overwrite(self, output_file):
+        if os.path.exists(output_file):
+            reply = QMessageBox.question(
+                self, "Overwrite existing file?",
+                f"The file '{output_file}' already exists. Do you want to overwrite it?",
+                QMessageBox.Yes | QMessageBox.No)
+
+            if reply == QMessageBox.No:
+                return False
+
+        return True
+
+    def check_resume(self, output_file):
+        # None if there is nothing to resume, else whether to resume it
+        from triada.segments import discard_segments, interrupted_encode
+        status = interrupted_encode(output_file)
+        if status is None:
+            return None
+        done, total = status
+        reply = QMessageBox.question(
+            self, "Resume interrupted encode?",
+            f"The encode of '{output_file}' was interrupted with {done} of {total} segments "
+            "finished. Resume from the last finished segment? No starts over.",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+
+        if reply == QMessageBox.Cancel:
+            return False
+        if reply == QMessageBox.No:
+            discard_segments(output_file)
+            return None
+        return True
+
+    def check_queue_output(self, output_file, spec):
+        # False to leave the output alone, 'resume' to continue an interrupted encode
+        try:
+            output_files = rendition_outputs(output_file, spec)
+        except ValueError as error:
+            print(error)
+            return False
+        if any(self.is_queued(path) for path in output_files):
+            print(f"'{output_file}' is already in the queue")
+            return False
+
+        resume = self.check_resume(output_file)
+        if resume is False:
+            return False
+        if not all(self.check_file_overwrite(path) for path in output_files):
+            return False
+        return 'resume' if resume else True
+
+    def enqueue(self, spec, file_info, output_file):
+        # Probing (if needed) and job planning run in the background; jobs are
+        # queued in the order they were requested
+        entry = {'spec': spec, 'output_file': output_file, 'info': file_info,
+                 'done': False, 'jobs': None}
+        self.pending_adds.append(entry)
+        self.probe_service.submit(spec['input'], self.probe_bridge.probe_finished.emit,
+                                  context=entry, probe=lambda _: self.plan_entry(entry))
+        self.update_buttons()
+
+    def plan_entry(self, entry):
+        # Runs on a probe worker thread. Job planning pulls in the encoding modules,
+        # which the window doesn't need to open.
+        from triada.jobs import jobs_for_spec
+        if entry['info'] is None:
+            entry['info'] = get_file_info(entry['spec']['input'])
+        return jobs_for_spec(entry['spec'], entry['info'], entry['output_file'],
+                             self.scheduler.capacity(entry['spec']))
+
+    def add_jobs(self, jobs):
+        for job in jobs:
+            job.log = JobLog(job_log_path(self.log_dir, job))
+            self.add_job_item(job)
+            self.scheduler.add(job)
+
+        if self.queue_running:
+            self.scheduler.start()
+
+    def add_job_item(self, job, row=None):
+        if job.cmd:
+            print("FFmpeg command:", " ".join(job.cmd))
+        item = QListWidgetItem()
+        item.setData(Qt.UserRole, job.job_id)
+        if row is None:
+            self.queue_list.addItem(item)
+        else:
+            self.queue_list.insertItem(row, item)
+        self.update_job_item(job)
+
+    def open_added_jobs(self, jobs):
+        # Runs on a scheduler thread for the jobs an auto-tune job queued in its
+        # place: they get their logs before they can start, and their list items
+        # on the GUI thread
+        for job in jobs:
+            job.log = JobLog(job_log_path(self.log_dir, job))
+        self.scheduler_bridge.jobs_added.emit(jobs)
+
+    def on_jobs_added(self, jobs):
+        # Listed after the job before them in the queue, which is the tune job
+        queued = list(self.scheduler.jobs)
+        index = queued.index(jobs[0]) if jobs[0] in queued else 0
+        previous = queued[index - 1].job_id if index else None
+        row = next((row + 1 for row in range(self.queue_list.count())
+                    if self.queue_list.item(row).data(Qt.UserRole) == previous), None)
+        for offset, job in enumerate(jobs):
+            self.add_job_item(job, row + offset if row is not None else None)
+        self.update_progress()
+
+    def add_to_queue(self):
+        video_file = self.video_input.text()
+
+        if not video_file or self.video_file_info is None:
+            return
+
+        output_file = os.path.join(self.output_folder_input.text(),
+                                   self.output_file_input.text())
+
+        spec = self.spec_from_widgets()
+        accepted = self.check_queue_output(output_file, spec)
+        if accepted:
+            if accepted == 'resume':
+                spec['resumable'] = True
+            self.enqueue(spec, self.video_file_info, output_file)
+
+    def add_files_to_queue(self, video_files):
+        # Each file becomes a job with a snapshot of the current settings
+        settings = self.spec_from_widgets()
+        for video_file in video_files:
+            video_file, base_name, _ = parse_input(video_file)
+            spec = make_spec(settings, input=video_file, output=None)
+            output_file = output_path(spec, base_name)
+            accepted = self.check_queue_output(output_file, spec)
+            if accepted:
+                if accepted == 'resume':
+                    spec['resumable'] = True
+                self.enqueue(spec, None, output_file)
+
+    def request_probe(self, video_file):
+        if self.probe_request is not None:
+            self.probe_request.cancel()
+        self.probe_request = self.probe_service.submit(
+            video_file, self.probe_bridge.probe_finished.emit)
+        self.update_buttons()
+
+    def on_probe_finished(self, request, result, error):
+        if error is not None:
+            action = "queue" if request.context is not None else "probe"
+            print(f"Could not {action} '{request.file_path}': {error!r}")
+
+        if request.context is None:
+            # Probe of the current input; ignore results for superseded inputs
+            if request is not self.probe_request:
+                return
+            self.probe_request = None
+            self.video_file_info = result
+            if result is not None and gap_warning(request.file_path, result):
+                print(gap_warning(request.file_path, result))
+            self.update_remux_label()
+            self.request_thumbnails(request.file_path, result)
+        else:
+            request.context['jobs'] = result
+            request.context['done'] = True
+            while self.pending_adds and self.pending_adds[0]['done']:
+                entry = self.pending_adds.pop(0)
+                if entry['jobs']:
+                    self.add_jobs(entry['jobs'])
+
+        self.update_buttons()
+
+    def request_thumbnails(self, video_file, file_info):
+        if self.thumbnail_request is not None:
+            self.thumbnail_request.cancel()
+        self.show_thumbnails([])
+        if file_info is None:
+            return
+        self.thumbnail_request = self.probe_service.submit(
+            video_file, self.probe_bridge.thumbnails_finished.emit,
+            probe=lambda path: thumbnail_strip(path, file_info))
+
+    def on_thumbnails_finished(self, request, result, error):
+        if request is not self.thumbnail_request:
+            return
+        self.thumbnail_request = None
+        if error is not None:
+            print(f"Could not make thumbnails of '{request.file_path}': {error}")
+        self.show_thumbnails(result or [])
+
+    def show_thumbnails(self, thumbnails):
+        for index, label in enumerate(self.thumbnail_labels):
+            if index < len(thumbnails):
+                label.setPixmap(QPixmap(thumbnails[index]).scaledToWidth(
+                    label.width(), Qt.SmoothTransformation))
+                label.show()
+            else:
+                label.clear()
+                label.hide()
+
+    def update_buttons(self):
+        # Start waits for pending probes, the job settings depend on their results
+        probing = self.probe_request is not None or bool(self.pending_adds)
+        self.encode_button.setEnabled(not self.queue_running and not probing)
+        self.add_to_queue_button.setEnabled(not probing)
+
+    def is_queued(self, output_file):
+        return (self.scheduler.has_output(output_file) or
+                any(entry['output_file'] == output_file for entry in self.pending_adds))
+
+    def encode_video(self):
+        if self.video_input.text() and self.video_file_info is not None:
+            output_file = os.path.join(self.output_folder_input.text(),
+                                       self.output_file_input.text())
+            if not self.is_queued(output_file):
+                self.add_to_queue()
+
+        if not self.scheduler.pending() and not self.pending_adds:
+            return
+
+        self.queue_running = True
+        self.update_buttons()
+        self.stop_button.setEnabled(True)
+        self.progress_bar_opacity.setOpacity(1.0)
+        # Jobs still being planned start as soon as they are added
+        if self.scheduler.pending():
+            self.scheduler.start()
+
+    def stop_encoding(self):
+        self.stop_button.setEnabled(False)
+        self.queue_running = False
+        self.scheduler.stop()
+        self.update_buttons()
+
+    def selected_job_id(self):
+        item = self.queue_list.currentItem()
+        return item.data(Qt.UserRole) if item is not None else None
+
+    def move_selected_job(self, offset):
+        job_id = self.selected_job_id()
+        if job_id is None:
+            return
+        self.scheduler.move(job_id, offset)
+        self.refresh_queue_list()
+        for row in range(self.queue_list.count()):
+            if self.queue_list.item(row).data(Qt.UserRole) == job_id:
+                self.queue_list.setCurrentRow(row)
+
+    def cancel_selected_job(self):
+        job_id = self.selected_job_id()
+        if job_id is not None:
+            self.scheduler.cancel(job_id)
+
+    def clear_finished_jobs(self):
+        self.scheduler.clear_finished()
+        self.refresh_queue_list()
+
+    def refresh_queue_list(self):
+        self.queue_list.clear()
+        for job in self.scheduler.jobs:
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, job.job_id)
+            self.queue_list.addItem(item)
+            self.update_job_item(job)
+
+    def update_job_item(self, job):
+        for row in range(self.queue_list.count()):
+            item = self.queue_list.item(row)
+            if item.data(Qt.UserRole) == job.job_id:
+                text = f"{job.name}  [{job.state}]"
+                if job.state == 'running':
+                    text += f"  {format_status(job.tracker)}"
+                elif job.state == 'queued' and job.depends_on:
+                    text += f"  {job.progress:.0%}"
+                item.setText(text)
+                break
+
+    def on_parallel_jobs_changed(self):
+        self.scheduler.max_jobs = self.parallel_jobs_input.value()
+        if self.scheduler.max_jobs == 0:
+            codec = CODECS[self.codec_combo.currentText()]
+            preset = self.preset_combo.currentText() if codec != "prores_ks" else None
+            auto_jobs = max_concurrent_jobs(codec, preset, self.scheduler.total_cores)
+            self.parallel_jobs_input.setSpecialValueText(f"Auto ({auto_jobs})")
+
+    def on_job_updated(self, job):
+        self.update_job_item(job)
+        for dependent in self.scheduler.dependents(job):
+            self.update_job_item(dependent)
+        self.update_progress()
+
+    def on_job_finished(self, job):
+        self.update_job_item(job)
+        self.update_progress()
+        print(f"{job.action} {job.state}: {job.output_file} (log: {job.log.path})")
+
+    def update_progress(self):
+        self.progress_bar.setValue(int(self.scheduler.overall_progress() * 1000))
+        self.throughput_label.setText(f"{self.scheduler.throughput():.1f} fps")
+
+    def closeEvent(self, event):  # pylint: disable=invalid-name
+        self.probe_service.shutdown()
+        self.scheduler.stop()
+        super().closeEvent(event)
+
+    def encoding_finished(self):
+        if self.queue_running and self.pending_adds:
+            return  # more jobs are still being planned
+
+        self.progress_bar.setValue(0)
+        self.queue_running = False
+        self.update_buttons()
+        self.stop_button.setEnabled(False)
+        self.progress_bar_opacity.setOpacity(0.0)
+        self.throughput_label.clear()
+        print("Encoding finished")
+
+def main():
+    app = QApplication(sys.argv)
+    window = FFmpegGUI()
+    window.show()
+    return app.exec_()
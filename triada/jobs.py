@@ -0,0 +1,126 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+from triada.autotune import needs_sampling, tune_spec
+from triada.command import (build_command, build_multi_command, build_remux_command, encoder,
+                            make_spec, output_duration, remux_check, rendition_outputs,
+                            retarget_output)
+from triada.prefetch import sequence_prefetcher
+from triada.priority import scheduling_profile
+from triada.staging import PartialOutputs, staging_for
+from triada.scheduler import EncodeJob, cores_per_job
+from triada.segments import chunked_jobs, make_segment_job
+
+
+def make_job(spec, file_info, output_file):
+    codec = encoder(spec)
+    preset = spec['preset'] if codec != "prores_ks" else None
+    # Automatic threads are settled when the job starts; until then the command
+    # shows the cores the scheduler reserves for it
+    cores = cores_per_job(codec, preset)
+    job = EncodeJob(build_command(spec, file_info, output_file, cores), spec['input'],
+                    output_file, codec, preset=preset,
+                    frame_count=file_info['frame_count'],
+                    duration=output_duration(spec, file_info))
+    if spec['threads'] == 0:
+        job.rebuild = lambda cores: build_command(spec, file_info, output_file, cores)
+    job.prefetch = sequence_prefetcher(spec, file_info)
+    job.task = {'spec': spec, 'file_info': file_info, 'output_file': output_file}
+    return job
+
+
+def make_remux_job(spec, file_info, output_file):
+    # Only reads and writes, so it reserves a single core like a join
+    return EncodeJob(build_remux_command(spec, file_info, output_file), spec['input'],
+                     output_file, 'copy', frame_count=file_info['frame_count'],
+                     duration=output_duration(spec, file_info))
+
+
+def make_multi_job(spec, file_info, output_file):
+    # One job writing the job's output and every rendition from a single decode
+    codec = encoder(spec)
+    preset = spec['preset'] if codec != "prores_ks" else None
+    output_files = rendition_outputs(output_file, spec)
+    cores = cores_per_job(codec, preset)
+    job = EncodeJob(build_multi_command(spec, file_info, output_files, cores), spec['input'],
+                    output_file, codec, preset=preset,
+                    frame_count=file_info['frame_count'],
+                    duration=output_duration(spec, file_info))
+    job.extra_outputs = output_files[1:]
+    if spec['threads'] == 0:
+        job.rebuild = lambda cores: build_multi_command(spec, file_info, output_files, cores)
+    job.prefetch = sequence_prefetcher(spec, file_info)
+    job.task = {'spec': spec, 'file_info': file_info, 'output_file': output_file}
+    return job
+
+
+def make_tune_job(spec, file_info, output_file, total_cores=None, restart=False):
+    # Auto-tune as a job of its own: it waits its turn in the queue, samples the
+    # candidates on the cores the encode will get, and queues the encode's jobs
+    # with the settings it picked
+    codec = encoder(spec)
+    preset = spec['preset'] if codec != "prores_ks" else None
+    job = EncodeJob([], spec['input'], output_file, codec, preset=preset,
+                    frame_count=file_info['frame_count'])
+
+    def work(job, log):
+        tuned = tune_spec(spec, file_info, log=log, cores=job.cores)
+        jobs = jobs_for_spec(make_spec(tuned, auto_tune=None), file_info,
+                             retarget_output(output_file, spec, tuned), total_cores, restart)
+        jobs[0].probe_seconds = None  # Accounted for by the tune job
+        return jobs
+
+    job.work = work
+    job.action = 'Auto-tune'
+    return job
+
+
+def jobs_for_spec(spec, file_info, output_file, total_cores=None, restart=False, tune=True):
+    # A stream copy when the source already matches, else one job, or segment
+    # jobs plus the job joining them for chunked and resumable encodes.
+    # Renditions are written by one job decoding once, so they are never chunked.
+    # restart discards the segments of an interrupted encode once a job starts.
+    # Auto-tune picks from earlier measurements right away; when it has to
+    # sample the source, a tune job does so once the queue gets to it, unless
+    # tune is False (dry runs), which plans with the settings as given.
+    jobs = None
+    if remux_check(spec, file_info)[0]:
+        jobs = [make_remux_job(spec, file_info, output_file)]
+    elif spec['auto_tune'] and needs_sampling(spec, file_info):
+        if tune:
+            jobs = [make_tune_job(spec, file_info, output_file, total_cores, restart)]
+    elif spec['auto_tune']:
+        tuned = tune_spec(spec, file_info)
+        output_file = retarget_output(output_file, spec, tuned)
+        spec = tuned
+    if jobs is None:
+        if spec['renditions']:
+            jobs = [make_multi_job(spec, file_info, output_file)]
+        elif (spec['chunked'] or spec['resumable']) and output_duration(spec, file_info):
+            jobs = chunked_jobs(spec, file_info, output_file, total_cores, restart)
+        if not jobs:
+            jobs = [make_job(spec, file_info, output_file)]
+    for job in jobs:
+        job.staging = staging_for(spec, [job.output_file] + job.extra_outputs)
+        job.scheduling = scheduling_profile(spec)
+    # The input was probed once, so only the first job accounts for it
+    jobs[0].probe_seconds = file_info.get('probe_seconds')
+    return jobs
+
+
+def job_for_task(task):
+    # The job a farm worker runs for a task sent by the dispatching machine: built
+    # here, so threads, read-ahead, staging and pinning follow this machine
+    spec = make_spec(task['spec'])
+    file_info = task['file_info']
+    if task.get('input_args') is not None:
+        job = make_segment_job(spec, file_info, task['output_file'], task['input_args'],
+                               task['duration'])
+    elif spec['renditions']:
+        job = make_multi_job(spec, file_info, task['output_file'])
+    else:
+        job = make_job(spec, file_info, task['output_file'])
+    output_files = [job.output_file] + job.extra_outputs
+    job.staging = staging_for(spec, output_files) or PartialOutputs(output_files)
+    job.scheduling = scheduling_profile(spec)
+    return job
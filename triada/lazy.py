@@ -0,0 +1,26 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import importlib
+
+
+class LazyModule:
+    # Stands in for a module until one of its attributes is first used, so that
+    # modules only needed for encoding don't slow down the GUI's start
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            # import_module holds the import lock, so threads may race for this
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
@@ -0,0 +1,106 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+
+# Lines kept in memory for the console view, no matter how long an encode runs
+LOG_CAPACITY = 5000
+JOB_LOG_TAIL = 200
+
+
+def default_log_dir():
+    return os.path.join(tempfile.gettempdir(), 'triada_ffmpeg', 'logs')
+
+
+def job_log_path(log_dir, job):
+    name = re.sub(r'[^\w.-]+', '_', os.path.splitext(job.name)[0])
+    return os.path.join(log_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{job.job_id}_{name}.log")
+
+
+class LogBuffer:
+    # Thread-safe ring buffer of log lines. Writers only append; the view takes
+    # the new lines in batches with drain() instead of one signal per write.
+    def __init__(self, capacity=LOG_CAPACITY):
+        self.capacity = capacity
+        self._lines = deque(maxlen=capacity)
+        self._pending = deque(maxlen=capacity)
+        self._partial = ''
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            lines = (self._partial + str(text)).split('\n')
+            self._partial = lines.pop()
+            for line in lines:
+                self._append(line)
+
+    def append(self, line):
+        with self._lock:
+            self._append(line)
+
+    def _append(self, line):
+        if len(self._pending) == self._pending.maxlen:
+            self._dropped += 1
+        self._lines.append(line)
+        self._pending.append(line)
+
+    def drain(self):
+        # New lines since the last drain, with a marker for any that overflowed
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            if self._dropped:
+                lines.insert(0, f"[... {self._dropped} lines dropped ...]")
+                self._dropped = 0
+            return lines
+
+    def lines(self):
+        with self._lock:
+            return list(self._lines)
+
+
+class JobLog:
+    # Per-job log: the full output spills to a file on disk, only the tail is kept
+    # in memory. A log folder that can't be written, or a disk that fills up,
+    # must not stop the job or the thread reading ffmpeg's output, so after the
+    # first error only the tail is kept.
+    def __init__(self, path, tail=JOB_LOG_TAIL):
+        self.path = path
+        self.tail = deque(maxlen=tail)
+        self.error = None  # the OSError that stopped writing to the file
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, line):
+        with self._lock:
+            self.tail.append(line)
+            if self.error is not None:
+                return
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+                self._file.write(line + '\n')
+            except OSError as error:
+                self.error = error
+                self.tail.append(f"Log file {self.path} disabled: {error}")
+                self._close_file()
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass  # Buffered lines that could not be flushed are in the tail
+            self._file = None
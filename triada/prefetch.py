@@ -0,0 +1,248 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from triada.command import encoder, sequence_range
+from triada.sequence import split_pattern
+
+PREFETCH_WORKERS = 8
+PREFETCH_MEMORY = 512  # MiB of frames held ahead of the encoder
+READ_CHUNK = 1024 * 1024
+# Progress arrives about twice a second, so between reports the encoder's
+# position is estimated from its rate; the dispatcher re-checks this often
+DISPATCH_INTERVAL = 0.05
+# How often the frame files ffmpeg has open are looked up, on Linux
+READ_POLL_INTERVAL = 0.02
+# Frames an encoder holds between reading a frame and writing it out: rate
+# control lookahead and B-frames plus frame threads. Elsewhere the demuxer's
+# read position is estimated as the output position plus this.
+ENCODER_DELAY = {
+    'libx264': {'veryfast': 20, 'faster': 30, 'fast': 40, 'medium': 50,
+                'slow': 60, 'slower': 70, 'veryslow': 70},
+    'libx265': {'veryfast': 25, 'faster': 25, 'fast': 25, 'medium': 30,
+                'slow': 35, 'slower': 50, 'veryslow': 50},
+    'prores_ks': {None: 4},
+}
+DEMUXER_QUEUE = 8  # packets ffmpeg queues between the demuxer and the decoder
+
+
+def sequence_files(pattern, first, count):
+    directory, prefix, digits, ext = split_pattern(pattern)
+    return [os.path.join(directory, f"{prefix}{frame:0{digits}d}{ext}")
+            for frame in range(first, first + count)]
+
+
+def encoder_delay(spec):
+    codec = encoder(spec)
+    delays = ENCODER_DELAY.get(codec, {})
+    return delays.get(spec['preset'], delays.get(None, 0)) + DEMUXER_QUEUE
+
+
+def sequence_prefetcher(spec, file_info, first=None, count=None):
+    # None unless read-ahead is on and the input is an image sequence. Reads the
+    # job's range unless given the frames of a segment.
+    if not spec['prefetch'] or '%' not in spec['input']:
+        return None
+    if first is None:
+        first, count = sequence_range(spec, file_info)
+    if count <= 0:
+        return None
+    return SequencePrefetcher(sequence_files(spec['input'], first, count), spec['frame_rate'],
+                              spec['prefetch'], spec['prefetch_memory'] * 1024 * 1024,
+                              delay=encoder_delay(spec))
+
+
+class SequencePrefetcher:
+    # The image2 demuxer opens and reads one frame at a time, so on network storage
+    # the encoder waits on every file's latency. This reads the next frames on a
+    # small thread pool, ahead of the frame ffmpeg reads, so they come from the page
+    # cache when ffmpeg opens them. At most `ahead` frames and max_bytes are held
+    # ahead of it.
+    # Where /proc lists the files a process has open, the frame ffmpeg reads is
+    # followed directly, and stall_seconds is the time it had a frame open that was
+    # not fetched yet. Elsewhere it is estimated from the output time plus the
+    # encoder's delay in frames. Either way it is close to the encode time when a
+    # job is I/O-bound and near zero when the encoder is the bottleneck.
+    def __init__(self, frame_files, frame_rate, ahead, max_bytes=PREFETCH_MEMORY * 1024 * 1024,
+                 workers=PREFETCH_WORKERS, delay=0):
+        self.frame_files = frame_files
+        self.frame_rate = frame_rate
+        self.ahead = ahead
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.delay = delay
+        directory = os.path.dirname(frame_files[0]) if frame_files else ''
+        self._directory = os.path.realpath(directory or '.')
+        self._indexes = {os.path.basename(path): index for index, path in enumerate(frame_files)}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._follower = None
+        self._reset()
+
+    def _reset(self):
+        self._done = [False] * len(self.frame_files)
+        self._sizes = [0] * len(self.frame_files)
+        self._next = 0  # next frame to fetch
+        self._position = 0  # frame the encoder has reached
+        self._rate = 0.0  # frames per second the encoder moves
+        self._held = 0  # bytes fetched ahead of the encoder
+        self._in_flight = 0
+        self._stopped = False
+        self._following = False  # True while the frames ffmpeg opens are followed
+        self._last_missed = None
+        self._last_update = time.monotonic()
+        self.stall_seconds = 0.0
+        self.missed_frames = 0
+        self.bytes_read = 0
+        self.read_seconds = 0.0  # summed over the workers
+
+    def start(self):
+        # Also restarts a stopped prefetcher, e.g. when a resumable job is run again
+        self.stop()
+        self._reset()
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in (self._thread, self._follower):
+            if thread is not None:
+                thread.join()
+        self._thread = self._follower = None
+
+    def attach(self, pid):
+        # Follows the frames the started ffmpeg opens, where /proc shows them
+        fd_dir = f"/proc/{pid}/fd"
+        if not os.path.isdir(fd_dir):
+            return
+        with self._condition:
+            self._following = True
+        self._follower = threading.Thread(target=self._follow, args=(fd_dir,), daemon=True)
+        self._follower.start()
+
+    def advance(self, seconds):
+        # Called with the encoder's output time as progress comes in. The frames
+        # the encoder still holds have been read already.
+        position = int((seconds or 0) * self.frame_rate) + self.delay
+        with self._condition:
+            self._move(min(len(self.frame_files), position), time.monotonic(),
+                       estimate_stalls=not self._following)
+
+    def _move(self, position, now, estimate_stalls=False):
+        if position > self._position:
+            if estimate_stalls:
+                missed = sum(not self._done[index] for index in range(self._position, position))
+                if missed:
+                    # The share of the interval spent on frames that were not ready
+                    self.missed_frames += missed
+                    self.stall_seconds += ((now - self._last_update) * missed /
+                                           (position - self._position))
+            self._rate = (position - self._position) / max(now - self._last_update, 1e-3)
+            self._held -= sum(self._sizes[index] for index in range(self._position, position)
+                              if self._done[index])
+            self._position = position
+            self._last_update = now
+            self._condition.notify_all()
+
+    def _open_frames(self, fd_dir):
+        # Indexes of the frame files ffmpeg has open, None once it has exited
+        try:
+            names = os.listdir(fd_dir)
+        except OSError:
+            return None
+        frames = []
+        for name in names:
+            try:
+                directory, base = os.path.split(os.readlink(os.path.join(fd_dir, name)))
+            except OSError:
+                continue
+            if directory == self._directory and base in self._indexes:
+                frames.append(self._indexes[base])
+        return frames
+
+    def _follow(self, fd_dir):
+        last = time.monotonic()
+        while True:
+            with self._condition:
+                self._condition.wait(READ_POLL_INTERVAL)
+                if self._stopped:
+                    return
+            frames = self._open_frames(fd_dir)
+            now = time.monotonic()
+            if frames is None:
+                return
+            if frames:
+                index = max(frames)
+                with self._condition:
+                    if not self._done[index]:
+                        # ffmpeg waits on a frame the readers have not fetched
+                        self.stall_seconds += now - last
+                        if index != self._last_missed:
+                            self.missed_frames += 1
+                            self._last_missed = index
+                    self._move(index, now)
+            last = now
+
+    def summary(self):
+        total = len(self.frame_files)
+        rate = self.bytes_read / self.read_seconds / 1e6 if self.read_seconds else 0.0
+        return (f"Read-ahead: {total - self.missed_frames} of {total} frames ready in time, "
+                f"{self.bytes_read / 1e6:.1f} MB at {rate:.1f} MB/s per reader, "
+                f"encoder stalled {self.stall_seconds:.1f} s on I/O")
+
+    def _wanted(self):
+        position = self._position + self._rate * (time.monotonic() - self._last_update)
+        return (not self._stopped and self._next < len(self.frame_files) and
+                self._next < position + self.ahead and self._held < self.max_bytes and
+                self._in_flight < self.workers)
+
+    def _dispatch(self):
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='prefetch') as executor:
+            while True:
+                with self._condition:
+                    while not self._stopped and self._next < len(self.frame_files) \
+                            and not self._wanted():
+                        self._condition.wait(DISPATCH_INTERVAL)
+                    if self._stopped or self._next >= len(self.frame_files):
+                        return
+                    index = self._next
+                    self._next += 1
+                    self._in_flight += 1
+                executor.submit(self._fetch, index)
+
+    def _fetch(self, index):
+        start = time.monotonic()
+        size = 0
+        try:
+            fd = os.open(self.frame_files[index], os.O_RDONLY)
+            try:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                # WILLNEED is only a hint, and NFS clients may ignore it; reading
+                # the file is what puts it in the local page cache
+                while True:
+                    chunk = os.read(fd, READ_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass  # ffmpeg reports missing or unreadable frames itself
+        with self._condition:
+            self._done[index] = True
+            self._sizes[index] = size
+            if index >= self._position:
+                self._held += size
+            self._in_flight -= 1
+            self.bytes_read += size
+            self.read_seconds += time.monotonic() - start
+            self._condition.notify_all()
@@ -0,0 +1,239 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import sys
+import threading
+
+# Nice level and I/O class of each priority. Background jobs also get the
+# SCHED_IDLE policy on Linux, so they only run on cores nothing else wants.
+PRIORITY_PROFILES = {
+    'normal': (None, None, None),
+    'low': (10, 'best-effort', 7),
+    'background': (19, 'idle', None),
+}
+IOPRIO_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+# ioprio_set has no wrapper in Python or glibc, so it is called by number
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'arm64': 30,
+    'armv7l': 314, 'ppc64le': 273, 'ppc64': 273, 's390x': 282, 'riscv64': 30,
+}
+# Windows priority classes, passed as creation flags
+WINDOWS_PRIORITY_CLASSES = {'low': 0x00004000, 'background': 0x00000040}
+NODE_DIR = '/sys/devices/system/node'
+
+
+def parse_cpu_list(text):
+    # CPU numbers from a Linux cpulist such as '0-3,8,10-11'
+    cpus = set()
+    for part in str(text).replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"Invalid CPU list {text!r}, expected e.g. '0-3,8'")
+        cpus.update(range(int(first), int(last or first) + 1))
+    if not cpus:
+        raise ValueError(f"Invalid CPU list {text!r}, expected e.g. '0-3,8'")
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def usable_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on Windows and macOS
+        return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    # {node: [cpus]} of the Linux NUMA nodes, or {} where there is no such information
+    try:
+        names = [name for name in os.listdir(NODE_DIR)
+                 if name.startswith('node') and name[4:].isdigit()]
+    except OSError:
+        return {}
+    nodes = {}
+    for name in names:
+        try:
+            with open(os.path.join(NODE_DIR, name, 'cpulist'), 'r', encoding='utf-8') as cpulist:
+                text = cpulist.read().strip()
+        except OSError:
+            continue
+        if text:
+            nodes[int(name[4:])] = parse_cpu_list(text)
+    return nodes
+
+
+def _ioprio_setter():
+    # A callable(pid, value) setting the I/O priority of a thread, or None
+    if not sys.platform.startswith('linux'):
+        return None
+    number = IOPRIO_SET_SYSCALLS.get(os.uname().machine.lower())
+    if number is None:
+        return None
+    try:
+        import ctypes  # pylint: disable=import-outside-toplevel
+        syscall = ctypes.CDLL(None, use_errno=True).syscall
+    except (ImportError, OSError, AttributeError):
+        return None
+
+    def ioprio_set(pid, value):
+        if syscall(number, IOPRIO_WHO_PROCESS, pid, value) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    return ioprio_set
+
+
+def _threads(pid):
+    # Thread ids of a Linux process, or just its pid elsewhere
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        return [pid]
+
+
+class SchedulingProfile:
+    # How the ffmpeg of a job is scheduled: its nice level, I/O class and level,
+    # the CPUs it may run on and whether it only gets otherwise idle CPU time.
+    # Everything is set from the parent as soon as ffmpeg runs, as a preexec_fn
+    # is not safe with the scheduler's threads, and no shell or wrapper program
+    # is involved. Linux sets these per thread, so the threads ffmpeg already
+    # started are set too; any it starts later inherit them.
+    def __init__(self, priority='normal', nice=None, io_class=None, io_level=None, cpus=None,
+                 numa_node=None):
+        default_nice, default_io_class, default_io_level = PRIORITY_PROFILES[priority]
+        self.priority = priority
+        self.nice = nice if nice is not None else default_nice
+        self.io_class = io_class or default_io_class
+        self.io_level = io_level if io_level is not None else default_io_level
+        self.idle = priority == 'background'
+        self.cpus = cpus  # None, 'auto' for a share picked by the scheduler, or a list
+        self.numa_node = numa_node
+
+    def is_default(self):
+        return (self.nice is None and self.io_class is None and not self.idle and
+                self.cpus is None and self.numa_node is None)
+
+    def describe(self, cpus=None):
+        parts = [f"{self.priority} priority"]
+        if self.nice is not None:
+            parts.append(f"nice {self.nice}")
+        if self.io_class is not None:
+            parts.append(f"{self.io_class} I/O" +
+                         (f" level {self.io_level}" if self.io_level is not None else ''))
+        if cpus:
+            parts.append(f"CPUs {format_cpu_list(cpus)}")
+        return ', '.join(parts)
+
+    def popen_args(self, cpus=None):  # pylint: disable=unused-argument
+        # Keyword arguments for subprocess.Popen applying this profile
+        if os.name == 'nt':
+            flags = WINDOWS_PRIORITY_CLASSES.get(self.priority, 0)
+            return {'creationflags': flags} if flags else {}
+        return {}
+
+    def after_start(self, process, cpus=None, log=print):
+        if os.name == 'nt':
+            # The affinity of the whole process is set once it runs
+            if cpus:
+                import ctypes  # pylint: disable=import-outside-toplevel
+                mask = sum(1 << cpu for cpu in cpus if cpu < 64)
+                ctypes.windll.kernel32.SetProcessAffinityMask(
+                    int(process._handle), mask)  # pylint: disable=protected-access
+            return
+        settings = []
+        if cpus and hasattr(os, 'sched_setaffinity'):
+            settings.append((f"CPUs {format_cpu_list(cpus)}",
+                             lambda tid: os.sched_setaffinity(tid, cpus)))
+        if self.idle and hasattr(os, 'SCHED_IDLE'):
+            settings.append(('SCHED_IDLE', lambda tid: os.sched_setscheduler(
+                tid, os.SCHED_IDLE, os.sched_param(0))))
+        if self.nice is not None:
+            settings.append((f"nice {self.nice}",
+                             lambda tid: os.setpriority(os.PRIO_PROCESS, tid, self.nice)))
+        ioprio_set = _ioprio_setter() if self.io_class is not None else None
+        if ioprio_set is not None:
+            ioprio = IOPRIO_CLASSES[self.io_class] << IOPRIO_CLASS_SHIFT | (self.io_level or 0)
+            settings.append((f"{self.io_class} I/O", lambda tid: ioprio_set(tid, ioprio)))
+        if not settings:
+            return
+        threads = _threads(process.pid)
+        for name, apply in settings:
+            # An unprivileged user can't raise a priority, which leaves the
+            # inherited one rather than failing the job
+            errors = set()
+            for tid in threads:
+                try:
+                    apply(tid)
+                except ProcessLookupError:
+                    pass  # The thread or ffmpeg itself has exited
+                except OSError as error:
+                    errors.add(error.strerror or str(error))
+            if errors:
+                log(f"Could not set {name} for ffmpeg (pid {process.pid}): "
+                    f"{', '.join(sorted(errors))}")
+
+
+def scheduling_profile(spec):
+    # None unless the spec asks for anything but the defaults
+    profile = SchedulingProfile(spec['priority'], spec['nice'], spec['io_class'],
+                                cpus=('auto' if spec['cpus'] == 'auto' else
+                                      parse_cpu_list(spec['cpus']) if spec['cpus'] else None),
+                                numa_node=spec['numa_node'])
+    return None if profile.is_default() else profile
+
+
+class CpuAllocator:
+    # Hands running jobs disjoint sets of CPUs, each within one NUMA node where
+    # it fits, so a job's threads share caches and its memory stays local
+    def __init__(self, cpus=None, nodes=None):
+        self.cpus = sorted(cpus) if cpus is not None else usable_cpus()
+        nodes = nodes if nodes is not None else numa_nodes()
+        self.nodes = {node: [cpu for cpu in node_cpus if cpu in self.cpus]
+                      for node, node_cpus in nodes.items()}
+        self.nodes = {node: node_cpus for node, node_cpus in self.nodes.items() if node_cpus}
+        if not self.nodes:
+            self.nodes = {0: self.cpus}
+        self._taken = set()
+        self._lock = threading.Lock()
+
+    def node_cpus(self, node):
+        if node not in self.nodes:
+            raise ValueError(f"No NUMA node {node}, this machine has "
+                             f"{', '.join(str(n) for n in sorted(self.nodes))}")
+        return list(self.nodes[node])
+
+    def allocate(self, count, node=None):
+        # Up to count free CPUs, from the given node only, or from the node with
+        # the most free CPUs and then the next ones; None when all are taken
+        with self._lock:
+            free = {n: [cpu for cpu in cpus if cpu not in self._taken]
+                    for n, cpus in self.nodes.items() if node is None or n == node}
+            order = sorted(free, key=lambda n: (len(free[n]) < count, -len(free[n]), n))
+            cpus = []
+            for n in order:
+                cpus += free[n][:count - len(cpus)]
+                if len(cpus) >= count:
+                    break
+            if not cpus:
+                return None
+            self._taken.update(cpus)
+            return sorted(cpus)
+
+    def release(self, cpus):
+        with self._lock:
+            self._taken.difference_update(cpus or [])
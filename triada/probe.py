@@ -0,0 +1,329 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from triada.lazy import lazy_import
+from triada.sequence import index_sequence
+
+ffmpeg = lazy_import('ffmpeg')
+
+PROBE_CACHE_MEMORY_SIZE = 256
+PROBE_CACHE_DISK_SIZE = 20000
+# Concurrent ffprobe processes, kept low so slow network storage isn't swamped
+PROBE_WORKERS = 4
+# Bumped when probe_file_info gains keys, so older cached results are not reused
+PROBE_INFO_VERSION = 3
+
+
+def default_cache_dir():
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'triada_ffmpeg')
+
+
+def cache_key(file_path):
+    # A file is considered unchanged while its path, size, mtime and inode stay the same
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+            PROBE_INFO_VERSION)
+
+
+def source_identity(spec, file_info):
+    # Identifies the source a job reads: files by cache key, sequences by their frames
+    if '%' in spec['input']:
+        return [os.path.abspath(spec['input']), file_info.get('start_number'),
+                file_info['frame_count']]
+    return list(cache_key(spec['input']))
+
+
+class ProbeCache:
+    # In-memory LRU in front of an on-disk SQLite store of probe results, so the
+    # ffprobe cost for a given file is paid once across sessions and batch runs.
+    def __init__(self, path=None, memory_size=PROBE_CACHE_MEMORY_SIZE,
+                 disk_size=PROBE_CACHE_DISK_SIZE):
+        self.path = path if path is not None else os.path.join(default_cache_dir(), 'probe.db')
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_ready = False
+
+    def _connect(self):
+        if self.path is None:
+            return None
+        try:
+            if not self._disk_ready:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            if not self._disk_ready:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS probe ('
+                    'key TEXT PRIMARY KEY, path TEXT, info TEXT, accessed REAL)')
+                connection.execute('CREATE INDEX IF NOT EXISTS probe_path ON probe (path)')
+                self._disk_ready = True
+            return connection
+        except (OSError, sqlite3.Error):
+            # Without a usable disk store the cache still works in memory
+            self.path = None
+            return None
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        info = None
+        connection = self._connect()
+        if connection is not None:
+            try:
+                with connection:
+                    row = connection.execute('SELECT info FROM probe WHERE key = ?',
+                                             (json.dumps(key),)).fetchone()
+                    if row is not None:
+                        info = json.loads(row[0])
+                        connection.execute('UPDATE probe SET accessed = ? WHERE key = ?',
+                                           (time.time(), json.dumps(key)))
+            except sqlite3.Error:
+                info = None
+            finally:
+                connection.close()
+
+        if info is not None:
+            self._remember(key, info)
+        return info
+
+    def put(self, key, info):
+        self._remember(key, info)
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO probe VALUES (?, ?, ?, ?)',
+                                   (json.dumps(key), key[0], json.dumps(info), time.time()))
+                # Evict the least recently used entries beyond the disk budget
+                connection.execute(
+                    'DELETE FROM probe WHERE key IN (SELECT key FROM probe '
+                    'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.disk_size,))
+        except sqlite3.Error:
+            pass  # A busy or read-only store only costs a future probe
+        finally:
+            connection.close()
+
+    def _remember(self, key, info):
+        with self._lock:
+            self._memory[key] = info
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def invalidate(self, file_path=None):
+        # Drop the entries for one file, or everything when no path is given
+        path = os.path.abspath(file_path) if file_path is not None else None
+        with self._lock:
+            for key in list(self._memory):
+                if path is None or key[0] == path:
+                    del self._memory[key]
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            with connection:
+                if path is None:
+                    connection.execute('DELETE FROM probe')
+                else:
+                    connection.execute('DELETE FROM probe WHERE path = ?', (path,))
+        finally:
+            connection.close()
+
+    def get_file_info(self, file_path):
+        try:
+            key = cache_key(file_path)
+        except OSError:
+            return probe_file_info(file_path)
+
+        info = self.get(key)
+        if info is None:
+            info = probe_file_info(file_path)
+            # Failed probes are not cached, the file may become readable later
+            if info['video_codec'] is not None or info['audio_stream_count'] > 0:
+                self.put(key, info)
+        return dict(info)
+
+
+_default_cache = None  # pylint: disable=invalid-name
+
+
+def default_probe_cache():
+    global _default_cache  # pylint: disable=global-statement,invalid-name
+    if _default_cache is None:
+        _default_cache = ProbeCache()
+    return _default_cache
+
+
+def get_file_info(file_path, cache=True):
+    # Image sequences are counted, not probed, so they bypass the probe cache.
+    # probe_seconds is how long this call took, cached or not, for telemetry.
+    start = time.monotonic()
+    if '%' in file_path or not cache:
+        info = probe_file_info(file_path)
+    else:
+        if cache is True:
+            cache = default_probe_cache()
+        info = cache.get_file_info(file_path)
+    info['probe_seconds'] = round(time.monotonic() - start, 4)
+    return info
+
+
+class ProbeRequest:
+    def __init__(self, file_path, context=None):
+        self.file_path = file_path
+        self.context = context
+        self.cancelled = False
+        self.future = None
+
+    def cancel(self):
+        # A probe that already started still runs, but its result is dropped
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+
+class ProbeService:
+    # Runs probes on a bounded pool of worker threads and hands the results to a
+    # callback, which is called from the worker thread.
+    def __init__(self, max_workers=PROBE_WORKERS, cache=True):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='probe')
+
+    def submit(self, file_path, callback, context=None, probe=None):
+        # probe replaces get_file_info for other background work on the same pool
+        request = ProbeRequest(file_path, context)
+        request.future = self._executor.submit(self._probe, request, callback, probe)
+        return request
+
+    def probe_all(self, file_paths):
+        # Blocking variant for batch runs: probes concurrently, returns in order
+        return list(self._executor.map(
+            lambda file_path: get_file_info(file_path, cache=self.cache), file_paths))
+
+    def _probe(self, request, callback, probe):
+        if request.cancelled:
+            return
+        result, error = None, None
+        try:
+            if probe is not None:
+                result = probe(request.file_path)
+            else:
+                result = get_file_info(request.file_path, cache=self.cache)
+        except Exception as probe_error:  # pylint: disable=broad-except
+            # e.g. ffprobe not found, or a bug in planning run through probe.
+            # The callback always runs, or whoever waits on it waits forever.
+            error = probe_error
+        if not request.cancelled:
+            callback(request, result, error)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def probe_file_info(file_path):
+    try:
+        frame_count = 0
+        duration = None
+        audio_stream_count = 0
+        is_rgb = False
+        video_codec = None
+        pixel_format = None
+        profile = None
+        width = height = None
+        frame_rate = None
+        start_number = None
+        start_time = 0.0
+        gaps = []
+
+        # Check if the input is an image sequence
+        if '%' in file_path:
+            try:
+                index = index_sequence(file_path)
+            except OSError:
+                index = None
+            if index is not None and index.count:
+                start_number = index.first
+                # The image2 demuxer stops reading at the first missing frame
+                frame_count = index.contiguous_count()
+                gaps = index.gaps
+            is_rgb = True
+        else:
+            probe = ffmpeg.probe(file_path)
+            streams = probe["streams"]
+            for stream in streams:
+                if stream['codec_type'] == 'video':
+                    pixel_format = stream.get('pix_fmt', '')
+                    is_rgb = pixel_format == "rgb" or pixel_format == "gbrp"
+                    frame_count = int(stream.get('nb_frames', 0))
+                    duration = float(stream.get('duration', 0))
+                    video_codec = stream.get('codec_name', '')
+                    profile = stream.get('profile')
+                    width = stream.get('width')
+                    height = stream.get('height')
+
+                    fps_str = stream.get('avg_frame_rate', stream.get('r_frame_rate', '0/1'))
+                    num, den = fps_str.split('/')
+                    fps = float(num) / float(den) if float(den) != 0 else 0
+                    frame_rate = fps or None
+                    # Packet timestamps count from here, while -ss counts from the start
+                    start_time = float(stream.get('start_time',
+                                                  probe.get('format', {}).get('start_time', 0)))
+
+                    # If frame_count is missing, calculate from duration and frame rate
+                    if frame_count == 0 and duration > 0 and fps > 0:
+                        frame_count = int(duration * fps)
+
+                if stream['codec_type'] == 'audio':
+                    audio_stream_count += 1
+
+        return {
+            'frame_count': frame_count,
+            'duration': duration,
+            'audio_stream_count': audio_stream_count,
+            'is_rgb': is_rgb,
+            'video_codec': video_codec,
+            'pixel_format': pixel_format,
+            'profile': profile,
+            'width': width,
+            'height': height,
+            'frame_rate': frame_rate,
+            'start_number': start_number,
+            'start_time': start_time,
+            'gaps': gaps,
+        }
+
+    except (ffmpeg.Error, KeyError, StopIteration):
+        return {
+            'frame_count': 0,
+            'duration': 0,
+            'audio_stream_count': 0,
+            'is_rgb': False,
+            'video_codec': None,
+            'pixel_format': None,
+            'profile': None,
+            'width': None,
+            'height': None,
+            'frame_rate': None,
+            'start_number': None,
+            'start_time': 0.0,
+            'gaps': [],
+        }
@@ -0,0 +1,130 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import time
+
+# ffmpeg writes its -progress report here, keeping stderr free for the log
+PROGRESS_ARGS = ['-progress', 'pipe:1']
+# Maximum rate at which progress updates are passed on to listeners
+UPDATE_INTERVAL = 0.25
+
+
+def with_progress(cmd):
+    return cmd[:1] + PROGRESS_ARGS + cmd[1:]
+
+
+def _number(value, suffix=''):
+    if value is None:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:  # "N/A" until ffmpeg has something to report
+        return None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '--:--'
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def format_status(tracker):
+    status = f"{tracker.fraction:.0%}  {tracker.fps:.1f} fps"
+    if tracker.speed is not None:
+        status += f"  {tracker.speed:.2f}x"
+    return status + f"  ETA {format_duration(tracker.eta)}"
+
+
+class ProgressParser:
+    # Parses the key=value blocks of ffmpeg's -progress output. Each block ends
+    # with a "progress=continue" or "progress=end" line.
+    def __init__(self):
+        self._block = {}
+
+    def feed(self, line):
+        key, separator, value = line.strip().partition('=')
+        if not separator:
+            return None
+        self._block[key] = value
+        if key != 'progress':
+            return None
+        block, self._block = self._block, {}
+        return self.snapshot(block)
+
+    @staticmethod
+    def snapshot(block):
+        out_time_us = _number(block.get('out_time_us', block.get('out_time_ms')))
+        total_size = _number(block.get('total_size'))
+        frame = _number(block.get('frame'))
+        return {
+            'frame': int(frame) if frame is not None else None,
+            'fps': _number(block.get('fps')),
+            'speed': _number(block.get('speed'), 'x'),
+            'out_time': out_time_us / 1e6 if out_time_us is not None and out_time_us >= 0 else None,
+            'bitrate': _number(block.get('bitrate'), 'kbits/s'),
+            'total_size': int(total_size) if total_size is not None else None,
+            'end': block.get('progress') == 'end',
+        }
+
+
+class ProgressTracker:
+    # Tracks progress in output-time units, so frame rate conversion and trims
+    # report correctly, and coalesces updates to UPDATE_INTERVAL.
+    def __init__(self, duration=None, interval=UPDATE_INTERVAL, clock=time.monotonic):
+        self.duration = duration
+        self.interval = interval
+        self.clock = clock
+        self.frame = 0
+        self.fps = 0.0
+        self.speed = None
+        self.out_time = 0.0
+        self.bitrate = None
+        self.total_size = None
+        self.finished = False
+        self._started = clock()
+        self._last_emit = None
+
+    def update(self, snapshot):
+        # Returns True when the update should be passed on to listeners
+        for key in ('frame', 'fps', 'speed', 'out_time', 'bitrate', 'total_size'):
+            if snapshot.get(key) is not None:
+                setattr(self, key, snapshot[key])
+        self.finished = snapshot.get('end', False)
+
+        now = self.clock()
+        if (self.finished or self._last_emit is None
+                or now - self._last_emit >= self.interval):
+            self._last_emit = now
+            return True
+        return False
+
+    @property
+    def fraction(self):
+        if self.finished:
+            return 1.0
+        if self.duration:
+            return max(0.0, min(self.out_time / self.duration, 1.0))
+        return 0.0
+
+    @property
+    def elapsed(self):
+        return self.clock() - self._started
+
+    @property
+    def eta(self):
+        if not self.duration:
+            return None
+        remaining = max(self.duration - self.out_time, 0.0)
+        speed = self.speed
+        if not speed and self.out_time > 0:
+            speed = self.out_time / self.elapsed
+        return remaining / speed if speed else None
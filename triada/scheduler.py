@@ -0,0 +1,532 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import sys
+import threading
+import itertools
+import time
+
+from triada.lazy import lazy_import
+from triada.priority import CpuAllocator
+from triada.progress import ProgressParser, ProgressTracker, with_progress
+
+subprocess = lazy_import('subprocess')
+
+# Roughly how many cores a single encoder instance keeps busy for a given preset.
+# libx265 frame/WPP threading keeps scaling with slower presets, libx264 less so,
+# and prores_ks is slice-threaded with little work per slice.
+CODEC_THREAD_SCALING = {
+    'libx265': {
+        'veryfast': 8, 'faster': 10, 'fast': 12, 'medium': 14,
+        'slow': 16, 'slower': 16, 'veryslow': 16,
+    },
+    'libx264': {
+        'veryfast': 6, 'faster': 6, 'fast': 8, 'medium': 8,
+        'slow': 10, 'slower': 12, 'veryslow': 12,
+    },
+    'prores_ks': {None: 4},
+    'copy': {None: 1},
+}
+DEFAULT_CORES_PER_JOB = 4
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on Windows and macOS
+        return os.cpu_count() or 1
+
+
+def cores_per_job(codec, preset=None, total_cores=None):
+    total_cores = total_cores or available_cores()
+    scaling = CODEC_THREAD_SCALING.get(codec, {})
+    cores = scaling.get(preset, scaling.get(None, DEFAULT_CORES_PER_JOB))
+    return max(1, min(cores, total_cores))
+
+
+def max_concurrent_jobs(codec, preset=None, total_cores=None):
+    total_cores = total_cores or available_cores()
+    return max(1, total_cores // cores_per_job(codec, preset, total_cores))
+
+
+def wait_with_usage(process):
+    # Exit code, CPU seconds and peak resident memory in KiB of a child process;
+    # the last two are None where there is no rusage (Windows)
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None, None
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        return process.wait(), None, None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    peak_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return process.returncode, usage.ru_utime + usage.ru_stime, peak_rss
+
+
+class EncodeJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, cmd, input_file, output_file, codec, preset=None, frame_count=0,
+                 duration=None):
+        self.job_id = next(self._ids)
+        self.cmd = cmd
+        self.input_file = input_file
+        self.output_file = output_file
+        self.extra_outputs = []  # further files the same ffmpeg run writes, e.g. renditions
+        self.codec = codec
+        self.preset = preset
+        self.frame_count = frame_count
+        self.duration = duration  # expected output duration in seconds
+        self.action = 'Encoding'  # what the job does, for messages
+        self.state = QUEUED
+        self.tracker = ProgressTracker(duration)
+        self.log = None  # optional JobLog
+        self.depends_on = []  # jobs that must be done before this one starts
+        self.temp_files = []  # removed once this job is done, or can no longer be
+        self.rebuild = None  # optional callable(cores) -> cmd for automatic threads
+        self.on_start = None  # optional callable(job), called as the job starts
+        # optional callable(job, log) run here instead of ffmpeg, returning the
+        # jobs to queue in its place once it is done
+        self.work = None
+        self.on_done = None  # optional callable(job), called once the job is done
+        self.resumable = False  # stopping queues it again instead of cancelling it
+        self.prefetch = None  # optional SequencePrefetcher following the job's progress
+        self.staging = None  # optional Staging: encode to local scratch, then publish
+        self.scheduling = None  # optional SchedulingProfile for the ffmpeg process
+        self.cpus = None  # CPUs the running job is pinned to
+        self.cores = None  # cores the running job was given
+        self.task = None  # what a farm worker builds this job from; None runs it here only
+        self.worker = None  # farm worker running the job, None when it runs here
+        self.attempts = 0  # runs lost with their farm worker
+        self.returncode = None
+        self.process = None
+        self.stop_flag = False
+        # Timings for telemetry: wall clock times, and the ffmpeg child's rusage
+        self.probe_seconds = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cpu_seconds = None
+        self.peak_rss_kb = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.output_file)
+
+    @property
+    def frame(self):
+        return self.tracker.frame
+
+    @property
+    def fps(self):
+        return self.tracker.fps if self.state == RUNNING else 0.0
+
+    @property
+    def progress(self):
+        if self.state in (DONE, FAILED):
+            return 1.0
+        if self.state == QUEUED and self.depends_on:
+            # A join waiting on its segments reports their combined progress
+            total = sum(job.duration or 0 for job in self.depends_on)
+            if total:
+                return sum((job.duration or 0) * job.progress
+                           for job in self.depends_on) / total
+        return self.tracker.fraction
+
+    def is_active(self):
+        return self.state in (QUEUED, RUNNING)
+
+
+class JobScheduler:
+    # Runs queued encode jobs as concurrent ffmpeg processes. The number of jobs
+    # running at once is bounded by a core budget: each job reserves the cores its
+    # codec/preset is known to saturate, so slow x265 jobs run a few at a time
+    # while ProRes jobs are packed more densely.
+    def __init__(self, total_cores=None, max_jobs=0,
+                 on_job_update=None, on_job_finished=None, on_queue_finished=None, log=print,
+                 telemetry=None, on_jobs_added=None):
+        self.total_cores = total_cores or available_cores()
+        self.max_jobs = max_jobs  # 0 means derive from the core budget only
+        self.on_job_update = on_job_update
+        self.on_job_finished = on_job_finished
+        self.on_queue_finished = on_queue_finished
+        self.on_jobs_added = on_jobs_added  # called with the jobs a job's work queued
+        self.log = log
+        self.telemetry = telemetry  # optional Telemetry, records every finished run
+        self.jobs = []
+        self.cpu_allocator = None  # created when a job is first pinned
+        self._allocated = {}  # job: CPUs it holds from the allocator
+        self.running = False
+        self._started = False
+        self._lock = threading.RLock()
+
+    def add(self, job):
+        with self._lock:
+            self.jobs.append(job)
+            self._schedule()
+        return job
+
+    def get(self, job_id):
+        return next((job for job in self.jobs if job.job_id == job_id), None)
+
+    def start(self):
+        with self._lock:
+            self.running = True
+            self._started = True
+            self._schedule()
+
+    def stop(self):
+        # Stop dispatching and ask every running ffmpeg to quit
+        with self._lock:
+            self.running = False
+            for job in self.jobs:
+                if job.state == RUNNING:
+                    job.stop_flag = True
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job.state == QUEUED:
+                job.state = CANCELLED
+                self._notify(self.on_job_finished, job)
+                self._discard(job)
+                self._schedule()
+            elif job.state == RUNNING:
+                job.resumable = False
+                job.stop_flag = True
+
+    def move(self, job_id, offset):
+        # Reorder a queued job relative to the other queued jobs
+        with self._lock:
+            queued = [job for job in self.jobs if job.state == QUEUED]
+            job = self.get(job_id)
+            if job not in queued:
+                return
+            index = queued.index(job)
+            new_index = max(0, min(len(queued) - 1, index + offset))
+            if new_index == index:
+                return
+            other = queued[new_index]
+            a, b = self.jobs.index(job), self.jobs.index(other)
+            self.jobs[a], self.jobs[b] = self.jobs[b], self.jobs[a]
+
+    def clear_finished(self):
+        with self._lock:
+            self.jobs = [job for job in self.jobs if job.is_active()]
+
+    def pending(self):
+        return [job for job in self.jobs if job.is_active()]
+
+    def has_output(self, output_file):
+        output_file = os.path.normcase(os.path.abspath(output_file))
+        return any(os.path.normcase(os.path.abspath(path)) == output_file
+                   for job in self.pending() for path in [job.output_file] + job.extra_outputs)
+
+    def capacity(self, spec=None):  # pylint: disable=unused-argument
+        # Cores an encode of spec can be split over
+        return self.total_cores
+
+    def throughput(self):
+        # Total frames/s across all running jobs
+        return sum(job.fps for job in self.jobs if job.state == RUNNING)
+
+    def dependents(self, job):
+        return [other for other in self.jobs if job in other.depends_on]
+
+    def overall_progress(self):
+        # Fraction of the queue's total output duration that has been encoded
+        jobs = [job for job in self.jobs if job.state != CANCELLED]
+        total = sum(job.duration or 0 for job in jobs)
+        if not total:
+            return 0.0
+        return sum((job.duration or 0) * job.progress for job in jobs) / total
+
+    def _core_share(self, job):
+        # Cores for a job with automatic threads: the machine split evenly among
+        # the jobs expected to run alongside it
+        slots = max_concurrent_jobs(job.codec, job.preset, self.total_cores)
+        if self.max_jobs:
+            slots = min(slots, self.max_jobs)
+        running = self._running_here()
+        waiting = sum(1 for other in self.jobs
+                      if other is not job and other.state == QUEUED
+                      and all(dependency.state == DONE for dependency in other.depends_on))
+        return max(1, self.total_cores // max(1, min(slots, running + 1 + waiting)))
+
+    def _running_here(self):
+        return sum(1 for job in self.jobs if job.state == RUNNING and job.worker is None)
+
+    def _reserved_cores(self):
+        return sum(cores_per_job(job.codec, job.preset, self.total_cores)
+                   for job in self.jobs if job.state == RUNNING and job.worker is None)
+
+    def _schedule(self):
+        for job in self.jobs:
+            if not self.running:
+                break
+            if job.state != QUEUED:
+                continue
+            if any(dependency.state in (FAILED, CANCELLED) for dependency in job.depends_on):
+                job.state = CANCELLED
+                self._notify(self.on_job_finished, job)
+                self._discard(job)
+                continue
+            if any(dependency.state != DONE for dependency in job.depends_on):
+                continue
+            if not self._start(job):
+                break
+
+        idle = not any(job.state == RUNNING for job in self.jobs)
+        drained = not self.running or not any(job.state == QUEUED for job in self.jobs)
+        if self._started and idle and drained:
+            self.running = False
+            self._started = False
+            self._notify(self.on_queue_finished)
+
+    def _start(self, job):
+        # Starts a job whose dependencies are done; False when there is no room for it
+        running = self._running_here()
+        if self.max_jobs and running >= self.max_jobs:
+            return False
+        needed = cores_per_job(job.codec, job.preset, self.total_cores)
+        # Always allow one job, even if it alone would exceed the budget
+        if running and self._reserved_cores() + needed > self.total_cores:
+            return False
+        cores = needed if job.rebuild is None else self._core_share(job)
+        job.cpus = self._pin(job, cores)
+        job.cores = len(job.cpus) if job.cpus else cores
+        if job.rebuild is not None:
+            job.cmd = job.rebuild(job.cores)
+        job.state = RUNNING
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return True
+
+    def _pin(self, job, cores):
+        # The CPUs a starting job is confined to, or None to leave it to the OS.
+        # 'auto' takes cores CPUs no other pinned job holds, on one NUMA node
+        # where they fit; when none are left the job shares its node's CPUs.
+        profile = job.scheduling
+        if profile is None or (profile.cpus is None and profile.numa_node is None):
+            return None
+        if self.cpu_allocator is None:
+            self.cpu_allocator = CpuAllocator()
+        try:
+            cpus = (self.cpu_allocator.node_cpus(profile.numa_node)
+                    if profile.numa_node is not None else self.cpu_allocator.cpus)
+        except ValueError as error:
+            self._log(job, f"Not pinning {job.name}: {error}")
+            return None
+        if profile.cpus == 'auto':
+            allocated = self.cpu_allocator.allocate(cores, profile.numa_node)
+            if allocated is not None:
+                self._allocated[job] = allocated
+                return allocated
+        elif profile.cpus is not None:
+            cpus = [cpu for cpu in profile.cpus if cpu in cpus]
+            if not cpus:
+                self._log(job, f"Not pinning {job.name}: none of its CPUs are available")
+                return None
+        return cpus
+
+    def _run(self, job):
+        self._notify(self.on_job_update, job)
+        job.tracker = ProgressTracker(job.duration)
+        job.started_at = time.time()
+        job.cpu_seconds = job.peak_rss_kb = None
+        if not self._prepare(job):
+            return
+        if job.work is not None:
+            self._run_work(job)
+            return
+        cmd = job.cmd
+        if job.staging is not None:
+            cmd = job.staging.begin(cmd, str(job.job_id))
+            if job.staging.directory is None:
+                self._log(job, f"No scratch space left, writing {job.name} to its destination")
+        if job.log is not None:
+            job.log.write("FFmpeg command: " + " ".join(cmd))
+        scheduling = {}
+        if job.scheduling is not None:
+            self._log(job, f"Running {job.name} at {job.scheduling.describe(job.cpus)}")
+            scheduling = job.scheduling.popen_args(job.cpus)
+        if job.prefetch is not None:
+            job.prefetch.start()
+        try:
+            # Progress comes as key=value blocks on stdout, the log on stderr
+            job.process = subprocess.Popen(with_progress(cmd),
+                                           stdin=subprocess.PIPE,
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.PIPE,
+                                           universal_newlines=True,
+                                           **scheduling)
+            if job.scheduling is not None:
+                job.scheduling.after_start(job.process, job.cpus,
+                                           log=lambda line: self._log(job, line))
+            if job.prefetch is not None:
+                job.prefetch.attach(job.process.pid)
+        except OSError as error:
+            self._log(job, f"Failed to start ffmpeg for {job.name}: {error}")
+            if job.prefetch is not None:
+                job.prefetch.stop()
+            if job.staging is not None:
+                job.staging.finish()
+            self._finish(job, FAILED)
+            return
+
+        process = job.process
+        log_thread = threading.Thread(target=self._read_log, args=(job, process.stderr),
+                                      daemon=True)
+        log_thread.start()
+
+        parser = ProgressParser()
+        for line in process.stdout:
+            snapshot = parser.feed(line)
+            if snapshot is not None and job.tracker.update(snapshot):
+                if job.prefetch is not None:
+                    job.prefetch.advance(job.tracker.out_time)
+                self._notify(self.on_job_update, job)
+
+            if job.stop_flag:
+                try:
+                    process.stdin.write('q')  # send "q" keypress to stop
+                    process.stdin.flush()
+                except OSError:
+                    pass  # ffmpeg has exited already
+                # Progress keeps coming while ffmpeg finalizes the output, e.g. a
+                # faststart pass; it would block on a full pipe if left unread
+                for _ in process.stdout:
+                    pass
+                break
+
+        job.returncode, job.cpu_seconds, job.peak_rss_kb = wait_with_usage(process)
+        log_thread.join()
+        if job.prefetch is not None:
+            job.prefetch.stop()
+            self._log(job, job.prefetch.summary())
+        if job.stop_flag:
+            # A resumable job starts over when the queue is started again
+            state = QUEUED if job.resumable else CANCELLED
+        elif job.returncode == 0:
+            state = DONE
+        else:
+            state = FAILED
+        if job.staging is not None:
+            state = self._publish(job, state)
+        self._finish(job, state)
+
+    def _run_work(self, job):
+        try:
+            jobs = job.work(job, lambda line: self._log(job, line))
+        except Exception as error:  # pylint: disable=broad-except
+            # Whatever goes wrong, the job has to finish or it holds its cores forever
+            self._log(job, f"{job.name} failed: {error!r}")
+            self._finish(job, FAILED)
+            return
+        if job.stop_flag:
+            self._finish(job, CANCELLED)
+            return
+        with self._lock:
+            # Queued right after it, so they keep its place in the queue
+            index = self.jobs.index(job) + 1
+            self.jobs[index:index] = jobs
+            for new_job in jobs:
+                new_job.queued_at = time.time()
+            self._notify(self.on_jobs_added, jobs)
+        job.returncode = 0
+        self._finish(job, DONE)
+
+    def _prepare(self, job):
+        # Runs the job's on_start; False when that failed, and the job with it
+        if job.on_start is None:
+            return True
+        try:
+            job.on_start(job)
+        except OSError as error:
+            self._log(job, f"Failed to prepare {job.name}: {error}")
+            self._finish(job, FAILED)
+            return False
+        return True
+
+    def _publish(self, job, state):
+        # Copies staged outputs to their destination; anything else is dropped
+        if state != DONE:
+            job.staging.finish()
+            return state
+        try:
+            if job.staging.directory is not None:
+                self._log(job, f"Publishing {job.name}")
+            job.staging.publish()
+        except OSError as error:
+            self._log(job, f"Failed to publish {job.name}: {error}")
+            return FAILED
+        return state
+
+    def _read_log(self, job, stream):
+        for line in stream:
+            self._log(job, line.rstrip())
+
+    def _log(self, job, line):
+        self.log(line)
+        if job.log is not None:
+            job.log.write(line)
+
+    def _finish(self, job, state):
+        job.finished_at = time.time()
+        if self.telemetry is not None:
+            self.telemetry.record(job, 'stopped' if state == QUEUED else state)
+        if job.log is not None:
+            job.log.write(f"{job.action} {'stopped' if state == QUEUED else state} "
+                          f"(exit code {job.returncode})")
+            job.log.close()
+        if state == DONE:
+            if job.on_done is not None:
+                job.on_done(job)
+            self._remove_temp_files(job)
+        with self._lock:
+            if job in self._allocated:
+                self.cpu_allocator.release(self._allocated.pop(job))
+            job.state = state
+            job.process = None
+            job.stop_flag = False
+            self._notify(self.on_job_update if state == QUEUED else self.on_job_finished, job)
+            self._discard(job)
+            self._schedule()
+
+    def _discard(self, job):
+        # Temp files of a job that can no longer be done, e.g. the segments of a
+        # join whose other segments failed, go once none of the jobs it depends
+        # on still runs. A resumable job keeps them for the next run.
+        for other in [job] + self.dependents(job):
+            doomed = other.state in (FAILED, CANCELLED) or any(
+                dependency.state in (FAILED, CANCELLED) for dependency in other.depends_on)
+            if (doomed and other.temp_files and not other.resumable
+                    and not any(dependency.state == RUNNING for dependency in other.depends_on)):
+                self._remove_temp_files(other)
+
+    @staticmethod
+    def _remove_temp_files(job):
+        # Files first, then the (now empty) directories that held them
+        for path in sorted(job.temp_files, key=os.path.isdir):
+            try:
+                if os.path.isdir(path):
+                    os.rmdir(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _notify(callback, *args):
+        if callback is not None:
+            callback(*args)
@@ -0,0 +1,327 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+from fractions import Fraction
+
+from triada.command import (build_concat_command, build_segment_command, encoder,
+                            sequence_range, source_range)
+from triada.lazy import lazy_import
+from triada.prefetch import sequence_prefetcher
+from triada.probe import source_identity
+from triada.scheduler import EncodeJob, cores_per_job, max_concurrent_jobs
+
+subprocess = lazy_import('subprocess')
+
+# Shorter segments waste too much time on encoder start-up and rate control warm-up
+MIN_SEGMENT_DURATION = 20.0
+# More segments than parallel slots keeps the tail of the encode from idling cores
+SEGMENTS_PER_SLOT = 2
+# Resumable encodes checkpoint at least this often, in seconds of source
+CHECKPOINT_DURATION = 300.0
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+_manifest_lock = threading.Lock()
+
+
+def segment_dir(output_file):
+    return output_file + '.segments'
+
+
+def auto_segment_count(spec, duration, total_cores=None):
+    if spec['segment_count'] > 0:
+        return spec['segment_count']
+    count = 1
+    if spec['chunked']:
+        codec = encoder(spec)
+        preset = spec['preset'] if codec != "prores_ks" else None
+        slots = max_concurrent_jobs(codec, preset, total_cores)
+        count = max(1, min(slots * SEGMENTS_PER_SLOT, int(duration // MIN_SEGMENT_DURATION)))
+    if spec['resumable']:
+        count = max(count, math.ceil(duration / CHECKPOINT_DURATION))
+    return count
+
+
+def probe_keyframes_near(video_file, times, start_time=0.0, ffprobe='ffprobe'):
+    # Seeks to each time and reads a single packet; the demuxer lands on the
+    # keyframe at or before the time, so this stays fast on very long files.
+    # Times are from the start of the file, as for -ss, while ffprobe seeks to
+    # and reports timestamps, which begin at the stream's start_time.
+    if not times:
+        return []
+    intervals = ','.join(f"{time + start_time:.3f}%+#1" for time in times)
+    try:
+        result = subprocess.run([ffprobe, '-v', 'error', '-select_streams', 'v:0',
+                                 '-read_intervals', intervals,
+                                 '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0',
+                                 video_file],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, check=False)
+    except OSError:
+        # Input-side seeking is frame accurate anyway, splits just won't be keyframe aligned
+        return []
+    keyframes = set()
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags:
+            try:
+                keyframes.add(float(pts_time) - start_time)
+            except ValueError:
+                pass
+    return sorted(keyframes)
+
+
+def plan_segments(duration, count, keyframes=None):
+    # Evenly spaced split points, moved to the nearest probed keyframe so that
+    # no segment has to decode frames it throws away
+    boundaries = [0.0]
+    for index in range(1, count):
+        split = duration * index / count
+        if keyframes:
+            split = min(keyframes, key=lambda keyframe, split=split: abs(keyframe - split))
+        if boundaries[-1] + 1.0 < split < duration - 1.0:
+            boundaries.append(split)
+    boundaries.append(duration)
+    return [(start, end - start) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def frame_range_step(spec):
+    # Input frames per output keyframe interval. Ranges that are whole multiples
+    # of it join on a keyframe the single-process encode would have placed as
+    # well, and never split an output frame when the frame rate is converted.
+    step = Fraction(spec['keyframe_interval'])
+    if spec['convert_frame_rate'] > 0:
+        step *= (Fraction(spec['frame_rate']).limit_denominator(1001) /
+                 Fraction(spec['convert_frame_rate']).limit_denominator(1001))
+    return step.numerator
+
+
+def plan_frame_ranges(start_number, frame_count, count, step):
+    steps = -(-frame_count // step)
+    frames_per_range = max(1, -(-steps // count)) * step
+    return [(start, min(frames_per_range, start_number + frame_count - start))
+            for start in range(start_number, start_number + frame_count, frames_per_range)]
+
+
+def segment_input_args(spec, file_info, total_cores=None):
+    # The input-side arguments for each segment, or None if the input is too short
+    if '%' in spec['input']:
+        frame_rate = spec['frame_rate']
+        first_frame, frame_count = sequence_range(spec, file_info)
+        count = auto_segment_count(spec, frame_count / frame_rate, total_cores)
+        if count < 2:
+            return None
+        sequence_end = (file_info.get('start_number') or 0) + file_info['frame_count']
+        ranges = plan_frame_ranges(first_frame, frame_count, count, frame_range_step(spec))
+        segments = []
+        for start, frames in ranges:
+            # Limit by time rather than frame count so fps conversion still applies.
+            # Rounded down, the next range's first frame is never let in; a range
+            # ending with the sequence simply runs to its end.
+            input_args = {'start_number': start}
+            if start + frames < sequence_end:
+                input_args['t'] = f"{math.floor(frames / frame_rate * 1e6) / 1e6:.6f}"
+            segments.append((input_args, frames / frame_rate))
+        return segments
+
+    offset, duration = source_range(spec, file_info)
+    duration = duration or 0
+    count = auto_segment_count(spec, duration, total_cores)
+    if count < 2:
+        return None
+    ideal_splits = [offset + duration * index / count for index in range(1, count)]
+    keyframes = probe_keyframes_near(spec['input'], ideal_splits,
+                                     file_info.get('start_time') or 0.0)
+    if not keyframes and file_info.get('frame_rate'):
+        # Without keyframe positions, split on frame boundaries at least
+        frame_rate = file_info['frame_rate']
+        keyframes = [round(split * frame_rate) / frame_rate for split in ideal_splits]
+    keyframes = [keyframe - offset for keyframe in keyframes]
+    # Input-side seeking decodes from the keyframe at or before each start
+    return [({'ss': f"{offset + start:.6f}", 't': f"{length:.6f}"}, length)
+            for start, length in plan_segments(duration, count, keyframes)]
+
+
+def write_concat_list(list_file, segment_files):
+    with open(list_file, 'w', encoding='utf-8') as concat_list:
+        for segment_file in segment_files:
+            escaped = os.path.abspath(segment_file).replace("'", "'\\''")
+            concat_list.write(f"file '{escaped}'\n")
+
+
+def manifest_path(output_file):
+    return os.path.join(segment_dir(output_file), MANIFEST_NAME)
+
+
+def segments_fingerprint(spec, file_info, segments):
+    # Finished segments are only reused for the same source, settings and split.
+    # Thread counts, read-ahead, staging and scheduling change how fast a segment
+    # encodes, not what it contains.
+    settings = {key: value for key, value in spec.items()
+                if key not in ('threads', 'filter_threads', 'prefetch', 'prefetch_memory',
+                               'stage', 'scratch_dir', 'scratch_budget', 'priority', 'nice',
+                               'io_class', 'cpus', 'numa_node')}
+    data = json.dumps([MANIFEST_VERSION, settings, source_identity(spec, file_info),
+                       [input_args for input_args, _ in segments]], sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def load_manifest(output_file):
+    try:
+        with open(manifest_path(output_file), 'r', encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(output_file, manifest):
+    # Written to the side and renamed, so a crash never leaves half a manifest
+    path = manifest_path(output_file)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(temp_path, path)
+
+
+def mark_segment_done(output_file, index):
+    with _manifest_lock:
+        manifest = load_manifest(output_file)
+        if manifest is None:
+            return
+        manifest['segments'][index]['done'] = True
+        try:
+            save_manifest(output_file, manifest)
+        except OSError:
+            pass  # The segment is only encoded again on resume
+
+
+def interrupted_encode(output_file):
+    # (segments done, segment count) of a resumable encode that never got joined
+    manifest = load_manifest(output_file)
+    if manifest is None:
+        return None
+    work_dir = segment_dir(output_file)
+    done = sum(1 for segment in manifest['segments']
+               if segment['done'] and os.path.exists(os.path.join(work_dir, segment['file'])))
+    return done, len(manifest['segments'])
+
+
+def discard_segments(output_file):
+    shutil.rmtree(segment_dir(output_file), ignore_errors=True)
+
+
+class SegmentWork:
+    # The work folder of a chunked encode, set up as each of its jobs starts
+    # rather than when they are planned, so dry runs and jobs removed from the
+    # queue leave nothing behind, and a folder discarded after a failure is
+    # set up again by a job run later. Discarding the segments of an earlier
+    # run (restart) and writing the manifest only happen for the first job.
+    def __init__(self, output_file, segment_files, manifest=None, restart=False):
+        self.output_file = output_file
+        self.segment_files = segment_files
+        self.manifest = manifest
+        self.restart = restart
+        self.work_dir = segment_dir(output_file)
+        self.list_file = os.path.join(self.work_dir, 'segments.txt')
+        self._started = False
+        self._lock = threading.Lock()
+
+    def prepare(self, job=None):  # pylint: disable=unused-argument
+        with self._lock:
+            if not self._started:
+                if self.restart:
+                    discard_segments(self.output_file)
+                if self.manifest is not None:
+                    os.makedirs(self.work_dir, exist_ok=True)
+                    with _manifest_lock:
+                        save_manifest(self.output_file, self.manifest)
+                self._started = True
+            os.makedirs(self.work_dir, exist_ok=True)
+            write_concat_list(self.list_file, self.segment_files)
+
+
+def make_segment_job(spec, file_info, segment_file, input_args, length, cores=None):
+    codec = encoder(spec)
+    preset = spec['preset'] if codec != "prores_ks" else None
+    cmd = build_segment_command(spec, file_info, segment_file, input_args,
+                                cores or cores_per_job(codec, preset))
+    job = EncodeJob(cmd, spec['input'], segment_file, codec, preset,
+                    frame_count=0, duration=length)
+    if spec['threads'] == 0:
+        job.rebuild = lambda cores: build_segment_command(spec, file_info, segment_file,
+                                                          input_args, cores)
+    if '%' in spec['input']:
+        job.prefetch = sequence_prefetcher(spec, file_info, input_args['start_number'],
+                                           round(length * spec['frame_rate']))
+    job.task = {'spec': spec, 'file_info': file_info, 'output_file': segment_file,
+                'input_args': input_args, 'duration': length}
+    return job
+
+
+def chunked_jobs(spec, file_info, output_file, total_cores=None, restart=False, log=print):
+    segments = segment_input_args(spec, file_info, total_cores)
+    if segments is None or len(segments) < 2:
+        return None
+
+    work_dir = segment_dir(output_file)
+    base_name, ext = os.path.splitext(os.path.basename(output_file))
+    codec = encoder(spec)
+    preset = spec['preset'] if codec != "prores_ks" else None
+
+    cores = cores_per_job(codec, preset, total_cores)
+
+    segment_files = [os.path.join(work_dir, f"{base_name}.part{index:03d}{ext}")
+                     for index in range(len(segments))]
+    done = set()
+    manifest = None
+    if spec['resumable']:
+        # Segments a previous run finished are kept; anything else starts over.
+        # Planning only reads the manifest, the first job to start replaces it.
+        fingerprint = segments_fingerprint(spec, file_info, segments)
+        previous = load_manifest(output_file) if not restart else None
+        if previous is not None and previous.get('fingerprint') == fingerprint:
+            done = {index for index, segment in enumerate(previous['segments'])
+                    if segment['done'] and os.path.exists(segment_files[index])}
+        if done:
+            log(f"Resuming {output_file}: {len(done)} of {len(segments)} segments already encoded")
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'fingerprint': fingerprint,
+            'output': os.path.abspath(output_file),
+            'segments': [{'file': os.path.basename(segment_file), 'done': index in done}
+                         for index, segment_file in enumerate(segment_files)],
+        }
+    work = SegmentWork(output_file, segment_files, manifest, restart)
+
+    jobs = []
+    for index, (input_args, length) in enumerate(segments):
+        if index in done:
+            continue
+        job = make_segment_job(spec, file_info, segment_files[index], input_args, length, cores)
+        job.on_start = work.prepare
+        if spec['resumable']:
+            job.resumable = True
+            job.on_done = lambda job, index=index: mark_segment_done(output_file, index)
+        jobs.append(job)
+
+    cmd = build_concat_command(spec, file_info, work.list_file, output_file)
+    # Joining is stream copy and reads little, so it barely needs any cores
+    assemble = EncodeJob(cmd, spec['input'], output_file, 'copy',
+                         frame_count=file_info['frame_count'])
+    assemble.depends_on = list(jobs)
+    assemble.on_start = work.prepare
+    # A resumable encode keeps its segments when it fails or is stopped
+    assemble.resumable = spec['resumable']
+    assemble.temp_files = segment_files + [work.list_file, manifest_path(output_file), work_dir]
+    return jobs + [assemble]
@@ -0,0 +1,172 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import re
+import threading
+import time
+
+SEQUENCE_PLACEHOLDER = re.compile(r'%0?(\d*)d')
+# Directory mtimes this recent may not yet reflect files still being added
+# (coarse mtime granularity on network shares), so such listings are re-read.
+MTIME_SETTLE_TIME = 2.0
+
+
+def split_pattern(pattern):
+    # "/renders/shot_%04d.png" -> ("/renders", "shot_", 4, ".png")
+    directory, name = os.path.split(pattern)
+    match = SEQUENCE_PLACEHOLDER.search(name)
+    if match is None:
+        raise ValueError(f"'{pattern}' is not an image sequence pattern")
+    digits = int(match.group(1)) if match.group(1) else 1
+    return directory or '.', name[:match.start()], digits, name[match.end():]
+
+
+def split_frame_name(name):
+    # "shot_01001.exr" -> ("shot_", "01001", ".exr"), or None without a frame number
+    stem, dot, ext = name.rpartition('.')
+    if not dot:
+        stem, ext = name, ''
+    else:
+        ext = dot + ext
+    end = len(stem)
+    start = end
+    while start > 0 and stem[start - 1].isdigit():
+        start -= 1
+    if start == end:
+        return None
+    return stem[:start], stem[start:end], ext
+
+
+def describe_gaps(gaps, limit=5):
+    ranges = [str(first) if first == last else f"{first}-{last}" for first, last in gaps]
+    if len(ranges) > limit:
+        ranges = ranges[:limit] + [f"... ({len(gaps) - limit} more)"]
+    return ', '.join(ranges)
+
+
+def gap_warning(file_path, file_info):
+    gaps = file_info.get('gaps')
+    if not gaps:
+        return None
+    return (f"Warning: '{file_path}' is missing frames {describe_gaps(gaps)}; "
+            f"only the {file_info['frame_count']} frames before the first gap will be encoded")
+
+
+class SequenceIndex:
+    def __init__(self, pattern, frames):
+        self.pattern = pattern
+        self.frames = frames  # sorted frame numbers present on disk
+
+    @property
+    def first(self):
+        return self.frames[0] if self.frames else None
+
+    @property
+    def last(self):
+        return self.frames[-1] if self.frames else None
+
+    @property
+    def count(self):
+        return len(self.frames)
+
+    @property
+    def gaps(self):
+        # Missing frame ranges as inclusive (first, last) pairs
+        return [(previous + 1, current - 1)
+                for previous, current in zip(self.frames, self.frames[1:])
+                if current - previous > 1]
+
+    def contiguous_count(self, start=None):
+        # Frames the image2 demuxer reads from start before hitting a missing file
+        if not self.frames:
+            return 0
+        start = self.first if start is None else start
+        frames = set(self.frames)
+        count = 0
+        while start + count in frames:
+            count += 1
+        return count
+
+
+class SequenceIndexer:
+    # Indexes every numbered file in a directory with a single os.scandir pass and
+    # caches the result per directory. The listing is only re-read when the directory's
+    # mtime changes, so repeated lookups cost one stat call. A re-read only parses
+    # the names added or removed since, and only indexes their sequences again, so
+    # a render writing into a large directory costs a listing per lookup.
+    def __init__(self):
+        self._directories = {}
+        self._lock = threading.Lock()
+
+    def index(self, pattern):
+        directory, prefix, digits, ext = split_pattern(pattern)
+        listing, indexed = self._listing(directory)
+        key = (prefix, digits, ext)
+        frames = indexed.get(key)
+        if frames is None:
+            # %04d matches exactly four digits, or more for frames beyond 9999
+            frames = sorted(int(number) for number in listing.get((prefix, ext), [])
+                            if len(number) == digits or
+                            (len(number) > digits and number[0] != '0'))
+            with self._lock:
+                indexed[key] = frames
+        return SequenceIndex(pattern, frames)
+
+    def invalidate(self, directory=None):
+        with self._lock:
+            if directory is None:
+                self._directories.clear()
+            else:
+                self._directories.pop(os.path.abspath(directory), None)
+
+    def _listing(self, directory):
+        directory = os.path.abspath(directory)
+        mtime = os.stat(directory).st_mtime_ns
+        with self._lock:
+            cached = self._directories.get(directory)
+            if cached is not None and cached[0] == mtime and cached[1]:
+                return cached[3], cached[4]
+            if cached is not None:
+                # Copied, as index() adds to the cached ones from other threads
+                previous, listing, indexed = cached[2], dict(cached[3]), dict(cached[4])
+            else:
+                previous, listing, indexed = frozenset(), {}, {}
+
+        with os.scandir(directory) as entries:
+            names = frozenset(entry.name for entry in entries)
+        changed = {}  # (prefix, ext) -> frame numbers now present
+        for name in names ^ previous:
+            parts = split_frame_name(name)
+            if parts is None:
+                continue
+            prefix, number, ext = parts
+            numbers = changed.setdefault((prefix, ext), set(listing.get((prefix, ext), ())))
+            if name in names:
+                numbers.add(number)
+            else:
+                numbers.discard(number)
+        for key, numbers in changed.items():
+            if numbers:
+                listing[key] = numbers
+            else:
+                listing.pop(key, None)
+        indexed = {key: frames for key, frames in indexed.items()
+                   if (key[0], key[2]) not in changed}
+
+        settled = time.time() - mtime / 1e9 > MTIME_SETTLE_TIME
+        with self._lock:
+            self._directories[directory] = (mtime, settled, names, listing, indexed)
+        return listing, indexed
+
+
+_default_indexer = SequenceIndexer()  # pylint: disable=invalid-name
+
+
+def index_sequence(pattern):
+    return _default_indexer.index(pattern)
+
+
+def invalidate_sequence_cache(directory=None):
+    _default_indexer.invalidate(directory)
@@ -0,0 +1,246 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import shutil
+import socket
+import sys
+import threading
+
+from triada.probe import default_cache_dir
+
+COPY_CHUNK = 16 * 1024 * 1024
+# Filesystem types whose files live on another machine, as /proc/mounts names them
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', '9p', 'ceph', 'glusterfs',
+                       'lustre', 'beegfs', 'gpfs', 'fuse.sshfs', 'fuse.rclone', 'davfs')
+
+
+def default_scratch_dir():
+    return os.path.join(default_cache_dir(), 'scratch')
+
+
+def _existing_parent(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+
+def filesystem_type(path):
+    # The type of the Linux mount holding path, or None where it can't be told
+    try:
+        with open('/proc/mounts', 'r', encoding='utf-8') as mounts:
+            entries = [line.split()[1:3] for line in mounts if len(line.split()) > 2]
+    except OSError:
+        return None
+    path = os.path.realpath(_existing_parent(path))
+    best, best_type = '', None
+    for mount_point, fs_type in entries:
+        mount_point = mount_point.replace('\\040', ' ')
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                and len(mount_point) >= len(best):
+            best, best_type = mount_point, fs_type
+    return best_type
+
+
+def is_network_path(path):
+    # Unknown counts as remote: staging a local destination only costs a copy
+    if os.name == 'nt':
+        drive = os.path.splitdrive(os.path.abspath(path))[0]
+        if drive.startswith('\\\\'):
+            return True
+        import ctypes  # pylint: disable=import-outside-toplevel
+        return ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == 4  # DRIVE_REMOTE
+    if sys.platform.startswith('linux'):
+        fs_type = filesystem_type(path)
+        if fs_type is not None:
+            return fs_type in NETWORK_FILESYSTEMS or fs_type.startswith('nfs')
+    return True
+
+
+def copy_file(source, destination):
+    # Large sequential writes suit network shares better than ffmpeg's small ones
+    with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+        while True:
+            chunk = source_file.read(COPY_CHUNK)
+            if not chunk:
+                break
+            destination_file.write(chunk)
+        destination_file.flush()
+        os.fsync(destination_file.fileno())
+
+
+def publish(staged_file, output_file):
+    # The output only appears under its name once it is complete; the partial copy
+    # is a dot file, which watch folders and most tools pass over
+    directory, name = os.path.split(output_file)
+    partial_file = os.path.join(directory, f".{name}.partial")
+    try:
+        copy_file(staged_file, partial_file)
+        shutil.copystat(staged_file, partial_file)
+        os.replace(partial_file, output_file)
+    except OSError:
+        try:
+            os.remove(partial_file)
+        except OSError:
+            pass
+        raise
+
+
+class ScratchSpace:
+    # A local directory jobs encode into before their outputs are published. A job
+    # is only staged while the files of staged running jobs take less than the
+    # budget and the disk still has the rest of the budget free; otherwise it
+    # writes straight to its destination.
+    def __init__(self, path=None, budget_gb=None):
+        self.path = path or default_scratch_dir()
+        self.budget = (budget_gb or 0) * 1024 ** 3
+        self._active = set()
+        self._lock = threading.Lock()
+        self._remove_stale()
+
+    def used(self):
+        total = 0
+        for directory in list(self._active):
+            try:
+                with os.scandir(directory) as entries:
+                    total += sum(entry.stat().st_size for entry in entries if entry.is_file())
+            except OSError:
+                pass
+        return total
+
+    def reserve(self, name):
+        # A fresh directory for one job, or None when the budget is used up
+        with self._lock:
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                used = self.used()
+                if self.budget and (used >= self.budget or
+                                    shutil.disk_usage(self.path).free < self.budget - used):
+                    return None
+                directory = os.path.join(self.path, f"{os.getpid()}-{name}")
+                os.makedirs(directory, exist_ok=True)
+            except OSError:
+                return None
+            self._active.add(directory)
+            return directory
+
+    def release(self, directory):
+        with self._lock:
+            self._active.discard(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def _remove_stale(self):
+        # Directories left by processes that are gone, e.g. after a crash
+        if os.name != 'posix':
+            return
+        try:
+            with os.scandir(self.path) as entries:
+                names = [entry.name for entry in entries if entry.is_dir()]
+        except OSError:
+            return
+        for name in names:
+            pid = name.partition('-')[0]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+            except OSError:
+                pass  # Alive, but someone else's
+
+
+_scratch_spaces = {}  # pylint: disable=invalid-name
+_scratch_lock = threading.Lock()  # pylint: disable=invalid-name
+
+
+def scratch_space(path=None, budget_gb=None):
+    # One ScratchSpace per directory, so all jobs staging there share its budget
+    path = os.path.abspath(path or default_scratch_dir())
+    with _scratch_lock:
+        space = _scratch_spaces.get(path)
+        if space is None:
+            space = _scratch_spaces[path] = ScratchSpace(path, budget_gb)
+        elif budget_gb is not None:
+            space.budget = budget_gb * 1024 ** 3
+        return space
+
+
+class Staging:
+    # Moves one job's outputs to scratch space while it runs, then publishes them
+    def __init__(self, output_files, space):
+        self.output_files = list(output_files)
+        self.space = space
+        self.directory = None
+
+    def begin(self, cmd, name):
+        # The command writing to scratch space, or unchanged when there is no room
+        self.directory = self.space.reserve(name)
+        if self.directory is None:
+            return cmd
+        staged = {output_file: self.staged_file(output_file) for output_file in self.output_files}
+        return [staged.get(arg, arg) for arg in cmd]
+
+    def staged_file(self, output_file):
+        return os.path.join(self.directory, os.path.basename(output_file))
+
+    def publish(self):
+        if self.directory is None:
+            return
+        try:
+            for output_file in self.output_files:
+                publish(self.staged_file(output_file), output_file)
+        finally:
+            self.finish()
+
+    def finish(self):
+        if self.directory is not None:
+            self.space.release(self.directory)
+            self.directory = None
+
+
+class PartialOutputs:
+    # Same interface as Staging, but each output is written under a hidden name
+    # beside it and renamed into place once done. Two machines that end up
+    # encoding the same output, such as a farm worker thought lost and the one
+    # its job was sent to next, then never write into the same file.
+    def __init__(self, output_files):
+        self.output_files = list(output_files)
+        self.directory = None
+        self.tag = f"{socket.gethostname()}-{os.getpid()}"
+
+    def begin(self, cmd, name):
+        self.directory = os.path.dirname(os.path.abspath(self.output_files[0]))
+        self.name = name
+        partial = {output_file: self.partial_file(output_file) for output_file in self.output_files}
+        return [partial.get(arg, arg) for arg in cmd]
+
+    def partial_file(self, output_file):
+        directory, name = os.path.split(output_file)
+        stem, ext = os.path.splitext(name)
+        return os.path.join(directory, f".{stem}.{self.tag}-{self.name}{ext}")
+
+    def publish(self):
+        try:
+            for output_file in self.output_files:
+                os.replace(self.partial_file(output_file), output_file)
+        finally:
+            self.finish()
+
+    def finish(self):
+        if self.directory is not None:
+            for output_file in self.output_files:
+                try:
+                    os.remove(self.partial_file(output_file))
+                except OSError:
+                    pass
+            self.directory = None
+
+
+def staging_for(spec, output_files):
+    # None unless staging is on and the outputs go to network storage
+    if not spec['stage'] or not is_network_path(os.path.dirname(output_files[0])):
+        return None
+    return Staging(output_files, scratch_space(spec['scratch_dir'], spec['scratch_budget']))
@@ -0,0 +1,234 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import os
+import json
+import re
+import socket
+import threading
+import time
+
+from triada.priority import format_cpu_list
+
+# Where records and metrics go unless set on the command line
+TELEMETRY_ENV = 'TRIADA_TELEMETRY'
+METRICS_TEXTFILE_ENV = 'TRIADA_METRICS_TEXTFILE'
+
+# (Prometheus counter, help text, record field summed into it)
+COUNTERS = (
+    ('triada_encode_wall_seconds_total', "Wall time of ffmpeg runs", 'wall_seconds'),
+    ('triada_encode_cpu_seconds_total', "CPU time (user + system) of ffmpeg runs", 'cpu_seconds'),
+    ('triada_encode_frames_total', "Frames written", 'frames'),
+    ('triada_encode_media_seconds_total', "Seconds of media written", 'media_seconds'),
+    ('triada_encode_output_bytes_total', "Bytes of output written", 'output_bytes'),
+    ('triada_queue_wait_seconds_total', "Time jobs spent queued before starting",
+     'queue_wait_seconds'),
+    ('triada_probe_seconds_total', "Time spent probing inputs", 'probe_seconds'),
+    ('triada_io_stall_seconds_total', "Time encoders waited on image sequence reads",
+     'io_stall_seconds'),
+)
+# (Prometheus gauge, help text, record field, scale) for the last finished run
+GAUGES = (
+    ('triada_last_encode_fps', "Frames per second of the last finished run", 'fps', 1),
+    ('triada_last_encode_speed', "Realtime factor of the last finished run", 'speed', 1),
+    ('triada_last_encode_peak_rss_bytes', "Peak memory of the last finished run",
+     'peak_rss_kb', 1024),
+)
+JOBS_METRIC = 'triada_jobs_total'
+
+SAMPLE_PATTERN = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _seconds(end, start):
+    return round(end - start, 3) if end is not None and start is not None else None
+
+
+def job_record(job, state):
+    wall_seconds = _seconds(job.finished_at, job.started_at)
+    frames = job.tracker.frame or None
+    media_seconds = job.tracker.out_time if state == 'done' else None
+    try:
+        output_bytes = (sum(os.path.getsize(path) for path in [job.output_file] + job.extra_outputs)
+                        if state == 'done' else None)
+    except OSError:
+        output_bytes = None
+    return {
+        'time': round(job.finished_at or time.time(), 3),
+        'host': socket.gethostname(),
+        'worker': job.worker.address if job.worker is not None else None,
+        'job': job.name,
+        'input': job.input_file,
+        'output': job.output_file,
+        'extra_outputs': job.extra_outputs,
+        'codec': job.codec,
+        'preset': job.preset,
+        'state': state,
+        'priority': job.scheduling.priority if job.scheduling is not None else 'normal',
+        'cpus': format_cpu_list(job.cpus) if job.cpus else None,
+        'returncode': job.returncode,
+        'probe_seconds': job.probe_seconds,
+        'queue_wait_seconds': _seconds(job.started_at, job.queued_at),
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': round(job.cpu_seconds, 3) if job.cpu_seconds is not None else None,
+        'peak_rss_kb': job.peak_rss_kb,
+        'frames': frames,
+        'fps': round(frames / wall_seconds, 2) if frames and wall_seconds else None,
+        'media_seconds': media_seconds,
+        'speed': (round(media_seconds / wall_seconds, 3)
+                  if media_seconds and wall_seconds else None),
+        'output_bytes': output_bytes,
+        # Only measured for image sequences with read-ahead
+        'io_stall_seconds': (round(job.prefetch.stall_seconds, 3)
+                             if job.prefetch is not None else None),
+    }
+
+
+def _number(value):
+    # Full precision, as byte and frame totals outgrow %g
+    return str(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) == 'n' else match.group(1),
+                  value)
+
+
+def read_textfile(path):
+    # {metric: {labels: value}} with labels as ((name, value), ...), from a file
+    # _write_textfile wrote. Missing or unreadable lines count as no samples.
+    samples = {}
+    try:
+        with open(path, encoding='utf-8') as textfile:
+            lines = textfile.read().splitlines()
+    except OSError:
+        return samples
+    for line in lines:
+        match = SAMPLE_PATTERN.match(line)
+        if match is None:
+            continue
+        metric, labels, value = match.groups()
+        try:
+            value = int(value) if value.isdigit() else float(value)
+        except ValueError:
+            continue
+        labels = tuple((name, _unescape(label))
+                       for name, label in LABEL_PATTERN.findall(labels or ''))
+        samples.setdefault(metric, {})[labels] = value
+    return samples
+
+
+class FileLock:
+    # Exclusive lock on a companion file, so processes sharing a textfile update
+    # it in turn. Only advisory, and a no-op where neither fcntl nor msvcrt exist.
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')  # pylint: disable=consider-using-with
+        if os.name == 'nt':
+            import msvcrt  # pylint: disable=import-outside-toplevel,import-error
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ten seconds
+        else:
+            import fcntl  # pylint: disable=import-outside-toplevel
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == 'nt':
+            import msvcrt  # pylint: disable=import-outside-toplevel,import-error
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()  # closing also releases flock
+        self._file = None
+
+
+class Telemetry:
+    # One JSON line per finished ffmpeg run, plus running totals per codec and
+    # preset in a Prometheus textfile for node-exporter's textfile collector.
+    # Each update adds to the totals already in the textfile under a lock, so
+    # GUI, CLI and worker processes on a host can share one file and the
+    # counters only reset when the file is removed.
+    def __init__(self, jsonl_path=None, textfile_path=None):
+        self.jsonl_path = jsonl_path
+        self.textfile_path = textfile_path
+        self._lock = threading.Lock()
+
+    def record(self, job, state):
+        record = job_record(job, state)
+        with self._lock:
+            try:
+                self._append(record)
+                self._update(record)
+            except OSError:
+                pass  # Telemetry must never fail an encode
+        return record
+
+    def _append(self, record):
+        if not self.jsonl_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.jsonl_path)), exist_ok=True)
+        with open(self.jsonl_path, 'a', encoding='utf-8') as jsonl_file:
+            jsonl_file.write(json.dumps(record) + '\n')
+
+    def _update(self, record):
+        if not self.textfile_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.textfile_path)), exist_ok=True)
+        with FileLock(self.textfile_path + '.lock'):
+            samples = read_textfile(self.textfile_path)
+            labels = (('codec', record['codec'] or ''), ('preset', record['preset'] or ''))
+            jobs = samples.setdefault(JOBS_METRIC, {})
+            key = labels + (('state', record['state']),)
+            jobs[key] = jobs.get(key, 0) + 1
+            for metric, _, field in COUNTERS:
+                if record[field] is not None:
+                    totals = samples.setdefault(metric, {})
+                    totals[labels] = totals.get(labels, 0) + record[field]
+            if record['state'] == 'done':
+                for metric, _, field, scale in GAUGES:
+                    if record[field] is not None:
+                        samples.setdefault(metric, {})[labels] = record[field] * scale
+                    else:
+                        samples.get(metric, {}).pop(labels, None)
+            self._write_textfile(samples)
+
+    def _write_textfile(self, samples):
+        lines = []
+        for metric, description, kind in (
+                [(JOBS_METRIC, "Finished ffmpeg runs by outcome", 'counter')] +
+                [(metric, description, 'counter') for metric, description, _ in COUNTERS] +
+                [(metric, description, 'gauge') for metric, description, _, _ in GAUGES]):
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+            lines += [f"{metric}{_labels(dict(labels))} {_number(value)}"
+                      for labels, value in sorted(samples.get(metric, {}).items())]
+
+        # The collector may read at any time, so the file is replaced in one step.
+        # The temporary name is per process in case another ignores the lock.
+        temp_path = f"{self.textfile_path}.{socket.gethostname()}-{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as textfile:
+            textfile.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.textfile_path)
+
+
+def default_telemetry(jsonl_path=None, textfile_path=None):
+    # None when neither a JSONL file nor a textfile is configured
+    jsonl_path = jsonl_path or os.environ.get(TELEMETRY_ENV)
+    textfile_path = textfile_path or os.environ.get(METRICS_TEXTFILE_ENV)
+    if not jsonl_path and not textfile_path:
+        return None
+    return Telemetry(jsonl_path, textfile_path)
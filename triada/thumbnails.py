@@ -0,0 +1,142 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+import hashlib
+import json
+import math
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from triada.lazy import lazy_import
+from triada.probe import default_cache_dir, get_file_info, source_identity
+from triada.sequence import split_pattern
+
+subprocess = lazy_import('subprocess')
+
+THUMBNAIL_COUNT = 8
+THUMBNAIL_WIDTH = 160
+# Sources whose thumbnails are kept on disk; the least recently shown go first
+THUMBNAIL_CACHE_SIZE = 500
+THUMBNAIL_WORKERS = 4
+
+
+def thumbnail_cache_dir():
+    return os.path.join(default_cache_dir(), 'thumbnails')
+
+
+def thumbnail_key(file_path, file_info, count, width):
+    data = json.dumps([source_identity({'input': file_path}, file_info), count, width])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def sample_times(duration, count):
+    # The middle of each of count equal parts, so the first and last thumbnails
+    # are not black leader or the fade out
+    return [(index + 0.5) * duration / count for index in range(count)]
+
+
+def sample_frames(start_number, frame_count, count):
+    count = min(count, frame_count)
+    return [start_number + int((index + 0.5) * frame_count / count) for index in range(count)]
+
+
+def video_thumbnail_command(file_path, time, output_file, width, ffmpeg_bin='ffmpeg'):
+    # Input seeking lands on the keyframe at or before the time, and only keyframes
+    # are decoded, so each thumbnail costs one keyframe decode even on 4K HEVC
+    return [ffmpeg_bin, '-v', 'error', '-skip_frame', 'nokey', '-noaccurate_seek',
+            '-ss', f"{time:.3f}", '-i', file_path, '-map', '0:v:0', '-frames:v', '1',
+            '-vf', f"scale={width}:-2", '-q:v', '4', '-update', '1', '-y', output_file]
+
+
+def frame_thumbnail_command(frame_file, output_file, width, ffmpeg_bin='ffmpeg'):
+    return [ffmpeg_bin, '-v', 'error', '-i', frame_file, '-frames:v', '1',
+            '-vf', f"scale={width}:-2", '-q:v', '4', '-update', '1', '-y', output_file]
+
+
+def thumbnail_commands(file_path, file_info, count, width, work_dir):
+    # [(ffmpeg command, thumbnail file)] spread over the whole source
+    output_files = [os.path.join(work_dir, f"{index:02d}.jpg") for index in range(count)]
+    if '%' in file_path:
+        if not file_info['frame_count']:
+            return []
+        directory, prefix, digits, ext = split_pattern(file_path)
+        frames = sample_frames(file_info.get('start_number') or 0, file_info['frame_count'],
+                               count)
+        return [(frame_thumbnail_command(os.path.join(directory, f"{prefix}{frame:0{digits}d}{ext}"),
+                                         output_file, width), output_file)
+                for frame, output_file in zip(frames, output_files)]
+
+    duration = file_info.get('duration') or 0
+    if duration <= 0 or not file_info.get('video_codec'):
+        return []
+    return [(video_thumbnail_command(file_path, time, output_file, width), output_file)
+            for time, output_file in zip(sample_times(duration, count), output_files)]
+
+
+def _run_thumbnail(cmd, output_file):
+    # Written beside the cache entry and renamed, so a half-written image is never shown
+    temp_file = output_file + '.tmp.jpg'
+    cmd = cmd[:-1] + [temp_file]
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL, check=False)
+    except OSError:
+        return None
+    if result.returncode != 0 or not os.path.exists(temp_file):
+        return None
+    os.replace(temp_file, output_file)
+    return output_file
+
+
+def thumbnail_strip(file_path, file_info=None, count=THUMBNAIL_COUNT, width=THUMBNAIL_WIDTH,
+                    cache_dir=None):
+    # Paths of up to count thumbnails across the source, from the disk cache
+    # when this source was shown before
+    if file_info is None:
+        file_info = get_file_info(file_path)
+    cache_dir = cache_dir if cache_dir is not None else thumbnail_cache_dir()
+    work_dir = os.path.join(cache_dir, thumbnail_key(file_path, file_info, count, width))
+    commands = thumbnail_commands(file_path, file_info, count, width, work_dir)
+    if not commands:
+        return []
+
+    missing = [(cmd, output_file) for cmd, output_file in commands
+               if not os.path.exists(output_file)]
+    if missing:
+        os.makedirs(work_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as executor:
+            list(executor.map(lambda item: _run_thumbnail(*item), missing))
+        prune_thumbnail_cache(cache_dir)
+    else:
+        os.utime(work_dir)  # Marks the entry as recently used
+    return [output_file for _, output_file in commands if os.path.exists(output_file)]
+
+
+def prune_thumbnail_cache(cache_dir=None, max_entries=THUMBNAIL_CACHE_SIZE):
+    cache_dir = cache_dir if cache_dir is not None else thumbnail_cache_dir()
+    try:
+        with os.scandir(cache_dir) as entries:
+            entries = [(entry.stat().st_mtime, entry.path) for entry in entries
+                       if entry.is_dir()]
+    except OSError:
+        return
+    for _, path in sorted(entries, reverse=True)[max_entries:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def contact_sheet(thumbnails, output_file, columns=4, ffmpeg_bin='ffmpeg'):
+    # Tiles the thumbnails of one strip into a single image
+    if not thumbnails:
+        raise ValueError("No thumbnails to put on a contact sheet")
+    rows = math.ceil(len(thumbnails) / columns)
+    inputs = []
+    for thumbnail in thumbnails:
+        inputs += ['-i', thumbnail]
+    streams = ''.join(f"[{index}:v]" for index in range(len(thumbnails)))
+    graph = (f"{streams}concat=n={len(thumbnails)}:v=1,"
+             f"tile={columns}x{rows}:padding=4:margin=4")
+    subprocess.run([ffmpeg_bin, '-v', 'error'] + inputs +
+                   ['-filter_complex', graph, '-frames:v', '1', '-q:v', '3', '-update', '1',
+                    '-y', output_file], stdin=subprocess.DEVNULL, check=True)
+    return output_file
@@ -0,0 +1,257 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from triada.command import parse_input
+from triada.lazy import lazy_import
+from triada.sequence import index_sequence, split_pattern
+
+ctypes = lazy_import('ctypes')
+ctypes_util = lazy_import('ctypes.util')
+
+VIDEO_EXTENSIONS = ('.mov', '.mp4', '.m4v', '.mxf', '.mkv', '.avi', '.mts', '.webm')
+# Seconds a file or sequence has to stay unchanged before it is queued
+SETTLE_TIME = 5.0
+POLL_INTERVAL = 2.0
+# Seconds between sweeps that forget reported inputs which have since been removed
+PRUNE_INTERVAL = 300.0
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    # Directory watches through libc, so there is no extra dependency
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes_util.find_library('c'), use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}
+
+    def add(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Cannot watch '{directory}': {os.strerror(error)}")
+        self._directories[wd] = directory
+
+    def read(self, timeout):
+        # [(directory, name, mask)], with directory None when the queue overflowed
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, '', mask))
+            elif mask & IN_IGNORED:
+                self._directories.pop(wd, None)
+            elif wd in self._directories:
+                events.append((self._directories[wd], name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_inotify():
+    # None where inotify is missing (not Linux) or out of instances
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return Inotify()
+    except (OSError, AttributeError):
+        return None
+
+
+class WatchFolder:
+    def __init__(self, path, template=None, recursive=True):
+        self.path = os.path.abspath(path)
+        self.template = dict(template or {})  # job spec for every input found here
+        self.recursive = recursive
+
+
+def source_signature(source):
+    # What changes while a file or sequence is still being written, or None once
+    # it is gone. Sequences are judged by their frame count and last frame, so a
+    # long render is not stat'ed frame by frame.
+    try:
+        if '%' not in source:
+            stat = os.stat(source)
+            return (stat.st_size, stat.st_mtime_ns)
+        index = index_sequence(source)
+        if not index.count:
+            return None
+        directory, prefix, digits, ext = split_pattern(source)
+        stat = os.stat(os.path.join(directory, f"{prefix}{index.last:0{digits}d}{ext}"))
+        return (index.count, index.last, stat.st_size, stat.st_mtime_ns)
+    except (OSError, ValueError):
+        return None
+
+
+class FolderWatcher:
+    # Finds new videos and image sequences under the watched folders and reports
+    # each one once it has stopped changing for settle_time seconds.
+    # With inotify only the entries named in events are looked at; when polling,
+    # a directory is only listed again after its mtime changed.
+    def __init__(self, folders, settle_time=SETTLE_TIME, poll_interval=POLL_INTERVAL,
+                 use_inotify=True, ignore=None, log=print):
+        self.folders = list(folders)
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.ignore = ignore  # optional callable(path) -> True to leave a file alone
+        self.log = log
+        self.inotify = open_inotify() if use_inotify else None
+        self._directories = {}  # directory -> (mtime, watch folder)
+        self._pending = {}  # source -> [signature, unchanged since, watch folder]
+        self._ingested = {}  # source -> signature it was reported with, while it exists
+        self._pruned_at = time.monotonic()
+        for folder in self.folders:
+            self._scan(folder.path, folder)
+
+    @property
+    def mode(self):
+        return 'inotify' if self.inotify is not None else 'polling'
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def poll(self):
+        # Waits up to poll_interval for changes, then returns the inputs that settled
+        # as [(source, watch folder)]
+        if self.inotify is not None:
+            self._read_events()
+        else:
+            time.sleep(self.poll_interval)
+            self._rescan_changed()
+        if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+            self._prune_ingested()
+        return self._settled()
+
+    def _prune_ingested(self):
+        # A watch folder that is emptied as jobs finish would otherwise keep every
+        # input it ever had. A removed input that comes back is reported again.
+        for source in list(self._ingested):
+            if source_signature(source) is None:
+                del self._ingested[source]
+        self._pruned_at = time.monotonic()
+
+    def _read_events(self):
+        for directory, name, mask in self.inotify.read(self.poll_interval):
+            if directory is None:
+                # Events were lost, so every folder is listed again
+                self.log("Watch: inotify queue overflowed, rescanning")
+                self._directories.clear()
+                for folder in self.folders:
+                    self._scan(folder.path, folder)
+                continue
+            folder = self._directories.get(directory, (None, None))[1]
+            if folder is None:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_DELETE_SELF:
+                self._directories.pop(directory, None)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and folder.recursive:
+                    self._scan(path, folder)
+            elif name:
+                self._consider(path, folder)
+
+    def _rescan_changed(self):
+        for directory, (mtime, folder) in list(self._directories.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                del self._directories[directory]
+                continue
+            if current != mtime:
+                self._scan(directory, folder)
+
+    def _scan(self, directory, folder):
+        # Lists one directory and any subdirectories not seen before
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            if self.inotify is not None and directory not in self._directories:
+                self.inotify.add(directory)
+            with os.scandir(directory) as entries:
+                entries = list(entries)
+        except OSError as error:
+            if error.errno not in (errno.ENOENT, errno.ENOTDIR):
+                self.log(f"Watch: {error}")
+            return
+        self._directories[directory] = (mtime, folder)
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                # Chunked encodes keep their segments in <output>.segments
+                if (folder.recursive and entry.path not in self._directories
+                        and not entry.name.endswith('.segments')):
+                    self._scan(entry.path, folder)
+            else:
+                self._consider(entry.path, folder)
+
+    def _consider(self, path, folder):
+        if os.path.basename(path).startswith('.'):
+            return
+        source, _, is_sequence = parse_input(path)
+        if not is_sequence and os.path.splitext(path)[1].lower() not in VIDEO_EXTENSIONS:
+            return
+        if self.ignore is not None and self.ignore(source):
+            return
+        if source not in self._pending:
+            self._pending[source] = [None, time.monotonic(), folder]
+
+    def _settled(self):
+        now = time.monotonic()
+        settled = []
+        for source, entry in list(self._pending.items()):
+            signature = source_signature(source)
+            if signature is None:
+                del self._pending[source]
+            elif signature != entry[0]:
+                entry[0], entry[1] = signature, now
+            elif now - entry[1] >= self.settle_time:
+                del self._pending[source]
+                if self._ingested.get(source) != signature:
+                    self._ingested[source] = signature
+                    settled.append((source, entry[2]))
+        return settled
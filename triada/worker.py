@@ -0,0 +1,246 @@
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-function-docstring
+
+import hmac
+import json
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from triada import VERSION
+from triada.farm import DEFAULT_PORT, HEARTBEAT_INTERVAL, TOKEN_HEADER
+from triada.jobs import job_for_task
+from triada.log import JobLog, job_log_path
+from triada.scheduler import QUEUED, RUNNING, JobScheduler, cores_per_job
+
+# Finished jobs whose events are kept for dispatchers that reconnect
+FINISHED_JOBS_KEPT = 100
+# Log lines kept per job; a dispatcher reading from the start gets the last ones
+EVENT_LOG_CAPACITY = 10000
+
+
+class JobEvents:
+    # What a dispatcher streams for one job: its log lines, its latest progress
+    # and how it finished. Also stands in as the job's log for the scheduler.
+    def __init__(self, job_log=None):
+        self.job_log = job_log
+        self.lines = []
+        self.first = 0  # number of the first line kept
+        self.progress = None
+        self.progress_serial = 0
+        self.finished = None
+        self.condition = threading.Condition()
+
+    @property
+    def path(self):
+        return self.job_log.path if self.job_log is not None else None
+
+    def write(self, line):
+        if self.job_log is not None:
+            self.job_log.write(line)
+        with self.condition:
+            self.lines.append(line)
+            if len(self.lines) > EVENT_LOG_CAPACITY:
+                del self.lines[0]
+                self.first += 1
+            self.condition.notify_all()
+
+    def close(self):
+        if self.job_log is not None:
+            self.job_log.close()
+
+    def set_progress(self, tracker):
+        with self.condition:
+            self.progress = {'type': 'progress', 'frame': tracker.frame, 'fps': tracker.fps,
+                             'speed': tracker.speed, 'out_time': tracker.out_time,
+                             'bitrate': tracker.bitrate, 'total_size': tracker.total_size,
+                             'end': tracker.finished}
+            self.progress_serial += 1
+            self.condition.notify_all()
+
+    def set_finished(self, job):
+        with self.condition:
+            self.finished = {'type': 'finished', 'state': job.state,
+                             'returncode': job.returncode, 'cpu_seconds': job.cpu_seconds,
+                             'peak_rss_kb': job.peak_rss_kb}
+            self.condition.notify_all()
+
+    def stream(self, timeout=HEARTBEAT_INTERVAL):
+        # Events from the first line on, a heartbeat whenever nothing happened for
+        # timeout seconds, and the finished event last
+        sent = 0
+        progress_serial = 0
+        while True:
+            with self.condition:
+                if (sent == self.first + len(self.lines) and self.finished is None
+                        and progress_serial == self.progress_serial):
+                    self.condition.wait(timeout)
+                lines = self.lines[max(0, sent - self.first):]
+                sent = self.first + len(self.lines)
+                progress = self.progress if progress_serial != self.progress_serial else None
+                progress_serial = self.progress_serial
+                finished = self.finished
+            events = [{'type': 'log', 'line': line} for line in lines]
+            if progress is not None:
+                events.append(progress)
+            if finished is not None:
+                yield from events
+                yield finished
+                return
+            yield from events or [{'type': 'heartbeat'}]
+
+
+class WorkerAgent:
+    # Runs the jobs dispatchers send, on this machine's own scheduler: the core
+    # budget, thread counts, read-ahead, staging and pinning all follow this node
+    def __init__(self, max_jobs=0, token=None, log_dir=None, telemetry=None, log=print):
+        self.token = token
+        self.log_dir = log_dir
+        self.log = log
+        self.scheduler = JobScheduler(max_jobs=max_jobs, on_job_update=self._on_job_update,
+                                      on_job_finished=self._on_job_finished,
+                                      log=lambda line: None, telemetry=telemetry)
+        self.events = {}  # job id: JobEvents
+        self._finished = []  # ids of finished jobs, oldest first
+        self._lock = threading.Lock()
+
+    def submit(self, task):
+        job = job_for_task(task)
+        job.log = JobEvents(JobLog(job_log_path(self.log_dir, job)) if self.log_dir else None)
+        with self._lock:
+            self.events[job.job_id] = job.log
+        self.log(f"Queued {job.name} (job {job.job_id})")
+        self.scheduler.add(job)
+        self.scheduler.start()
+        return job.job_id
+
+    def stop(self, job_id):
+        if job_id not in self.events:
+            return False
+        self.scheduler.cancel(job_id)
+        return True
+
+    def status(self):
+        jobs = self.scheduler.pending()
+        try:
+            load = os.getloadavg()[0]
+        except (AttributeError, OSError):  # Not available on Windows
+            load = None
+        # Running and waiting jobs both count, so a dispatcher sends its next job
+        # to a worker that will start it
+        return {
+            'host': socket.gethostname(),
+            'version': VERSION,
+            'cores': self.scheduler.total_cores,
+            'busy_cores': sum(cores_per_job(job.codec, job.preset, self.scheduler.total_cores)
+                              for job in jobs),
+            'running': sum(1 for job in jobs if job.state == RUNNING),
+            'queued': sum(1 for job in jobs if job.state == QUEUED),
+            'load': load,
+        }
+
+    def _on_job_update(self, job):
+        if job.state == RUNNING and job.log is not None:
+            job.log.set_progress(job.tracker)
+
+    def _on_job_finished(self, job):
+        self.log(f"Encoding {job.state}: {job.output_file} (job {job.job_id})")
+        job.log.set_finished(job)
+        with self._lock:
+            self._finished.append(job.job_id)
+            while len(self._finished) > FINISHED_JOBS_KEPT:
+                self.events.pop(self._finished.pop(0), None)
+        self.scheduler.clear_finished()
+
+
+class AgentHandler(BaseHTTPRequestHandler):
+    # GET /status, POST /jobs with a task, GET /jobs/ID/events streaming one JSON
+    # event per line, DELETE /jobs/ID to stop a job
+    agent = None
+    server_version = f"triada-worker/{VERSION}"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _authorized(self):
+        if not self.agent.token:
+            return True
+        if hmac.compare_digest(self.headers.get(TOKEN_HEADER, '').encode('utf-8'),
+                               self.agent.token.encode('utf-8')):
+            return True
+        self._reply(403, {'error': "wrong or missing token"})
+        return False
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self, suffix=''):
+        parts = self.path.strip('/').split('/')
+        expected = 3 if suffix else 2
+        if len(parts) != expected or parts[0] != 'jobs' or not parts[1].isdigit() or \
+                (suffix and parts[2] != suffix):
+            return None
+        return int(parts[1])
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if not self._authorized():
+            return
+        if self.path == '/status':
+            self._reply(200, self.agent.status())
+            return
+        job_id = self._job_id('events')
+        events = self.agent.events.get(job_id)
+        if events is None:
+            self._reply(404, {'error': f"no job {self.path}"})
+            return
+        # No length: the stream ends when the connection closes after the job finishes
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        try:
+            for event in events.stream():
+                self.wfile.write(json.dumps(event).encode('utf-8') + b'\n')
+                self.wfile.flush()
+        except OSError:
+            pass  # The dispatcher went away; it can read the events again
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        if not self._authorized():
+            return
+        if self.path != '/jobs':
+            self._reply(404, {'error': f"no such endpoint {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            task = json.loads(self.rfile.read(length))
+            job_id = self.agent.submit(task)
+        except (ValueError, KeyError, TypeError) as error:
+            self._reply(400, {'error': f"invalid task: {error}"})
+            return
+        except OSError as error:
+            self._reply(500, {'error': str(error)})
+            return
+        self._reply(201, {'id': job_id})
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        if not self._authorized():
+            return
+        if not self.agent.stop(self._job_id()):
+            self._reply(404, {'error': f"no job {self.path}"})
+            return
+        self._reply(200, {})
+
+
+def serve(agent, bind='127.0.0.1', port=DEFAULT_PORT):
+    # A server answering on its own threads; call serve_forever() to run it
+    handler = type('BoundAgentHandler', (AgentHandler,), {'agent': agent})
+    server = ThreadingHTTPServer((bind, port), handler)
+    server.daemon_threads = True
+    return server